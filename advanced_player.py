@@ -1,69 +1,99 @@
+import startup  # first, so the startup clock covers the other imports
 import sys
-import os
-import numpy as np
+import argparse
 import threading
-import time
-import pyaudio
-import wave
-import librosa
+import numpy as np
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
                              QWidget, QPushButton, QFileDialog, QSlider, QLabel, 
-                             QFrame, QSplitter, QProgressBar)
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
-from PyQt5.QtGui import QPainter, QPen, QColor, QPixmap
-import queue
+                             QCheckBox)
+from PyQt5.QtCore import Qt, QTimer
+
+from audio_engine import EngineClient, EngineDeckStream, LocalEngine, block_size_for_latency
+from decks import MAX_DECKS, DeckManager, MemoryMeter
+from decoders import to_float32
+from effects import EQ_BANDS, ParametricEQ
+from scoring import MelodyLoader, ScoreWorker
+from loader import LoaderPool
+from memory import DEFAULT_BUDGET_MB, shared_budget
+from output import BACKENDS, CLOCKS, OutputSettings, open_output
+from recorder import FORMATS as RECORD_FORMATS, Recorder, default_path
+from remote import RemoteControl
+import tracing
+
+# Length of a crossfade in beats of the outgoing track, or seconds without a grid
+CROSSFADE_BEATS = 16
+CROSSFADE_SECONDS = 8.0
 
 class AudioStream:
-    """Class to handle individual audio stream playback"""
+    """Class to handle individual audio stream playback on an output backend (see output.py).
     
-    def __init__(self, audio_data, sample_rate, volume=1.0):
+    The output is opened once and closed by stop(); a stopped stream is done with.
+    """
+    
+    def __init__(self, audio_data, sample_rate, volume=1.0, output=None, block_size=1024):
         self.audio_data = audio_data
         self.sample_rate = sample_rate
         self.volume = volume
         self.playing = False
         self.paused = False
         self.current_position = 0
-        self.audio_queue = queue.Queue()
-        self.p = pyaudio.PyAudio()
+        # Guards current_position between seek() and the end of a callback
+        self._position_lock = threading.Lock()
+        self.output = open_output(output, sample_rate, block_size,
+                                  tracing.traced(self._callback, 'AudioStream.callback', 'audio'))
+        # Reused output block; int16 decks are converted into it per callback
+        self._block = np.zeros(block_size, dtype=np.float32)
+        self.eq = ParametricEQ(sample_rate)
         
     def start_playback(self):
+        """Play from the start, reusing the output while it is still running"""
         self.playing = True
         self.paused = False
-        self.current_position = 0
-        
-        def callback(in_data, frame_count, time_info, status):
-            if not self.playing or self.paused:
-                return (b'\x00' * frame_count * 4, pyaudio.paComplete)
-            
-            if self.current_position >= len(self.audio_data):
-                self.playing = False
-                return (b'\x00' * frame_count * 4, pyaudio.paComplete)
-            
-            # Get audio data for this frame
-            end_pos = min(self.current_position + frame_count, len(self.audio_data))
-            frame_data = self.audio_data[self.current_position:end_pos]
-            
-            # Apply volume
-            frame_data = frame_data * self.volume
-            
-            # Convert to bytes
-            if len(frame_data) < frame_count:
-                # Pad with silence if needed
-                frame_data = np.pad(frame_data, (0, frame_count - len(frame_data)))
-            
-            self.current_position += frame_count
-            
-            return (frame_data.astype(np.float32).tobytes(), pyaudio.paContinue)
-        
-        self.stream = self.p.open(
-            format=pyaudio.paFloat32,
-            channels=1,
-            rate=self.sample_rate,
-            output=True,
-            stream_callback=callback,
-            frames_per_buffer=1024
-        )
-        self.stream.start_stream()
+        with self._position_lock:
+            self.current_position = 0
+        if not self.output.running:
+            # Not started yet, or it finished at the end of the track
+            self.output.stop()
+            self.output.start()
+    
+    def _callback(self, in_block, frame_count, time_info, xrun):
+        if not self.playing:
+            return None
+        
+        # Local copies: seek() and release() change these from the GUI thread
+        data = self.audio_data
+        position = self.current_position
+        if position >= len(data):
+            self.playing = False
+            return None
+        
+        if len(self._block) < frame_count:
+            self._block = np.zeros(frame_count, dtype=np.float32)
+        block = self._block[:frame_count]
+        
+        # Paused streams keep running on silence so resume() picks up at once
+        if self.paused:
+            block[:] = 0.0
+            return block
+        
+        # Get audio data for this frame
+        end_pos = min(position + frame_count, len(data))
+        frame_data = data[position:end_pos]
+        n = len(frame_data)
+        
+        # Convert to float and apply volume in one pass
+        to_float32(frame_data, block[:n], self.volume)
+        self.eq.process(block[:n])
+        
+        # Pad with silence if needed
+        block[n:] = 0.0
+        
+        # Advance only from the position read above; a seek made meanwhile wins
+        with self._position_lock:
+            if self.current_position == position:
+                self.current_position = position + frame_count
+        
+        return block
     
     def pause(self):
         self.paused = True
@@ -72,124 +102,71 @@ class AudioStream:
         self.paused = False
     
     def stop(self):
+        """Stop and close the output (terminating its PortAudio instance)"""
         self.playing = False
-        if hasattr(self, 'stream'):
-            self.stream.stop_stream()
-            self.stream.close()
+        self.output.close()
+    
+    def release(self):
+        """Stop and let go of the sample buffer"""
+        self.stop()
+        self.audio_data = np.zeros(0, dtype=self.audio_data.dtype)
     
     def set_volume(self, volume):
         self.volume = volume
     
+    def set_eq(self, band, gain_db, frequency=None, q=None):
+        self.eq.set_band(band, gain_db, frequency, q)
+    
+    def seek(self, seconds):
+        with self._position_lock:
+            self.current_position = min(max(0, int(seconds * self.sample_rate)), len(self.audio_data))
+    
     def get_position(self):
         return self.current_position / self.sample_rate
     
     def get_duration(self):
         return len(self.audio_data) / self.sample_rate
 
-class AudioProcessor(QThread):
-    """Thread for processing audio files and generating waveforms"""
-    waveform_ready = pyqtSignal(object, object, str)  # y, sr, filename
-    
-    def __init__(self, file_path):
-        super().__init__()
-        self.file_path = file_path
-        
-    def run(self):
-        try:
-            # Load audio file
-            y, sr = librosa.load(self.file_path, sr=None)
-            self.waveform_ready.emit(y, sr, self.file_path)
-        except Exception as e:
-            print(f"Error loading audio: {e}")
-
-class WaveformWidget(QWidget):
-    """Custom widget for displaying audio waveforms"""
-    
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.audio_data = None
-        self.sample_rate = None
-        self.current_position = 0
-        self.duration = 0
-        self.setMinimumHeight(150)
-        self.setStyleSheet("background-color: #2b2b2b; border: 1px solid #555;")
-        
-    def set_audio_data(self, audio_data, sample_rate):
-        self.audio_data = audio_data
-        self.sample_rate = sample_rate
-        if audio_data is not None:
-            self.duration = len(audio_data) / sample_rate
-        self.update()
-        
-    def set_position(self, position):
-        self.current_position = position
-        self.update()
-        
-    def paintEvent(self, event):
-        if self.audio_data is None:
-            return
-            
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        
-        # Set up colors
-        background_color = QColor(43, 43, 43)  # Dark gray
-        waveform_color = QColor(0, 255, 127)   # Green
-        position_color = QColor(255, 255, 0)   # Yellow
-        
-        # Fill background
-        painter.fillRect(self.rect(), background_color)
-        
-        # Calculate dimensions
-        width = self.width()
-        height = self.height()
-        
-        # Downsample for display
-        downsample_factor = max(1, len(self.audio_data) // width)
-        display_data = self.audio_data[::downsample_factor]
-        
-        # Normalize data
-        if len(display_data) > 0:
-            max_val = np.max(np.abs(display_data))
-            if max_val > 0:
-                display_data = display_data / max_val
-        
-        # Draw waveform
-        painter.setPen(QPen(waveform_color, 1))
-        
-        for i in range(min(len(display_data), width)):
-            x = i
-            y_center = height // 2
-            amplitude = int(display_data[i] * (height // 2 - 10))
-            painter.drawLine(x, y_center - amplitude, x, y_center + amplitude)
-        
-        # Draw position indicator
-        if self.duration > 0:
-            position_x = int((self.current_position / self.duration) * width)
-            painter.setPen(QPen(position_color, 2))
-            painter.drawLine(position_x, 0, position_x, height)
-
 class AdvancedMP3Player(QMainWindow):
-    def __init__(self):
+    def __init__(self, engine=None, compact=False, mic=False, decks=2,
+                 record_dir='recordings', record_format='wav', record_stems=False,
+                 output=None, latency_ms=None):
         super().__init__()
         self.setWindowTitle("Advanced Dual MP3 Player with Waveform")
         self.setGeometry(100, 100, 1200, 800)
         
-        # Audio data storage
-        self.track1_data = None
-        self.track1_sr = None
-        self.track1_path = None
-        self.track2_data = None
-        self.track2_sr = None
-        self.track2_path = None
+        # Optional mixer engine, in or out of process (see audio_engine.py)
+        self.engine = engine
+        
+        # Output backend and latency for per-deck streams without an engine
+        self.output = output
+        self.latency_ms = latency_ms
+        self.mic_enabled = mic and engine is not None
+        
+        # Singing score against deck 1 (see scoring.py)
+        self.guide_path = None
+        self.melody_loader = None
+        self.score_worker = None
         
-        # Audio streams
-        self.track1_stream = None
-        self.track2_stream = None
+        # Compact mode keeps decoded PCM as int16, half the memory of float32
+        self.sample_dtype = 'int16' if compact else 'float32'
         
-        # Audio processing threads
-        self.track1_processor = None
-        self.track2_processor = None
+        # Shared decode pool; a new load for a deck cancels the old one
+        self.loader = LoaderPool()
+        self.loader.track_ready.connect(self.on_track_loaded)
+        self.loader.failed.connect(self.on_track_failed)
+        
+        # Per-deck state and widgets (see decks.py)
+        self.decks = DeckManager(self, decks)
+        
+        # Optional phone remote and song requests (see remote.py)
+        self.remote = None
+        
+        # Performance recording through the engine (see recorder.py)
+        self.recorder = None
+        self.record_dir = record_dir
+        self.record_format = record_format
+        self.record_stems = record_stems
         
         # Setup UI
         self.setup_ui()
@@ -206,120 +183,8 @@ class AdvancedMP3Player(QMainWindow):
         # Main layout
         main_layout = QVBoxLayout(central_widget)
         
-        # Create splitter for top and bottom sections
-        splitter = QSplitter(Qt.Vertical)
-        main_layout.addWidget(splitter)
-        
-        # Top section - Track 1
-        top_widget = QWidget()
-        top_layout = QVBoxLayout(top_widget)
-        
-        # Track 1 controls
-        track1_controls = QHBoxLayout()
-        
-        self.track1_load_btn = QPushButton("Load Track 1")
-        self.track1_load_btn.clicked.connect(lambda: self.load_track(1))
-        track1_controls.addWidget(self.track1_load_btn)
-        
-        self.track1_play_btn = QPushButton("Play")
-        self.track1_play_btn.clicked.connect(lambda: self.play_track(1))
-        self.track1_play_btn.setEnabled(False)
-        track1_controls.addWidget(self.track1_play_btn)
-        
-        self.track1_pause_btn = QPushButton("Pause")
-        self.track1_pause_btn.clicked.connect(lambda: self.pause_track(1))
-        self.track1_pause_btn.setEnabled(False)
-        track1_controls.addWidget(self.track1_pause_btn)
-        
-        self.track1_stop_btn = QPushButton("Stop")
-        self.track1_stop_btn.clicked.connect(lambda: self.stop_track(1))
-        self.track1_stop_btn.setEnabled(False)
-        track1_controls.addWidget(self.track1_stop_btn)
-        
-        track1_controls.addStretch()
-        
-        # Track 1 volume control
-        track1_controls.addWidget(QLabel("Volume:"))
-        self.track1_volume_slider = QSlider(Qt.Horizontal)
-        self.track1_volume_slider.setRange(0, 100)
-        self.track1_volume_slider.setValue(70)
-        self.track1_volume_slider.valueChanged.connect(lambda: self.set_volume(1))
-        track1_controls.addWidget(self.track1_volume_slider)
-        
-        top_layout.addLayout(track1_controls)
-        
-        # Track 1 waveform
-        self.track1_waveform = WaveformWidget()
-        top_layout.addWidget(self.track1_waveform)
-        
-        # Track 1 progress
-        track1_progress_layout = QHBoxLayout()
-        self.track1_progress_bar = QProgressBar()
-        self.track1_progress_bar.setRange(0, 100)
-        track1_progress_layout.addWidget(self.track1_progress_bar)
-        
-        self.track1_time_label = QLabel("00:00 / 00:00")
-        track1_progress_layout.addWidget(self.track1_time_label)
-        
-        top_layout.addLayout(track1_progress_layout)
-        
-        # Bottom section - Track 2
-        bottom_widget = QWidget()
-        bottom_layout = QVBoxLayout(bottom_widget)
-        
-        # Track 2 controls
-        track2_controls = QHBoxLayout()
-        
-        self.track2_load_btn = QPushButton("Load Track 2")
-        self.track2_load_btn.clicked.connect(lambda: self.load_track(2))
-        track2_controls.addWidget(self.track2_load_btn)
-        
-        self.track2_play_btn = QPushButton("Play")
-        self.track2_play_btn.clicked.connect(lambda: self.play_track(2))
-        self.track2_play_btn.setEnabled(False)
-        track2_controls.addWidget(self.track2_play_btn)
-        
-        self.track2_pause_btn = QPushButton("Pause")
-        self.track2_pause_btn.clicked.connect(lambda: self.pause_track(2))
-        self.track2_pause_btn.setEnabled(False)
-        track2_controls.addWidget(self.track2_pause_btn)
-        
-        self.track2_stop_btn = QPushButton("Stop")
-        self.track2_stop_btn.clicked.connect(lambda: self.stop_track(2))
-        self.track2_stop_btn.setEnabled(False)
-        track2_controls.addWidget(self.track2_stop_btn)
-        
-        track2_controls.addStretch()
-        
-        # Track 2 volume control
-        track2_controls.addWidget(QLabel("Volume:"))
-        self.track2_volume_slider = QSlider(Qt.Horizontal)
-        self.track2_volume_slider.setRange(0, 100)
-        self.track2_volume_slider.setValue(70)
-        self.track2_volume_slider.valueChanged.connect(lambda: self.set_volume(2))
-        track2_controls.addWidget(self.track2_volume_slider)
-        
-        bottom_layout.addLayout(track2_controls)
-        
-        # Track 2 waveform
-        self.track2_waveform = WaveformWidget()
-        bottom_layout.addWidget(self.track2_waveform)
-        
-        # Track 2 progress
-        track2_progress_layout = QHBoxLayout()
-        self.track2_progress_bar = QProgressBar()
-        self.track2_progress_bar.setRange(0, 100)
-        track2_progress_layout.addWidget(self.track2_progress_bar)
-        
-        self.track2_time_label = QLabel("00:00 / 00:00")
-        track2_progress_layout.addWidget(self.track2_time_label)
-        
-        bottom_layout.addLayout(track2_progress_layout)
-        
-        # Add widgets to splitter
-        splitter.addWidget(top_widget)
-        splitter.addWidget(bottom_widget)
-        splitter.setSizes([400, 400])  # Equal split
+        # One panel per deck, stacked in a splitter
+        main_layout.addWidget(self.decks.build())
         
         # Global controls
         global_controls = QHBoxLayout()
@@ -332,8 +197,51 @@ class AdvancedMP3Player(QMainWindow):
         self.stop_all_btn.clicked.connect(self.stop_all)
         global_controls.addWidget(self.stop_all_btn)
         
+        # Crossfades are scheduled inside the mixer, so they need the engine
+        self.crossfade_btn = QPushButton("Crossfade")
+        self.crossfade_btn.clicked.connect(self.crossfade)
+        self.crossfade_btn.setEnabled(self.engine is not None)
+        global_controls.addWidget(self.crossfade_btn)
+        
+        # Recording taps the mixer's output, so it needs the engine too
+        self.record_btn = QPushButton("Record")
+        self.record_btn.setCheckable(True)
+        self.record_btn.toggled.connect(self.toggle_recording)
+        self.record_btn.setEnabled(self.engine is not None)
+        global_controls.addWidget(self.record_btn)
+        self.record_label = QLabel("")
+        global_controls.addWidget(self.record_label)
+        
         global_controls.addStretch()
         
+        # Live microphone controls
+        if self.mic_enabled:
+            global_controls.addWidget(QLabel("Mic:"))
+            self.mic_volume_slider = QSlider(Qt.Horizontal)
+            self.mic_volume_slider.setRange(0, 100)
+            self.mic_volume_slider.setValue(100)
+            self.mic_volume_slider.valueChanged.connect(self.set_mic_volume)
+            global_controls.addWidget(self.mic_volume_slider)
+            
+            for name in ('echo', 'reverb'):
+                checkbox = QCheckBox(name.capitalize())
+                checkbox.toggled.connect(lambda checked, name=name: self.engine.set_mic_effect(name, checked))
+                global_controls.addWidget(checkbox)
+            
+            self.mic_latency_label = QLabel("Latency: -- ms")
+            global_controls.addWidget(self.mic_latency_label)
+            
+            self.guide_btn = QPushButton("Guide...")
+            self.guide_btn.clicked.connect(self.load_guide)
+            global_controls.addWidget(self.guide_btn)
+            
+            self.score_label = QLabel("Score: --")
+            global_controls.addWidget(self.score_label)
+        
+        # Decoded tracks and caches against the --memory-budget
+        self.memory_meter = MemoryMeter()
+        global_controls.addWidget(self.memory_meter)
+        
         main_layout.addLayout(global_controls)
         
         # Set styles
@@ -388,132 +296,309 @@ class AdvancedMP3Player(QMainWindow):
             }
         """)
         
-    def load_track(self, track_num):
+    def load_track(self, deck):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, f"Load Track {track_num}", "", "Audio Files (*.mp3 *.wav *.flac *.ogg)"
+            self, f"Load Track {deck + 1}", "", "Audio Files (*.mp3 *.wav *.flac *.ogg)"
         )
         
         if file_path:
-            if track_num == 1:
-                self.track1_path = file_path
-                self.track1_processor = AudioProcessor(file_path)
-                self.track1_processor.waveform_ready.connect(
-                    lambda y, sr, path: self.on_track_loaded(1, y, sr, path)
-                )
-                self.track1_processor.start()
-            else:
-                self.track2_path = file_path
-                self.track2_processor = AudioProcessor(file_path)
-                self.track2_processor.waveform_ready.connect(
-                    lambda y, sr, path: self.on_track_loaded(2, y, sr, path)
-                )
-                self.track2_processor.start()
-    
-    def on_track_loaded(self, track_num, audio_data, sample_rate, file_path):
-        if track_num == 1:
-            self.track1_data = audio_data
-            self.track1_sr = sample_rate
-            self.track1_waveform.set_audio_data(audio_data, sample_rate)
-            self.track1_play_btn.setEnabled(True)
-            self.track1_pause_btn.setEnabled(True)
-            self.track1_stop_btn.setEnabled(True)
+            self.decks[deck].path = file_path
+            self.loader.load(deck, file_path, self.sample_dtype)
+    
+    def on_track_loaded(self, deck, audio_data, sample_rate, file_path, peaks=None):
+        state = self.decks[deck]
+        if state.stream is not None:
+            # The deck was cued with a new file; drop the stream of the old one
+            state.stream.release()
+            state.stream = None
+        self.decks.set_track(deck, audio_data, sample_rate, file_path, peaks)
+        if deck == 0 and self.mic_enabled and self.guide_path is None:
+            self.load_melody(file_path, audio_data, sample_rate)
+    
+    def create_stream(self, deck, audio_data, sample_rate, volume):
+        if self.engine is not None:
+            stream = EngineDeckStream(self.engine, deck, audio_data, sample_rate, volume)
         else:
-            self.track2_data = audio_data
-            self.track2_sr = sample_rate
-            self.track2_waveform.set_audio_data(audio_data, sample_rate)
-            self.track2_play_btn.setEnabled(True)
-            self.track2_pause_btn.setEnabled(True)
-            self.track2_stop_btn.setEnabled(True)
-    
-    def play_track(self, track_num):
-        if track_num == 1 and self.track1_data is not None:
-            if self.track1_stream is None:
-                volume = self.track1_volume_slider.value() / 100.0
-                self.track1_stream = AudioStream(self.track1_data, self.track1_sr, volume)
-            self.track1_stream.start_playback()
-        elif track_num == 2 and self.track2_data is not None:
-            if self.track2_stream is None:
-                volume = self.track2_volume_slider.value() / 100.0
-                self.track2_stream = AudioStream(self.track2_data, self.track2_sr, volume)
-            self.track2_stream.start_playback()
-    
-    def pause_track(self, track_num):
-        if track_num == 1 and self.track1_stream:
-            self.track1_stream.pause()
-        elif track_num == 2 and self.track2_stream:
-            self.track2_stream.pause()
-    
-    def stop_track(self, track_num):
-        if track_num == 1 and self.track1_stream:
-            self.track1_stream.stop()
-            self.track1_stream = None
-        elif track_num == 2 and self.track2_stream:
-            self.track2_stream.stop()
-            self.track2_stream = None
+            block_size = 1024 if self.latency_ms is None else block_size_for_latency(sample_rate, self.latency_ms)
+            stream = AudioStream(audio_data, sample_rate, volume, self.output, block_size)
+        # Every new stream starts with the deck's EQ panel, whichever path created it
+        for band in range(len(EQ_BANDS)):
+            stream.set_eq(band, *self.decks.eq(deck, band))
+        return stream
+    
+    def on_track_failed(self, deck, file_path, message):
+        self.decks.panels[deck].progress_bar.setFormat("%p%")
+        self.decks.panels[deck].progress_bar.setValue(0)
+    
+    def play_track(self, deck):
+        state = self.decks[deck]
+        if state.data is None:
+            return
+        if state.stream is None:
+            state.stream = self.create_stream(deck, state.data, state.sample_rate, self.decks.volume(deck))
+        state.stream.start_playback()
+    
+    def pause_track(self, deck):
+        state = self.decks[deck]
+        if state.stream:
+            state.stream.pause()
+    
+    def stop_track(self, deck):
+        state = self.decks[deck]
+        if state.stream:
+            state.stream.stop()
+            state.stream = None
+    
+    def seek_track(self, deck, seconds):
+        """Jump to the beat nearest ``seconds`` on a deck that is playing or paused"""
+        state = self.decks[deck]
+        if state.stream is None:
+            return
+        seconds = self.decks.snap(deck, seconds)
+        state.stream.seek(seconds)
+        self.decks.panels[deck].show_position(seconds, state.duration)
+    
+    def crossfade(self):
+        """Fade from the playing deck into the next loaded one, starting on a downbeat"""
+        statuses = self.engine.deck_statuses()
+        playing = [state for state in self.decks if state.stream is not None and statuses[state.index]['playing']]
+        if not playing:
+            return
+        source = playing[0]
+        targets = [state for state in self.decks.loaded()
+                   if state.index > source.index and not statuses[state.index]['playing']]
+        targets += [state for state in self.decks.loaded()
+                    if state.index < source.index and not statuses[state.index]['playing']]
+        if not targets:
+            return
+        target = targets[0]
+        if target.stream is None:
+            target.stream = self.create_stream(target.index, target.data, target.sample_rate,
+                                               self.decks.volume(target.index))
+            # Bring the incoming track in on its first bar
+            if target.beats is not None and len(target.beats.downbeats):
+                target.stream.seek(target.beats.downbeats[0])
+        
+        seconds, start = CROSSFADE_SECONDS, None
+        grid = source.beats
+        if grid is not None and grid.bpm > 0:
+            seconds = CROSSFADE_BEATS * grid.beat_length
+            # Leave the command time to reach the engine before the downbeat
+            start = grid.next_downbeat(statuses[source.index]['position'] + 0.1)
+        self.engine.crossfade(source.index, target.index, seconds, start)
+    
+    def eject_track(self, deck):
+        """Unload a deck and release its sample and waveform buffers"""
+        self.loader.cancel(deck)
+        state = self.decks[deck]
+        if state.stream is not None:
+            state.stream.release()
+        if self.engine is not None:
+            self.engine.unload(deck)
+        self.decks.release(deck)
+    
+    def release_audio(self, deck):
+        """Drop the engine's copy of an idle deck the memory budget evicted"""
+        if self.engine is not None:
+            self.engine.unload(deck)
     
     def play_all(self):
-        if self.track1_data is not None:
-            self.play_track(1)
-        if self.track2_data is not None:
-            self.play_track(2)
+        for state in self.decks.loaded():
+            self.play_track(state.index)
     
     def stop_all(self):
-        self.stop_track(1)
-        self.stop_track(2)
+        for state in self.decks:
+            self.stop_track(state.index)
     
-    def set_volume(self, track_num):
-        volume = getattr(self, f'track{track_num}_volume_slider').value() / 100.0
-        if track_num == 1 and self.track1_stream:
-            self.track1_stream.set_volume(volume)
-        elif track_num == 2 and self.track2_stream:
-            self.track2_stream.set_volume(volume)
+    def set_volume(self, deck):
+        state = self.decks[deck]
+        if state.stream:
+            state.stream.set_volume(self.decks.volume(deck))
     
-    def update_position(self):
-        # Update track 1 position
-        if self.track1_stream and self.track1_stream.playing:
-            current_time = self.track1_stream.get_position()
-            duration = self.track1_stream.get_duration()
-            
-            # Update waveform position
-            self.track1_waveform.set_position(current_time)
-            
-            # Update progress bar
-            progress = int((current_time / duration) * 100) if duration > 0 else 0
-            self.track1_progress_bar.setValue(progress)
-            
-            # Update time label
-            current_str = self.format_time(current_time)
-            duration_str = self.format_time(duration)
-            self.track1_time_label.setText(f"{current_str} / {duration_str}")
-        
-        # Update track 2 position
-        if self.track2_stream and self.track2_stream.playing:
-            current_time = self.track2_stream.get_position()
-            duration = self.track2_stream.get_duration()
-            
-            # Update waveform position
-            self.track2_waveform.set_position(current_time)
-            
-            # Update progress bar
-            progress = int((current_time / duration) * 100) if duration > 0 else 0
-            self.track2_progress_bar.setValue(progress)
-            
-            # Update time label
-            current_str = self.format_time(current_time)
-            duration_str = self.format_time(duration)
-            self.track2_time_label.setText(f"{current_str} / {duration_str}")
+    def set_eq(self, deck, band):
+        state = self.decks[deck]
+        if state.stream:
+            state.stream.set_eq(band, *self.decks.eq(deck, band))
+    
+    def toggle_recording(self, checked):
+        """Start or finish recording the mix (and per-deck stems with --record-stems)"""
+        if checked:
+            stems = len(self.decks) if self.record_stems else 0
+            self.recorder = Recorder(self.engine, default_path(self.record_dir, self.record_format), stems)
+            try:
+                self.recorder.start()
+            except Exception as e:
+                print(f"Cannot record: {e}")
+                self.recorder = None
+                self.record_btn.setChecked(False)
+        elif self.recorder is not None:
+            self.recorder.stop()
+            print(f"Recorded {self.recorder.seconds:.1f} s to {self.recorder.path} "
+                  f"({self.recorder.overruns} overruns)")
+            self.recorder = None
+            self.record_label.setText("")
     
-    def format_time(self, seconds):
-        minutes = int(seconds // 60)
-        seconds = int(seconds % 60)
-        return f"{minutes:02d}:{seconds:02d}"
+    def set_mic_volume(self):
+        self.engine.set_mic_volume(self.mic_volume_slider.value() / 100.0)
+    
+    def load_guide(self):
+        """Score against a MIDI melody or a guide vocal instead of the deck 1 track"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Load Guide Melody", "", "Guide Files (*.mid *.midi *.mp3 *.wav *.flac *.ogg)"
+        )
+        if file_path:
+            self.guide_path = file_path
+            self.load_melody(file_path)
+    
+    def load_melody(self, path, audio_data=None, sample_rate=None):
+        self.score_label.setText("Score: analysing...")
+        self.melody_loader = MelodyLoader(path, audio_data, sample_rate)
+        self.melody_loader.melody_ready.connect(self.on_melody_ready)
+        self.melody_loader.start()
+    
+    def on_melody_ready(self, melody, path):
+        if path != (self.guide_path or self.decks[0].path):
+            return  # superseded by a newer track or guide
+        if self.score_worker is not None:
+            self.score_worker.stop()
+        self.score_worker = ScoreWorker(self.engine.mic_tap, self.engine.sample_rate, melody)
+        self.score_worker.score_updated.connect(self.on_score_updated)
+        self.score_worker.start()
+        self.score_label.setText("Score: 0")
+    
+    def on_score_updated(self, phrase_scores, total):
+        text = f"Score: {total:.0f}"
+        stream = self.decks[0].stream
+        position = stream.get_position() if stream else 0.0
+        phrase = self.score_worker.scorer.current_phrase(position)
+        if phrase is not None and not np.isnan(phrase_scores[phrase]):
+            text += f" (phrase {phrase + 1}: {phrase_scores[phrase]:.0f})"
+        self.score_label.setText(text)
+    
+    def update_position(self):
+        if self.mic_enabled:
+            latency = self.engine.mic_status()['latency_ms']
+            self.mic_latency_label.setText(f"Latency: {latency:.0f} ms")
+        
+        if self.recorder is not None:
+            seconds = self.recorder.seconds
+            self.record_label.setText(f"REC {int(seconds // 60):02d}:{int(seconds % 60):02d}, "
+                                      f"{self.recorder.overruns} overruns")
+        
+        # One pass over every deck; the engine's status is read once per tick
+        statuses = self.engine.deck_statuses() if self.engine is not None else None
+        positions = {}
+        for state in self.decks:
+            stream = state.stream
+            if stream is None:
+                continue
+            if statuses is not None:
+                status = statuses[state.index]
+                if status['playing']:
+                    positions[state.index] = (status['position'], status['duration'])
+            elif stream.playing:
+                positions[state.index] = (stream.get_position(), stream.get_duration())
+        self.decks.update(positions)
+        if self.remote is not None:
+            self.remote.publish(positions)
     
     def closeEvent(self, event):
+        self.timer.stop()
+        if self.remote is not None:
+            self.remote.shutdown()
+        self.loader.shutdown()
+        self.decks.shutdown()
         self.stop_all()
+        if self.score_worker is not None:
+            self.score_worker.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.engine is not None:
+            self.engine.shutdown()
         event.accept()
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Advanced Dual MP3 Player")
+    parser.add_argument('--engine-process', action='store_true',
+                        help="run the audio mixer in a separate process")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="print import and first-paint timings")
+    parser.add_argument('--compact', action='store_true',
+                        help="keep decoded tracks as int16 to halve memory use")
+    parser.add_argument('--mic', action='store_true',
+                        help="mix the live microphone into the output (full duplex)")
+    parser.add_argument('--mic-wav', metavar='PATH',
+                        help="use a WAV file as a stand-in microphone input")
+    parser.add_argument('--latency-ms', type=float,
+                        help="latency target; sets the output block size "
+                             "(default 40 ms for the mixer engine, 1024-frame blocks per deck without it)")
+    parser.add_argument('--output', choices=BACKENDS, default='pyaudio',
+                        help="audio output: the sound card through PyAudio or pygame, or no sound card")
+    parser.add_argument('--output-clock', choices=CLOCKS, default='realtime',
+                        help="with --output null, pull blocks in real time or as fast as possible")
+    parser.add_argument('--output-file', metavar='PATH',
+                        help="write the output to a WAV/FLAC file instead of the sound card (implies --output null)")
+    parser.add_argument('--decks', type=int, default=2, choices=range(1, MAX_DECKS + 1),
+                        metavar=f"1-{MAX_DECKS}", help="number of decks to show")
+    parser.add_argument('--record-dir', default='recordings', metavar='DIR',
+                        help="where Record saves performances")
+    parser.add_argument('--record-format', choices=RECORD_FORMATS, default='wav',
+                        help="file format for recordings")
+    parser.add_argument('--record-stems', action='store_true',
+                        help="also record each deck and the mic to separate files")
+    parser.add_argument('--memory-budget', type=float, default=DEFAULT_BUDGET_MB, metavar='MB',
+                        help="memory for decoded tracks and caches before idle decks are evicted to disk")
+    parser.add_argument('--trace', nargs='?', const='trace.json', metavar='PATH',
+                        help="record a Chrome trace of paint, decode and audio work to PATH")
+    parser.add_argument('--remote', type=int, metavar='PORT',
+                        help="serve the phone remote and song requests on this port")
+    parser.add_argument('--library', action='append', default=[], metavar='DIR',
+                        help="music directory for remote song requests (repeatable)")
+    parser.add_argument('--remote-token', metavar='TOKEN',
+                        help="token for remote transport control (default: a random one, printed at startup)")
+    return parser.parse_known_args(argv)[0]
+
+def output_settings(args):
+    backend = 'null' if args.output_file else args.output
+    return OutputSettings(backend, args.output_clock, args.output_file)
+
+def create_engine(args):
+    mic = args.mic or args.mic_wav is not None
+    latency_ms = args.latency_ms if args.latency_ms is not None else 40.0
+    output = output_settings(args)
+    if args.engine_process:
+        trace = f"{args.trace}.engine.part" if args.trace else None
+        return EngineClient(latency_ms=latency_ms, mic=mic, mic_wav=args.mic_wav, trace=trace, output=output)
+    if mic or args.output_file or args.output == 'pygame':
+        # The mic has to be mixed with the decks, a file holds one mix and
+        # SDL may only open its device once, so they share one stream
+        return LocalEngine(latency_ms=latency_ms, mic=mic, mic_wav=args.mic_wav, output=output)
+    return None
+
 if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    shared_budget().set_limit_mb(args.memory_budget)
+    if args.trace:
+        tracing.enable(args.trace)
+        tracing.instrument_hot_paths()
+        tracing.instrument(AdvancedMP3Player, 'update_position', 'gui')
+    profiler = startup.StartupProfiler(args.startup_profile)
+    profiler.mark("imports done")
+    profiler.report_imports()
+    engine = create_engine(args)
     app = QApplication(sys.argv)
-    player = AdvancedMP3Player()
+    profiler.mark("QApplication created")
+    player = AdvancedMP3Player(engine, compact=args.compact,
+                               mic=args.mic or args.mic_wav is not None, decks=args.decks,
+                               record_dir=args.record_dir, record_format=args.record_format,
+                               record_stems=args.record_stems, output=output_settings(args),
+                               latency_ms=args.latency_ms)
+    if args.remote:
+        player.remote = RemoteControl(player, args.remote, library=args.library, token=args.remote_token)
+    profiler.mark("window constructed")
+    profiler.watch_first_paint(player)
     player.show()
+    profiler.mark("window shown")
+    # Warm librosa once the first frame is on screen so the first decode is quick
+    QTimer.singleShot(250, lambda: startup.warm_imports(profiler))
     sys.exit(app.exec_())
\ No newline at end of file
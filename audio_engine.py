@@ -0,0 +1,786 @@
+"""
+Mixer-driven audio engines.
+
+MixerStream drives a Mixer from one output stream (PyAudio, pygame or the
+null sink, see output.py), full duplex on PyAudio so a live microphone (or
+a WAV stand-in on any output) is mixed into the deck output. LocalEngine
+runs it inside the GUI process.
+
+EngineClient runs the same stream in a dedicated child process so that a
+heavy paintEvent or a librosa decode holding the GIL in the GUI process
+cannot starve the audio callback. The two processes only share memory:
+
+- decoded tracks are copied once into a shared memory segment per deck,
+- control commands travel through a shared memory ring buffer,
+- the engine publishes positions and meters into a shared status block
+  that the GUI reads from its update timer,
+- with a microphone, dry mic samples tagged with the scored deck's time
+  flow back through a ring (``mic_tap``) for the singing score,
+- while recording, finished blocks flow back through a ring for the
+  recorder's writer thread (see recorder.py).
+"""
+
+import multiprocessing as mp
+import os
+import time
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import tracing
+from decoders import load_audio
+from effects import default_mic_chain
+from memory import shared_budget
+from mixer import Mixer
+from output import open_output
+
+# Command opcodes, sent as float64 records: (op, deck, arg1, arg2, arg3, arg4)
+OP_LOAD = 1      # arg1 = generation, arg2 = sample rate, arg3 = frames, arg4 = bytes per sample
+OP_PLAY = 2
+OP_PAUSE = 3
+OP_RESUME = 4
+OP_STOP = 5
+OP_SEEK = 6      # arg1 = seconds
+OP_VOLUME = 7    # arg1 = volume
+OP_UNLOAD = 8
+OP_SHUTDOWN = 9
+OP_MIC_VOLUME = 10   # arg1 = volume
+OP_MIC_EFFECT = 11   # arg1 = effect index, arg2 = enabled
+OP_CROSSFADE = 12    # deck = from deck, arg1 = to deck, arg2 = seconds, arg3 = start (< 0: now)
+OP_RECORD = 13       # deck = stems, arg1 = ring generation (0: stop), arg2 = channels, arg3 = capacity
+OP_EQ = 14           # arg1 = band, arg2 = gain dB, arg3 = frequency, arg4 = Q (0: unchanged)
+
+COMMAND_SIZE = 6
+
+# Sample formats a deck segment may hold, keyed by bytes per sample
+SAMPLE_DTYPES = {2: np.int16, 4: np.float32}
+
+# Status block layout: a header followed by one row per deck
+STATUS_HEADER = 8   # sequence, sample rate, callbacks, underruns, mic peak, latency ms, record overruns,
+                    # last recording generation the callback has let go of
+DECK_FIELDS = 5     # position, duration, playing, paused, peak
+
+# Order of the effects in effects.default_mic_chain
+MIC_EFFECTS = ('gain', 'highpass', 'echo', 'reverb')
+
+# Mic tap ring: (sample, deck seconds) records, about three seconds at 44.1 kHz
+TAP_CAPACITY = 1 << 17
+
+# Seconds of audio the recording ring holds while the writer catches up
+RECORD_SECONDS = 4.0
+
+
+def block_size_for_latency(sample_rate, latency_ms):
+    """Largest power-of-two block that keeps input plus output buffering under the target"""
+    frames = sample_rate * latency_ms / 1000.0 / 2.0
+    size = 64
+    while size * 2 <= frames and size < 4096:
+        size *= 2
+    return size
+
+
+def _attach(name):
+    """Attach to a segment created by the other side.
+
+    The engine is started with the spawn context, so both processes talk to
+    the same resource tracker and the creator stays responsible for unlinking.
+    """
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedRingBuffer:
+    """Single-producer/single-consumer ring of fixed-size records in shared memory
+
+    The first two int64 slots hold monotonically increasing write and read
+    counters; the producer only advances the write counter and the consumer
+    only the read counter, so no lock is needed.
+    """
+
+    def __init__(self, capacity, record_size, dtype=np.float64, name=None, create=True):
+        self.capacity = capacity
+        self.record_size = record_size
+        self.dtype = np.dtype(dtype)
+        data_bytes = capacity * record_size * self.dtype.itemsize
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=16 + data_bytes)
+        else:
+            self.shm = _attach(name)
+        self.name = self.shm.name
+        self._counters = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        self._data = np.ndarray((capacity, record_size), dtype=self.dtype,
+                                buffer=self.shm.buf, offset=16)
+        if create:
+            self._counters[:] = 0
+
+    @classmethod
+    def attach(cls, name, capacity, record_size, dtype=np.float64):
+        return cls(capacity, record_size, dtype, name=name, create=False)
+
+    def available(self):
+        return int(self._counters[0] - self._counters[1])
+
+    def free(self):
+        return self.capacity - self.available()
+
+    def write(self, records):
+        """Append as many records as fit; returns the number written"""
+        records = np.asarray(records, dtype=self.dtype).reshape(-1, self.record_size)
+        count = min(len(records), self.free())
+        if count == 0:
+            return 0
+        head = int(self._counters[0])
+        start = head % self.capacity
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = records[:first]
+        if count > first:
+            self._data[:count - first] = records[first:count]
+        self._counters[0] = head + count
+        return count
+
+    def read(self, max_records=None):
+        """Remove and return up to ``max_records`` records"""
+        count = self.available()
+        if max_records is not None:
+            count = min(count, max_records)
+        if count == 0:
+            return np.empty((0, self.record_size), dtype=self.dtype)
+        tail = int(self._counters[1])
+        start = tail % self.capacity
+        first = min(count, self.capacity - start)
+        if count > first:
+            out = np.concatenate((self._data[start:], self._data[:count - first]))
+        else:
+            out = self._data[start:start + count].copy()
+        self._counters[1] = tail + count
+        return out
+
+    def close(self):
+        # Drop the numpy views first, otherwise the mapping cannot be released
+        self._counters = None
+        self._data = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class SharedStatusBlock:
+    """Positions and meters published by the engine, guarded by a sequence counter"""
+
+    def __init__(self, max_decks, name=None, create=True):
+        self.max_decks = max_decks
+        size = (STATUS_HEADER + max_decks * DECK_FIELDS) * 8
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = _attach(name)
+        self.name = self.shm.name
+        self._values = np.ndarray((size // 8,), dtype=np.float64, buffer=self.shm.buf)
+        if create:
+            self._values[:] = 0.0
+        self._decks = self._values[STATUS_HEADER:].reshape(max_decks, DECK_FIELDS)
+
+    def publish(self, mixer, stream):
+        """Engine side: write one consistent snapshot of the mixer state"""
+        values = self._values
+        values[0] += 1  # odd while writing
+        values[1] = mixer.sample_rate
+        values[2] = stream.callbacks
+        values[3] = stream.underruns
+        values[4] = mixer.mic_peak
+        values[5] = stream.latency_ms
+        values[6] = mixer.record_overruns
+        rows = self._decks
+        for i, state in enumerate(mixer.decks):
+            if state is None:
+                rows[i] = 0.0
+            else:
+                rows[i, 0] = state.get_position()
+                rows[i, 1] = state.get_duration()
+                rows[i, 2] = state.playing
+                rows[i, 3] = state.paused
+                rows[i, 4] = state.peak
+        values[0] += 1
+
+    def snapshot(self):
+        """GUI side: copy of the per-deck rows, retried while the engine is writing"""
+        for _ in range(100):
+            seq = self._values[0]
+            if seq % 2 == 0:
+                rows = self._decks.copy()
+                if self._values[0] == seq:
+                    return rows
+        return self._decks.copy()
+
+    def counters(self):
+        return {
+            'sample_rate': int(self._values[1]),
+            'callbacks': int(self._values[2]),
+            'underruns': int(self._values[3]),
+            'mic_peak': float(self._values[4]),
+            'latency_ms': float(self._values[5]),
+            'record_overruns': int(self._values[6]),
+            'record_detached': int(self._values[7]),
+        }
+
+    def detach_recording(self, generation):
+        """Engine side: the callback no longer writes to recording ``generation``"""
+        self._values[7] = generation
+
+    def close(self):
+        self._values = None
+        self._decks = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class WavMicSource:
+    """Feeds a WAV file into the mic input, for testing without a microphone"""
+
+    def __init__(self, path, sample_rate, loop=True):
+        data, source_rate = load_audio(path)
+        if source_rate != sample_rate:
+            count = int(len(data) * sample_rate / source_rate)
+            data = np.interp(np.arange(count) * (source_rate / sample_rate),
+                             np.arange(len(data)), data).astype(np.float32)
+        self.data = data
+        self.loop = loop
+        self.position = 0
+        self._block = np.zeros(0, dtype=np.float32)
+
+    def read(self, frame_count):
+        if len(self._block) < frame_count:
+            self._block = np.zeros(frame_count, dtype=np.float32)
+        block = self._block[:frame_count]
+        filled = 0
+        while filled < frame_count:
+            if self.position >= len(self.data):
+                if not self.loop or len(self.data) == 0:
+                    block[filled:] = 0.0
+                    break
+                self.position = 0
+            n = min(frame_count - filled, len(self.data) - self.position)
+            block[filled:filled + n] = self.data[self.position:self.position + n]
+            self.position += n
+            filled += n
+        return block
+
+
+class MixerStream:
+    """Drives a Mixer from a single output stream (``output``: OutputSettings).
+
+    With ``mic=True`` the stream is full duplex and every input block is run
+    through the mixer's mic chain; a ``mic_source`` (such as WavMicSource)
+    replaces the sound card input. The round-trip latency is measured from
+    the stream timestamps on every callback.
+    """
+
+    def __init__(self, mixer, latency_ms=40.0, mic=False, mic_source=None, output=None):
+        self.mixer = mixer
+        self.latency_target_ms = latency_ms
+        self.block_size = block_size_for_latency(mixer.sample_rate, latency_ms)
+        self.mic = mic or mic_source is not None
+        self.mic_source = mic_source
+        self.callbacks = 0
+        self.underruns = 0
+        self.latency_ms = 0.0
+        self.reported_latency_ms = 0.0
+        self.on_block = None  # called after each rendered block
+        self.output_settings = output
+        self.output = None
+
+    def start(self):
+        self.output = open_output(self.output_settings, self.mixer.sample_rate, self.block_size,
+                                  self._callback, input=self.mic and self.mic_source is None)
+        self.output.start()
+        self.reported_latency_ms = 1000.0 * (self.output.output_latency + self.output.input_latency)
+
+    def _callback(self, in_block, frame_count, time_info, xrun):
+        if xrun:
+            self.underruns += 1
+        self.callbacks += 1
+
+        if in_block is not None:
+            mic = in_block
+        elif self.mic_source is not None:
+            mic = self.mic_source.read(frame_count)
+        else:
+            mic = None
+
+        out = self.mixer.render(frame_count, mic)
+        self._measure(time_info, frame_count)
+        if self.on_block is not None:
+            self.on_block(self)
+        return out
+
+    def _measure(self, time_info, frame_count):
+        """Capture-to-playback time of this block, smoothed"""
+        dac = time_info.get('output_buffer_dac_time', 0.0)
+        if self.mic_source is None and self.mic:
+            adc = time_info.get('input_buffer_adc_time', 0.0)
+        else:
+            # A file source is "captured" one block before the callback runs
+            adc = time_info.get('current_time', 0.0) - frame_count / self.mixer.sample_rate
+        if dac <= 0.0 or adc <= 0.0:
+            # Some host APIs leave the timestamps at zero
+            self.latency_ms = self.reported_latency_ms
+            return
+        sample = (dac - adc) * 1000.0
+        if self.latency_ms == 0.0:
+            self.latency_ms = sample
+        else:
+            self.latency_ms += 0.05 * (sample - self.latency_ms)
+
+    def stop(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+
+def record_channels(stems):
+    """Recording ring width: the mix alone, or the mix, ``stems`` decks and the mic"""
+    return stems + 2 if stems else 1
+
+
+def _make_mic_source(mic_wav, sample_rate):
+    return WavMicSource(mic_wav, sample_rate) if mic_wav else None
+
+
+class LocalEngine:
+    """Mixer engine running in the GUI process; same interface as EngineClient"""
+
+    def __init__(self, max_decks=8, sample_rate=44100, latency_ms=40.0, mic=False, mic_wav=None,
+                 output=None):
+        self.max_decks = max_decks
+        self.sample_rate = sample_rate
+        self.mixer = Mixer(sample_rate, max_decks)
+        self.mic_tap = None
+        if mic or mic_wav:
+            # Only built with a microphone: its high-pass loads scipy.signal
+            self.mixer.mic_chain = default_mic_chain(sample_rate)
+            self.mic_tap = SharedRingBuffer(TAP_CAPACITY, 2, np.float32)
+            self.mixer.mic_tap = self.mic_tap
+        self.stream = MixerStream(self.mixer, latency_ms, mic, _make_mic_source(mic_wav, sample_rate),
+                                  output)
+        self._record_detach = 0
+        self.stream.start()
+
+    def load(self, deck, audio_data, sample_rate):
+        state = self.mixer.decks[deck]
+        if state is None or state.audio_data is not audio_data:
+            self.mixer.load(deck, audio_data, sample_rate)
+
+    def unload(self, deck):
+        self.mixer.unload(deck)
+
+    def play(self, deck):
+        self.mixer.play(deck)
+
+    def pause(self, deck):
+        self.mixer.pause(deck)
+
+    def resume(self, deck):
+        self.mixer.resume(deck)
+
+    def stop(self, deck):
+        self.mixer.stop(deck)
+
+    def seek(self, deck, seconds):
+        self.mixer.seek(deck, seconds)
+
+    def crossfade(self, from_deck, to_deck, seconds, start=None):
+        self.mixer.crossfade(from_deck, to_deck, seconds, start)
+
+    def set_volume(self, deck, volume):
+        self.mixer.set_volume(deck, volume)
+
+    def set_eq(self, deck, band, gain_db, frequency=None, q=None):
+        self.mixer.set_eq(deck, band, gain_db, frequency, q)
+
+    def set_mic_volume(self, volume):
+        self.mixer.set_mic_volume(volume)
+
+    def set_mic_effect(self, name, enabled):
+        if self.mixer.mic_chain is not None:
+            self.mixer.mic_chain.effects[MIC_EFFECTS.index(name)].enabled = enabled
+
+    def deck_status(self, deck):
+        state = self.mixer.decks[deck]
+        if state is None:
+            return {'position': 0.0, 'duration': 0.0, 'playing': False, 'paused': False, 'peak': 0.0}
+        return {
+            'position': state.get_position(),
+            'duration': state.get_duration(),
+            'playing': state.playing,
+            'paused': state.paused,
+            'peak': state.peak,
+        }
+
+    def deck_statuses(self):
+        return [self.deck_status(deck) for deck in range(self.max_decks)]
+
+    def mic_status(self):
+        return {
+            'peak': self.mixer.mic_peak,
+            'latency_ms': self.stream.latency_ms,
+            'underruns': self.stream.underruns,
+        }
+
+    def start_recording(self, stems=0):
+        """Ring the mixer copies every finished block into (see recorder.py)"""
+        ring = SharedRingBuffer(int(RECORD_SECONDS * self.sample_rate), record_channels(stems), np.float32)
+        self.mixer.record_overruns = 0
+        self.mixer.record_stems = stems
+        self.mixer.record_ring = ring
+        return ring
+
+    def stop_recording(self):
+        self.mixer.record_ring = None
+        # A callback that started before this may still be writing its block;
+        # once the next one has started, it has returned
+        self._record_detach = self.stream.callbacks + 1
+
+    def recording_detached(self):
+        """True once the callback can no longer write to the stopped ring"""
+        return self.stream.callbacks >= self._record_detach
+
+    def record_overruns(self):
+        return self.mixer.record_overruns
+
+    def shutdown(self):
+        self.stream.stop()
+        if self.mic_tap is not None:
+            self.mixer.mic_tap = None
+            self.mic_tap.close()
+            self.mic_tap.unlink()
+            self.mic_tap = None
+
+
+def _engine_main(prefix, max_decks, sample_rate, latency_ms, mic, mic_wav, command_capacity, trace=None,
+                 output=None):
+    """Entry point of the engine child process"""
+    if trace:
+        # The child exits without atexit handlers, so the trace is saved below
+        tracing.enable(trace, save_at_exit=False, process='audio engine')
+        tracing.instrument_hot_paths()
+    commands = SharedRingBuffer.attach(f"{prefix}_cmd", command_capacity, COMMAND_SIZE)
+    status = SharedStatusBlock(max_decks, name=f"{prefix}_status", create=False)
+    mixer = Mixer(sample_rate, max_decks)
+    tap = None
+    if mic or mic_wav:
+        mixer.mic_chain = default_mic_chain(sample_rate)
+        tap = SharedRingBuffer.attach(f"{prefix}_tap", TAP_CAPACITY, 2, np.float32)
+        mixer.mic_tap = tap
+    segments = [None] * max_decks
+    # Replaced segments stay mapped until the callback has let go of them
+    retired = []
+    record = None
+    record_generation = 0
+    # Stopped recording rings, closed and acknowledged once the callback has moved past them
+    stopped = []
+
+    stream = MixerStream(mixer, latency_ms, mic, _make_mic_source(mic_wav, sample_rate), output)
+    stream.on_block = lambda s: status.publish(mixer, s)
+    stream.start()
+
+    running = True
+    while running:
+        for op, deck, arg1, arg2, arg3, arg4 in commands.read():
+            op, deck = int(op), int(deck)
+            if op == OP_SHUTDOWN:
+                running = False
+            elif op == OP_LOAD:
+                try:
+                    shm = _attach(f"{prefix}_d{deck}_g{int(arg1)}")
+                except FileNotFoundError:
+                    # Superseded by a newer load before we got to it
+                    continue
+                data = np.ndarray((int(arg3),), dtype=SAMPLE_DTYPES[int(arg4)], buffer=shm.buf)
+                mixer.load(deck, data, int(arg2))
+                del data
+                if segments[deck] is not None:
+                    retired.append(segments[deck])
+                segments[deck] = shm
+            elif op == OP_UNLOAD:
+                mixer.unload(deck)
+                if segments[deck] is not None:
+                    retired.append(segments[deck])
+                    segments[deck] = None
+            elif op == OP_PLAY:
+                mixer.play(deck)
+            elif op == OP_PAUSE:
+                mixer.pause(deck)
+            elif op == OP_RESUME:
+                mixer.resume(deck)
+            elif op == OP_STOP:
+                mixer.stop(deck)
+            elif op == OP_SEEK:
+                mixer.seek(deck, arg1)
+            elif op == OP_VOLUME:
+                mixer.set_volume(deck, arg1)
+            elif op == OP_MIC_VOLUME:
+                mixer.set_mic_volume(arg1)
+            elif op == OP_MIC_EFFECT:
+                if mixer.mic_chain is not None:
+                    mixer.mic_chain.effects[int(arg1)].enabled = bool(arg2)
+            elif op == OP_CROSSFADE:
+                mixer.crossfade(deck, int(arg1), arg2, arg3 if arg3 >= 0 else None)
+            elif op == OP_EQ:
+                mixer.set_eq(deck, int(arg1), arg2, arg3 or None, arg4 or None)
+            elif op == OP_RECORD:
+                mixer.record_ring = None
+                if record is not None:
+                    stopped.append((stream.callbacks + 2, record, record_generation))
+                    record = None
+                if arg1 > 0:
+                    record_generation = int(arg1)
+                    record = SharedRingBuffer.attach(f"{prefix}_rec{record_generation}", int(arg3),
+                                                     int(arg2), np.float32)
+                    mixer.record_overruns = 0
+                    mixer.record_stems = deck
+                    mixer.record_ring = record
+        for shm in list(retired):
+            try:
+                shm.close()
+                retired.remove(shm)
+            except BufferError:
+                pass  # the callback is still rendering from it
+        for entry in list(stopped):
+            if stream.callbacks >= entry[0]:
+                entry[1].close()
+                status.detach_recording(entry[2])
+                stopped.remove(entry)
+        time.sleep(0.005)
+
+    stream.stop()
+    mixer.record_ring = None
+    for ring in [record] + [entry[1] for entry in stopped]:
+        if ring is not None:
+            ring.close()
+    commands.close()
+    status.close()
+    if tap is not None:
+        mixer.mic_tap = None
+        tap.close()
+    if trace:
+        tracing.save()
+
+
+class EngineClient:
+    """GUI-side handle that owns the engine process and its shared memory"""
+
+    def __init__(self, max_decks=8, sample_rate=44100, latency_ms=40.0, mic=False, mic_wav=None,
+                 command_capacity=256, trace=None, output=None):
+        self.max_decks = max_decks
+        self.sample_rate = sample_rate
+        self.prefix = f"kp{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self.commands = SharedRingBuffer(command_capacity, COMMAND_SIZE, name=f"{self.prefix}_cmd")
+        self.status = SharedStatusBlock(max_decks, name=f"{self.prefix}_status")
+        self.mic_tap = None
+        if mic or mic_wav:
+            self.mic_tap = SharedRingBuffer(TAP_CAPACITY, 2, np.float32, name=f"{self.prefix}_tap")
+        self._segments = [None] * max_decks
+        self._loaded = [None] * max_decks
+        self._generation = 0
+        self._recording = 0
+
+        ctx = mp.get_context('spawn')
+        self.process = ctx.Process(
+            target=_engine_main,
+            args=(self.prefix, max_decks, sample_rate, latency_ms, mic, mic_wav, command_capacity, trace,
+                  output),
+            daemon=True
+        )
+        self.process.start()
+
+    def send(self, op, deck=0, arg1=0.0, arg2=0.0, arg3=0.0, arg4=0.0):
+        # The engine drains every few milliseconds, so a full ring is transient
+        while not self.commands.write((op, deck, arg1, arg2, arg3, arg4)):
+            if not self.process.is_alive():
+                return
+            time.sleep(0.001)
+
+    def load(self, deck, audio_data, sample_rate):
+        """Copy a decoded track into shared memory unless it is already there"""
+        if self._loaded[deck] is audio_data:
+            return
+        self._generation += 1
+        # Compact int16 decks stay int16; the engine converts per block
+        dtype = np.int16 if audio_data.dtype == np.int16 else np.float32
+        data = np.ascontiguousarray(audio_data, dtype=dtype)
+        shm = shared_memory.SharedMemory(
+            name=f"{self.prefix}_d{deck}_g{self._generation}", create=True, size=max(data.nbytes, 4)
+        )
+        np.ndarray(data.shape, dtype=dtype, buffer=shm.buf)[:] = data
+        self.send(OP_LOAD, deck, self._generation, sample_rate, len(data), data.itemsize)
+
+        # The engine keeps its own mapping, so the name can go away as soon as
+        # the old segment has been replaced
+        old, self._segments[deck] = self._segments[deck], shm
+        if old is not None:
+            old.close()
+            old.unlink()
+        self._loaded[deck] = audio_data
+        # Counted, not evictable: evicting the deck unloads it from the engine
+        shared_budget().register(('engine', deck), data.nbytes, kind='engine')
+
+    def unload(self, deck):
+        """Drop a deck in the engine and free its shared segment"""
+        self.send(OP_UNLOAD, deck)
+        shm = self._segments[deck]
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        self._segments[deck] = None
+        self._loaded[deck] = None
+        shared_budget().unregister(('engine', deck))
+
+    def play(self, deck):
+        self.send(OP_PLAY, deck)
+
+    def pause(self, deck):
+        self.send(OP_PAUSE, deck)
+
+    def resume(self, deck):
+        self.send(OP_RESUME, deck)
+
+    def stop(self, deck):
+        self.send(OP_STOP, deck)
+
+    def seek(self, deck, seconds):
+        self.send(OP_SEEK, deck, seconds)
+
+    def crossfade(self, from_deck, to_deck, seconds, start=None):
+        self.send(OP_CROSSFADE, from_deck, to_deck, seconds, -1.0 if start is None else start)
+
+    def set_volume(self, deck, volume):
+        self.send(OP_VOLUME, deck, volume)
+
+    def set_eq(self, deck, band, gain_db, frequency=None, q=None):
+        # The engine designs the filter in its command loop, off the callback
+        self.send(OP_EQ, deck, band, gain_db, frequency or 0.0, q or 0.0)
+
+    def set_mic_volume(self, volume):
+        self.send(OP_MIC_VOLUME, 0, volume)
+
+    def start_recording(self, stems=0):
+        """Ring the engine copies every finished block into (see recorder.py)"""
+        self._generation += 1
+        capacity = int(RECORD_SECONDS * self.sample_rate)
+        channels = record_channels(stems)
+        ring = SharedRingBuffer(capacity, channels, np.float32, name=f"{self.prefix}_rec{self._generation}")
+        self.send(OP_RECORD, stems, self._generation, channels, capacity)
+        self._recording = self._generation
+        return ring
+
+    def stop_recording(self):
+        self.send(OP_RECORD)
+
+    def recording_detached(self):
+        """True once the engine has acknowledged that its callback let go of the ring"""
+        return self.status.counters()['record_detached'] >= self._recording
+
+    def record_overruns(self):
+        return self.status.counters()['record_overruns']
+
+    def set_mic_effect(self, name, enabled):
+        self.send(OP_MIC_EFFECT, 0, MIC_EFFECTS.index(name), float(enabled))
+
+    def mic_status(self):
+        counters = self.status.counters()
+        return {
+            'peak': counters['mic_peak'],
+            'latency_ms': counters['latency_ms'],
+            'underruns': counters['underruns'],
+        }
+
+    def deck_status(self, deck):
+        return self._status_dict(self.status.snapshot()[deck])
+
+    def deck_statuses(self):
+        """Every deck from a single consistent snapshot"""
+        return [self._status_dict(row) for row in self.status.snapshot()]
+
+    @staticmethod
+    def _status_dict(row):
+        position, duration, playing, paused, peak = row
+        return {
+            'position': position,
+            'duration': duration,
+            'playing': bool(playing),
+            'paused': bool(paused),
+            'peak': peak,
+        }
+
+    def shutdown(self):
+        if self.process.is_alive():
+            self.send(OP_SHUTDOWN)
+            self.process.join(2.0)
+            if self.process.is_alive():
+                self.process.terminate()
+        for shm in self._segments:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._segments = [None] * self.max_decks
+        self.commands.close()
+        self.commands.unlink()
+        self.status.close()
+        self.status.unlink()
+        if self.mic_tap is not None:
+            self.mic_tap.close()
+            self.mic_tap.unlink()
+            self.mic_tap = None
+
+
+class EngineDeckStream:
+    """Drop-in replacement for AudioStream that plays one deck through an engine"""
+
+    def __init__(self, engine, deck, audio_data, sample_rate, volume=1.0):
+        self.engine = engine
+        self.deck = deck
+        self.audio_data = audio_data
+        self.sample_rate = sample_rate
+        engine.load(deck, audio_data, sample_rate)
+        engine.set_volume(deck, volume)
+
+    @property
+    def playing(self):
+        return self.engine.deck_status(self.deck)['playing']
+
+    def start_playback(self):
+        self.engine.play(self.deck)
+
+    def pause(self):
+        self.engine.pause(self.deck)
+
+    def resume(self):
+        self.engine.resume(self.deck)
+
+    def stop(self):
+        self.engine.stop(self.deck)
+
+    def seek(self, seconds):
+        self.engine.seek(self.deck, seconds)
+
+    def set_volume(self, volume):
+        self.engine.set_volume(self.deck, volume)
+
+    def set_eq(self, band, gain_db, frequency=None, q=None):
+        self.engine.set_eq(self.deck, band, gain_db, frequency, q)
+
+    def get_position(self):
+        return self.engine.deck_status(self.deck)['position']
+
+    def get_duration(self):
+        return len(self.audio_data) / self.sample_rate
+
+    def get_peak(self):
+        return self.engine.deck_status(self.deck)['peak']
+
+    def release(self):
+        self.stop()
+        self.audio_data = np.zeros(0, dtype=self.audio_data.dtype)
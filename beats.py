@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Tempo, beat and downbeat analysis.
+
+Each track is analysed once into a constant-tempo BeatGrid (the grid a DJ
+would set by hand) and cached on disk next to the other analyses, keyed by
+file identity, so loading the track again only reads the cache. The grid
+is drawn on the waveform and used to snap seeks and crossfade start points
+to beats.
+
+Run directly to analyse a whole library in parallel across processes:
+
+    python beats.py ~/Music --workers 4
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from cache import cache_dir, file_key
+from decoders import load_audio, to_float32
+
+N_FFT = 1024
+HOP = 512
+BATCH_FRAMES = 4096
+BPM_MIN = 60.0
+BPM_MAX = 200.0
+# Tempo prior: octave errors are resolved towards this tempo
+BPM_PRIOR = 120.0
+BEATS_PER_BAR = 4
+# Downbeats are chosen from the bass onsets, below this frequency
+LOW_BAND_HZ = 150.0
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg')
+
+_WINDOW = np.hanning(N_FFT).astype(np.float32)
+
+
+def onset_envelope(audio_data, sample_rate):
+    """Spectral flux per HOP frame (full band and low band), centred like the spectrogram"""
+    n_frames = len(audio_data) // HOP + 1
+    low_bins = max(2, int(LOW_BAND_HZ * N_FFT / sample_rate) + 1)
+    flux = np.zeros(n_frames, dtype=np.float32)
+    low = np.zeros(n_frames, dtype=np.float32)
+    previous = None
+    length = (BATCH_FRAMES - 1) * HOP + N_FFT
+    buf = np.zeros(length, dtype=np.float32)
+
+    # A batch of frames at a time, so int16 and memory-mapped tracks are never
+    # converted to float in full
+    for first in range(0, n_frames, BATCH_FRAMES):
+        count = min(BATCH_FRAMES, n_frames - first)
+        start = first * HOP - N_FFT // 2
+        lo = max(start, 0)
+        hi = min(start + length, len(audio_data))
+        buf.fill(0.0)
+        if hi > lo:
+            to_float32(audio_data[lo:hi], buf[lo - start:hi - start])
+        frames = np.lib.stride_tricks.sliding_window_view(buf, N_FFT)[::HOP][:count]
+        spectrum = np.log1p(100.0 * np.abs(np.fft.rfft(frames * _WINDOW, axis=1))).astype(np.float32)
+
+        if previous is None:
+            previous = spectrum[:1]
+        rise = np.maximum(np.diff(np.concatenate((previous, spectrum)), axis=0), 0.0)
+        flux[first:first + count] = rise.sum(axis=1)
+        low[first:first + count] = rise[:, :low_bins].sum(axis=1)
+        previous = spectrum[-1:]
+
+    return _detrend(flux, sample_rate), _detrend(low, sample_rate)
+
+
+def _detrend(envelope, sample_rate):
+    """Onset strength above its local (half-second) average"""
+    width = max(1, min(int(0.5 * sample_rate / HOP), len(envelope)))
+    local = np.convolve(envelope, np.ones(width, dtype=np.float32) / width, mode='same')
+    return np.maximum(envelope - local, 0.0)
+
+
+def estimate_period(envelope, fps):
+    """Beat period in frames from the autocorrelation of the onset envelope"""
+    n = len(envelope)
+    centred = envelope - envelope.mean()
+    size = 1 << int(np.ceil(np.log2(2 * n)))
+    spectrum = np.fft.rfft(centred, n=size)
+    ac = np.fft.irfft(spectrum * np.conj(spectrum), n=size)[:n]
+
+    lag_lo = max(1, int(60.0 * fps / BPM_MAX))
+    lag_hi = min(n - 2, int(np.ceil(60.0 * fps / BPM_MIN)))
+    if lag_hi <= lag_lo:
+        return None
+    lags = np.arange(lag_lo, lag_hi + 1)
+    prior = np.exp(-0.5 * np.log2(60.0 * fps / lags / BPM_PRIOR) ** 2)
+    best = lag_lo + int(np.argmax(ac[lags] * prior))
+
+    left, mid, right = ac[best - 1], ac[best], ac[best + 1]
+    denom = left - 2 * mid + right
+    return best + (0.5 * (left - right) / denom if denom != 0 else 0.0)
+
+
+def fit_grid(envelope, period, spread=0.02, periods=81, phases=64):
+    """Period and phase (frames) whose comb of beats collects the most onset strength"""
+    frames = np.arange(len(envelope), dtype=np.float64)
+    best_score, best_period, best_phase = -1.0, period, 0.0
+    for candidate in period * (1.0 + np.linspace(-spread, spread, periods)):
+        offsets = np.arange(phases) * (candidate / phases)
+        ticks = np.arange(int(len(envelope) / candidate)) * candidate
+        score = np.interp(offsets[:, None] + ticks[None, :], frames, envelope).mean(axis=1)
+        i = int(np.argmax(score))
+        if score[i] > best_score:
+            best_score, best_period, best_phase = score[i], candidate, offsets[i]
+    return best_period, best_phase
+
+
+class BeatGrid:
+    """Constant-tempo beat grid: BPM, beat times and the beats that start a bar (seconds)"""
+
+    def __init__(self, bpm, beats, downbeats):
+        self.bpm = float(bpm)
+        self.beats = np.asarray(beats, dtype=np.float64)
+        self.downbeats = np.asarray(downbeats, dtype=np.float64)
+
+    @property
+    def beat_length(self):
+        return 60.0 / self.bpm if self.bpm > 0 else 0.0
+
+    def snap(self, seconds):
+        """Nearest beat to ``seconds``; unchanged when there is no grid"""
+        if len(self.beats) == 0:
+            return seconds
+        i = int(np.clip(np.searchsorted(self.beats, seconds), 1, len(self.beats) - 1))
+        before, after = self.beats[i - 1], self.beats[i]
+        return float(before if seconds - before <= after - seconds else after)
+
+    def next_downbeat(self, seconds):
+        """First downbeat at or after ``seconds``, or None past the last one"""
+        i = np.searchsorted(self.downbeats, seconds)
+        return float(self.downbeats[i]) if i < len(self.downbeats) else None
+
+    @classmethod
+    def empty(cls):
+        return cls(0.0, [], [])
+
+    @classmethod
+    def from_audio(cls, audio_data, sample_rate):
+        fps = sample_rate / float(HOP)
+        envelope, low = onset_envelope(audio_data, sample_rate)
+        if not envelope.any():
+            return cls.empty()
+        period = estimate_period(envelope, fps)
+        if period is None:
+            return cls.empty()
+        period, phase = fit_grid(envelope, period)
+        beat_frames = np.arange(phase, len(envelope), period)
+
+        # The bar phase whose beats carry the most bass onsets holds the downbeats
+        frames = np.arange(len(low), dtype=np.float64)
+        strength = np.interp(beat_frames, frames, low)
+        bar = [strength[k::BEATS_PER_BAR].mean() if len(strength[k::BEATS_PER_BAR]) else 0.0
+               for k in range(BEATS_PER_BAR)]
+        first = int(np.argmax(bar))
+
+        beats = beat_frames / fps
+        return cls(60.0 * fps / period, beats, beats[first::BEATS_PER_BAR])
+
+    @staticmethod
+    def cache_path(path):
+        key = file_key(path, 'beats', N_FFT, HOP, BEATS_PER_BAR)
+        return os.path.join(cache_dir('beats'), key + '.npz')
+
+    @classmethod
+    def cached(cls, path):
+        """The stored grid for ``path``, or None if it has not been analysed"""
+        try:
+            with np.load(cls.cache_path(path)) as data:
+                return cls(float(data['bpm']), data['beats'], data['downbeats'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, path, audio_data=None, sample_rate=None):
+        """Grid for ``path``, analysed once and then read from the beat cache"""
+        grid = cls.cached(path)
+        if grid is not None:
+            return grid
+
+        if audio_data is None:
+            audio_data, sample_rate = load_audio(path)
+        grid = cls.from_audio(audio_data, sample_rate)
+        cached = cls.cache_path(path)
+        try:
+            # Per-process temporary name: library workers may race the GUI
+            tmp = f"{cached}.{os.getpid()}.tmp.npz"
+            np.savez(tmp, bpm=grid.bpm, beats=grid.beats, downbeats=grid.downbeats)
+            os.replace(tmp, cached)
+        except OSError as e:
+            print(f"Could not cache beat grid: {e}")
+        return grid
+
+
+class BeatLoader(QThread):
+    """Reads the beat grid from the cache, or analyses the track, off the GUI thread"""
+    grid_ready = pyqtSignal(object, str)  # BeatGrid, source path
+
+    def __init__(self, path, audio_data=None, sample_rate=None):
+        super().__init__()
+        self.path = path
+        self.audio_data = audio_data
+        self.sample_rate = sample_rate
+
+    def run(self):
+        try:
+            grid = BeatGrid.load(self.path, self.audio_data, self.sample_rate)
+            self.grid_ready.emit(grid, self.path)
+        except Exception as e:
+            print(f"Error analysing beats: {e}")
+
+
+def library_files(paths):
+    """Audio files named in ``paths``, descending into directories"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(AUDIO_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif path.lower().endswith(AUDIO_EXTENSIONS):
+            yield path
+
+
+def _analyse_file(path):
+    try:
+        return path, BeatGrid.load(path).bpm, None
+    except Exception as e:
+        return path, 0.0, str(e)
+
+
+def analyse_library(paths, workers=None):
+    """Analyse every uncached file across worker processes; yields (path, bpm, error)"""
+    pending = [path for path in library_files(paths) if BeatGrid.cached(path) is None]
+    if not pending:
+        return
+    ctx = mp.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        for future in as_completed([pool.submit(_analyse_file, path) for path in pending]):
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse tempo and beats for a music library")
+    parser.add_argument('paths', nargs='+', help="audio files or directories")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="analysis processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    done = 0
+    for path, bpm, error in analyse_library(args.paths, args.workers):
+        done += 1
+        if error:
+            print(f"{path}: failed ({error})")
+        else:
+            print(f"{path}: {bpm:.1f} BPM")
+    print(f"Analysed {done} file(s); already cached files were skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark the native soundfile decoders against librosa.load per format
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from decoders import load_audio
+
+FORMATS = [
+    ('wav', 'PCM_16'),
+    ('wav', 'FLOAT'),
+    ('flac', 'PCM_16'),
+    ('ogg', 'VORBIS'),
+]
+
+
+def create_test_file(directory, ext, subtype, duration, channels, sample_rate=44100):
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    left = 0.3 * np.sin(2 * np.pi * 440 * t)
+    audio = np.stack([left, 0.3 * np.sin(2 * np.pi * 330 * t)][:channels], axis=1)
+    path = os.path.join(directory, f"bench_{subtype.lower()}_{channels}ch.{ext}")
+    sf.write(path, audio, sample_rate, subtype=subtype)
+    return path
+
+
+def time_call(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds of audio per file")
+    parser.add_argument('--channels', type=int, default=2, choices=(1, 2))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import librosa
+    except ImportError:
+        librosa = None
+        print("librosa not installed; only the native loaders are timed")
+
+    directory = tempfile.mkdtemp(prefix="decoder_bench_")
+    try:
+        print(f"{args.duration:.0f} s, {args.channels} channel(s), best of {args.repeat}\n")
+        print(f"{'format':<14}{'librosa':>10}{'float32':>10}{'int16':>10}{'mmap':>10}{'speedup':>10}")
+        for ext, subtype in FORMATS:
+            path = create_test_file(directory, ext, subtype, args.duration, args.channels)
+            native = time_call(lambda: load_audio(path), args.repeat)
+            compact = time_call(lambda: load_audio(path, 'int16'), args.repeat)
+            mapped = time_call(lambda: load_audio(path, 'int16', mmap=True), args.repeat)
+            if librosa is not None:
+                reference = time_call(lambda: librosa.load(path, sr=None), args.repeat)
+                ref_str = f"{reference * 1000:8.1f}ms"
+                speedup = f"{reference / native:9.1f}x"
+            else:
+                ref_str = speedup = f"{'-':>10}"
+            print(f"{ext + '/' + subtype:<14}{ref_str}{native * 1000:8.1f}ms"
+                  f"{compact * 1000:8.1f}ms{mapped * 1000:8.1f}ms{speedup}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-deck EQ on the audio callback path.
+
+Eight decks play noise through the Mixer at several callback block sizes,
+first flat (the EQ is bypassed) and then with all three bands boosted or
+cut, and the cost of each render is reported against the real-time budget
+of one block. The cost of redesigning a band, which happens on the GUI or
+engine command thread while a slider moves, is measured separately.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from effects import EQ_BANDS, ParametricEQ
+from mixer import Mixer
+
+GAINS = (6.0, -4.0, 3.0)
+
+
+def render_times(mixer, block, blocks):
+    times = []
+    for _ in range(blocks):
+        start = time.perf_counter()
+        mixer.render(block)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--decks', type=int, default=8)
+    parser.add_argument('--blocks', type=int, default=2000, help="callbacks timed per case")
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    args = parser.parse_args()
+
+    sr = args.sample_rate
+    rng = np.random.default_rng(0)
+    noise = (0.1 * rng.standard_normal(sr * 60)).astype(np.float32)
+    mixer = Mixer(sr, args.decks)
+    for deck in range(args.decks):
+        mixer.load(deck, noise, sr)
+        mixer.play(deck)
+
+    print(f"\n{args.decks} decks, {len(EQ_BANDS)}-band EQ, {args.blocks} blocks per case\n")
+    print(f"{'block':>6} {'EQ':<6}{'p50':>10}{'p99':>10}{'max':>10}{'% budget':>10}")
+    for block in (64, 128, 256, 512, 1024):
+        budget = block / sr * 1000
+        for active in (False, True):
+            for deck in range(args.decks):
+                for band, gain in enumerate(GAINS):
+                    mixer.set_eq(deck, band, gain if active else 0.0)
+                mixer.seek(deck, 0.0)
+            ms = render_times(mixer, block, args.blocks)
+            p50, p99, worst = np.percentile(ms, 50), np.percentile(ms, 99), ms.max()
+            print(f"{block:>6} {'on' if active else 'flat':<6}{p50:8.3f}ms{p99:8.3f}ms"
+                  f"{worst:8.3f}ms{100 * p99 / budget:9.1f}%")
+
+    eq = ParametricEQ(sr)
+    frequencies = np.geomspace(200.0, 5000.0, 1000)
+    start = time.perf_counter()
+    for i, frequency in enumerate(frequencies):
+        eq.set_band(1, 6.0 * np.sin(i), frequency)
+    cost = (time.perf_counter() - start) / len(frequencies) * 1e6
+    print(f"\nset_band (redesign all sections, swap): {cost:.1f} us per slider step")
+
+
+if __name__ == "__main__":
+    main()
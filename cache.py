@@ -0,0 +1,29 @@
+"""
+On-disk cache locations and keys shared by the background analysers
+"""
+
+import hashlib
+import os
+
+CACHE_ROOT = os.environ.get(
+    'KARAOKE_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'karaoke_player')
+)
+
+
+def cache_dir(name):
+    """Directory for one kind of cached data, created on demand"""
+    path = os.path.join(CACHE_ROOT, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_key(path, *params):
+    """Stable key for a source file: path, size, mtime and analysis parameters"""
+    try:
+        stat = os.stat(path)
+        identity = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    except OSError:
+        identity = os.path.abspath(path)
+    extra = '|'.join(str(p) for p in params)
+    return hashlib.sha1(f"{identity}|{extra}".encode('utf-8')).hexdigest()
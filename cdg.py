@@ -0,0 +1,322 @@
+"""
+CD+G karaoke graphics.
+
+A .cdg file next to an MP3 holds the subcode graphics of a karaoke disc:
+300 packets of 24 bytes per second of audio, drawing 6x12 pixel tiles into
+a 300x216 framebuffer of 4-bit colour indices with a 16-colour palette.
+
+CdgDecoder keeps the framebuffer in a numpy array and applies packets up
+to the playback position, marking the tiles each packet touches, so
+CdgWidget only copies those tiles into its QImage. Every KEYFRAME_SECONDS
+the decoder snapshots its state; a seek restores the nearest snapshot at or
+before the new position and replays from there instead of from packet 0.
+"""
+
+import os
+import time
+
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt, QRect, QRectF, QTimer
+from PyQt5.QtGui import QPainter, QImage, qRgb
+
+from memory import PRIORITY_CACHE, shared_budget
+
+PACKET_SIZE = 24
+PACKETS_PER_SECOND = 300
+WIDTH = 300
+HEIGHT = 216
+TILE_WIDTH = 6
+TILE_HEIGHT = 12
+COLUMNS = WIDTH // TILE_WIDTH
+ROWS = HEIGHT // TILE_HEIGHT
+# The border is one tile wide; scrolling and fine offsets only move the inside
+BORDER = QRect(TILE_WIDTH, TILE_HEIGHT, WIDTH - 2 * TILE_WIDTH, HEIGHT - 2 * TILE_HEIGHT)
+
+KEYFRAME_SECONDS = 2.0
+KEYFRAME_PACKETS = int(KEYFRAME_SECONDS * PACKETS_PER_SECOND)
+
+# The players report positions ten times a second; the view runs between
+# reports at this rate, for at most MAX_EXTRAPOLATION past the last one
+FRAME_MS = 33
+MAX_EXTRAPOLATION = 0.25
+# Positions this far behind the one shown are clock jitter, not seeks
+JITTER = 0.15
+
+CDG_COMMAND = 0x09
+MEMORY_PRESET = 1
+BORDER_PRESET = 2
+TILE_BLOCK = 6
+SCROLL_PRESET = 20
+SCROLL_COPY = 24
+LOAD_COLORS_LOW = 30
+LOAD_COLORS_HIGH = 31
+TILE_BLOCK_XOR = 38
+_INSTRUCTIONS = (MEMORY_PRESET, BORDER_PRESET, TILE_BLOCK, SCROLL_PRESET, SCROLL_COPY,
+                 LOAD_COLORS_LOW, LOAD_COLORS_HIGH, TILE_BLOCK_XOR)
+
+# Six pixel bits of each tile row byte, most significant (leftmost) first
+_BITS = ((np.arange(64)[:, None] >> np.arange(5, -1, -1)) & 1).astype(bool)
+
+
+def find_cdg(audio_path):
+    """The .cdg file sharing ``audio_path``'s name, or None"""
+    stem = os.path.splitext(audio_path)[0]
+    for extension in ('.cdg', '.CDG'):
+        if os.path.exists(stem + extension):
+            return stem + extension
+    return None
+
+
+class CdgDecoder:
+    """Framebuffer, palette and scroll offsets of a CD+G stream at a packet position"""
+
+    def __init__(self, packets):
+        self.packets = packets
+        commands = packets[:, 0] & 0x3F
+        instructions = packets[:, 1] & 0x3F
+        # Most packets are empty; only the drawing ones are ever visited
+        self._active = np.flatnonzero((commands == CDG_COMMAND) & np.isin(instructions, _INSTRUCTIONS))
+        self.pixels = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        self.palette = np.zeros((16, 3), dtype=np.uint8)
+        self.h_offset = 0
+        self.v_offset = 0
+        self.position = 0  # next packet to apply
+        self.dirty = np.ones((ROWS, COLUMNS), dtype=bool)
+        self.palette_changed = True
+        # keyframes[k] is the state before packet k * KEYFRAME_PACKETS; always
+        # contiguous from 0 because decoding only ever runs forward from one
+        self._keyframes = [self._snapshot()]
+
+    @classmethod
+    def open(cls, path):
+        data = np.fromfile(path, dtype=np.uint8)
+        count = len(data) // PACKET_SIZE
+        return cls(data[:count * PACKET_SIZE].reshape(count, PACKET_SIZE))
+
+    @property
+    def duration(self):
+        return len(self.packets) / PACKETS_PER_SECOND
+
+    def seek(self, seconds):
+        """Bring the framebuffer to ``seconds`` of playback"""
+        target = int(np.clip(seconds * PACKETS_PER_SECOND, 0, len(self.packets)))
+        key = min(target // KEYFRAME_PACKETS, len(self._keyframes) - 1)
+        if target < self.position or key * KEYFRAME_PACKETS > self.position:
+            self._restore(key)
+        self._replay(target)
+
+    @property
+    def keyframe_bytes(self):
+        return len(self._keyframes) * (self.pixels.nbytes + self.palette.nbytes)
+
+    def drop_keyframes(self):
+        """Forget all but the first snapshot; later ones are taken again on the way forward"""
+        del self._keyframes[1:]
+
+    def _snapshot(self):
+        return self.pixels.copy(), self.palette.copy(), self.h_offset, self.v_offset
+
+    def _restore(self, key):
+        pixels, palette, self.h_offset, self.v_offset = self._keyframes[key]
+        self.pixels[:] = pixels
+        self.palette[:] = palette
+        self.position = key * KEYFRAME_PACKETS
+        self.dirty[:] = True
+        self.palette_changed = True
+
+    def _replay(self, target):
+        while self.position < target:
+            next_key = (self.position // KEYFRAME_PACKETS + 1) * KEYFRAME_PACKETS
+            end = min(target, next_key)
+            lo, hi = np.searchsorted(self._active, (self.position, end))
+            for index in self._active[lo:hi]:
+                self._apply(self.packets[index])
+            self.position = end
+            if end == next_key and end // KEYFRAME_PACKETS == len(self._keyframes):
+                self._keyframes.append(self._snapshot())
+
+    def _apply(self, packet):
+        instruction = int(packet[1]) & 0x3F
+        data = (packet[4:20] & 0x3F).tolist()
+        if instruction == TILE_BLOCK or instruction == TILE_BLOCK_XOR:
+            self._tile_block(data, instruction == TILE_BLOCK_XOR)
+        elif instruction == MEMORY_PRESET:
+            self.pixels.fill(data[0] & 0x0F)
+            self.dirty[:] = True
+        elif instruction == BORDER_PRESET:
+            color = data[0] & 0x0F
+            self.pixels[:TILE_HEIGHT] = color
+            self.pixels[-TILE_HEIGHT:] = color
+            self.pixels[:, :TILE_WIDTH] = color
+            self.pixels[:, -TILE_WIDTH:] = color
+            self.dirty[[0, -1], :] = True
+            self.dirty[:, [0, -1]] = True
+        elif instruction == LOAD_COLORS_LOW or instruction == LOAD_COLORS_HIGH:
+            high, low = np.array(data[0::2]), np.array(data[1::2])
+            rgb = np.stack(((high >> 2) & 0x0F, ((high & 0x03) << 2) | (low >> 4), low & 0x0F), axis=1)
+            first = 8 if instruction == LOAD_COLORS_HIGH else 0
+            self.palette[first:first + 8] = rgb * 17
+            self.palette_changed = True
+        else:
+            self._scroll(data, copy=instruction == SCROLL_COPY)
+
+    def _tile_block(self, data, xor):
+        row, column = data[2] & 0x1F, data[3]
+        if row >= ROWS or column >= COLUMNS:
+            return
+        block = np.where(_BITS[data[4:16]], data[1] & 0x0F, data[0] & 0x0F).astype(np.uint8)
+        y, x = row * TILE_HEIGHT, column * TILE_WIDTH
+        if xor:
+            self.pixels[y:y + TILE_HEIGHT, x:x + TILE_WIDTH] ^= block
+        else:
+            self.pixels[y:y + TILE_HEIGHT, x:x + TILE_WIDTH] = block
+        self.dirty[row, column] = True
+
+    def _scroll(self, data, copy):
+        """Scroll Preset fills the uncovered strip with a colour, Scroll Copy wraps it around"""
+        color = data[0] & 0x0F
+        h_command, v_command = (data[1] & 0x30) >> 4, (data[2] & 0x30) >> 4
+        h_offset, v_offset = min(data[1] & 0x07, TILE_WIDTH - 1), min(data[2] & 0x0F, TILE_HEIGHT - 1)
+        moved = False
+        if h_command in (1, 2):
+            shift = TILE_WIDTH if h_command == 1 else -TILE_WIDTH
+            self.pixels[:] = np.roll(self.pixels, shift, axis=1)
+            if not copy:
+                if shift > 0:
+                    self.pixels[:, :shift] = color
+                else:
+                    self.pixels[:, shift:] = color
+            moved = True
+        if v_command in (1, 2):
+            shift = TILE_HEIGHT if v_command == 1 else -TILE_HEIGHT
+            self.pixels[:] = np.roll(self.pixels, shift, axis=0)
+            if not copy:
+                if shift > 0:
+                    self.pixels[:shift] = color
+                else:
+                    self.pixels[shift:] = color
+            moved = True
+        if moved or (h_offset, v_offset) != (self.h_offset, self.v_offset):
+            self.h_offset, self.v_offset = h_offset, v_offset
+            self.dirty[:] = True
+
+
+class CdgWidget(QWidget):
+    """Shows a CdgDecoder's framebuffer, scaled to fit, following the playhead.
+
+    Between position reports the playback clock is extrapolated, so lyric
+    wipes advance at the frame rate rather than the players' update rate.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.decoder = None
+        self._clock = None  # (seconds, monotonic time) of the last report
+        self._advancing = False
+        self._shown = 0.0
+        self._budget_key = ('cdg', id(self))
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        self.image = QImage(WIDTH, HEIGHT, QImage.Format_Indexed8)
+        self.image.setColorCount(16)
+        self.image.fill(0)
+        bits = self.image.bits()
+        bits.setsize(self.image.byteCount())
+        # Writable view of the image's pixels; tiles are copied straight in
+        self._view = np.frombuffer(bits, dtype=np.uint8).reshape(HEIGHT, self.image.bytesPerLine())
+        self.setMinimumHeight(HEIGHT)
+        self.setVisible(False)
+
+    def set_graphics(self, decoder):
+        """Show ``decoder``'s graphics from the start, or hide the view for None"""
+        self.decoder = decoder
+        self._clock = None
+        self._advancing = False
+        self.setVisible(decoder is not None)
+        if decoder is None:
+            self.timer.stop()
+            shared_budget().unregister(self._budget_key)
+            return
+        shared_budget().register(self._budget_key, decoder.keyframe_bytes, PRIORITY_CACHE,
+                                 self._drop_keyframes, kind='tile caches')
+        self.timer.start(FRAME_MS)
+        self._show(0.0)
+
+    def release(self):
+        self.set_graphics(None)
+
+    def set_position(self, seconds):
+        """Playback clock report for the deck"""
+        if self.decoder is None:
+            return
+        self._advancing = self._clock is not None and seconds > self._clock[0]
+        self._clock = (seconds, time.monotonic())
+        if seconds < self._shown - JITTER or not self._advancing:
+            self._show(seconds)
+        else:
+            self._show(max(seconds, self._shown))
+
+    def _tick(self):
+        if self._clock is None or not self._advancing or not self.isVisible():
+            return
+        seconds, reported = self._clock
+        seconds += min(time.monotonic() - reported, MAX_EXTRAPOLATION)
+        if seconds > self._shown:
+            self._show(seconds)
+
+    def _show(self, seconds):
+        self._shown = seconds
+        before = self.decoder.keyframe_bytes
+        self.decoder.seek(seconds)
+        if self.decoder.keyframe_bytes != before:
+            shared_budget().update(self._budget_key, self.decoder.keyframe_bytes)
+        self._blit()
+
+    def _drop_keyframes(self):
+        self.decoder.drop_keyframes()
+        shared_budget().update(self._budget_key, self.decoder.keyframe_bytes)
+
+    def _target(self):
+        """Widget rectangle the framebuffer is scaled into, keeping its aspect"""
+        scale = min(self.width() / WIDTH, self.height() / HEIGHT)
+        width, height = WIDTH * scale, HEIGHT * scale
+        return QRectF((self.width() - width) / 2, (self.height() - height) / 2, width, height)
+
+    def _blit(self):
+        decoder = self.decoder
+        if decoder.palette_changed:
+            decoder.palette_changed = False
+            self.image.setColorTable([qRgb(*color) for color in decoder.palette.tolist()])
+            self.update()
+        rows, columns = np.nonzero(decoder.dirty)
+        if len(rows) == 0:
+            return
+        decoder.dirty[:] = False
+        if len(rows) > ROWS * COLUMNS // 4 or decoder.h_offset or decoder.v_offset:
+            self._view[:, :WIDTH] = decoder.pixels
+            self.update()
+            return
+        target = self._target()
+        scale = target.width() / WIDTH
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            y, x = row * TILE_HEIGHT, column * TILE_WIDTH
+            self._view[y:y + TILE_HEIGHT, x:x + TILE_WIDTH] = \
+                decoder.pixels[y:y + TILE_HEIGHT, x:x + TILE_WIDTH]
+            self.update(QRectF(target.x() + x * scale, target.y() + y * scale,
+                               TILE_WIDTH * scale, TILE_HEIGHT * scale).toAlignedRect().adjusted(-1, -1, 1, 1))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        if self.decoder is None:
+            return
+        target = self._target()
+        painter.drawImage(target, self.image)
+        if self.decoder.h_offset or self.decoder.v_offset:
+            # Fine scrolling moves the window onto the framebuffer inside the border
+            scale = target.width() / WIDTH
+            inner = QRectF(target.x() + BORDER.x() * scale, target.y() + BORDER.y() * scale,
+                           BORDER.width() * scale, BORDER.height() * scale)
+            painter.drawImage(inner, self.image, QRectF(BORDER.translated(self.decoder.h_offset,
+                                                                          self.decoder.v_offset)))
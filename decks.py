@@ -0,0 +1,375 @@
+"""
+Deck model shared by both players.
+
+Each deck's playback state lives in a small ``__slots__`` object and its
+widgets in a DeckPanel; DeckManager builds any number of panels and runs a
+single update pass over all of them, so adding decks (stems, guide vocals,
+FX) needs no per-deck code in the players.
+"""
+
+import numpy as np
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSlider, QLabel,
+                             QSplitter, QProgressBar, QScrollArea, QSpinBox)
+from PyQt5.QtCore import Qt, QTimer
+
+from beats import BeatLoader
+from cdg import CdgDecoder, CdgWidget, find_cdg
+from effects import EQ_BANDS, EQ_RANGE_DB
+from memory import MB, PRIORITY_DECK, map_to_disk, shared_budget
+from spectrogram import SpectrogramWidget, shared_pool
+from waveform import WaveformWidget
+
+MAX_DECKS = 8
+
+
+def format_time(seconds):
+    minutes = int(seconds // 60)
+    seconds = int(seconds % 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class DeckState:
+    """Playback state of one deck"""
+    __slots__ = ('index', 'data', 'sample_rate', 'path', 'stream', 'playing', 'paused', 'beats')
+
+    def __init__(self, index):
+        self.index = index
+        self.clear()
+
+    def clear(self):
+        self.data = None
+        self.sample_rate = None
+        self.path = None
+        self.stream = None
+        self.playing = False
+        self.paused = False
+        self.beats = None  # BeatGrid once analysed
+
+    @property
+    def loaded(self):
+        return self.data is not None
+
+    @property
+    def duration(self):
+        return len(self.data) / self.sample_rate if self.data is not None else 0.0
+
+
+class DeckPanel(QWidget):
+    """Controls, CD+G graphics, waveform, spectrogram and progress for one deck"""
+
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self._progress = -1
+        self._time_text = ""
+        layout = QVBoxLayout(self)
+
+        controls = QHBoxLayout()
+        self.load_btn = QPushButton(f"Load Track {index + 1}")
+        controls.addWidget(self.load_btn)
+        self.play_btn = QPushButton("Play")
+        controls.addWidget(self.play_btn)
+        self.pause_btn = QPushButton("Pause")
+        controls.addWidget(self.pause_btn)
+        self.stop_btn = QPushButton("Stop")
+        controls.addWidget(self.stop_btn)
+        self.eject_btn = QPushButton("Eject")
+        controls.addWidget(self.eject_btn)
+        controls.addStretch()
+
+        controls.addWidget(QLabel("Volume:"))
+        self.volume_slider = QSlider(Qt.Horizontal)
+        self.volume_slider.setRange(0, 100)
+        self.volume_slider.setValue(70)
+        controls.addWidget(self.volume_slider)
+        layout.addLayout(controls)
+
+        # Per-deck EQ: a gain per band, and the centre of the peaking band
+        self.eq_row = QWidget()
+        eq_controls = QHBoxLayout(self.eq_row)
+        eq_controls.setContentsMargins(0, 0, 0, 0)
+        self.eq_sliders = []
+        self.eq_frequencies = {}
+        for band, (shape, frequency, _) in enumerate(EQ_BANDS):
+            eq_controls.addWidget(QLabel({'lowshelf': "Low:", 'peak': "Mid:", 'highshelf': "High:"}[shape]))
+            slider = QSlider(Qt.Horizontal)
+            slider.setRange(-int(EQ_RANGE_DB), int(EQ_RANGE_DB))
+            slider.setValue(0)
+            slider.setToolTip("dB")
+            eq_controls.addWidget(slider)
+            self.eq_sliders.append(slider)
+            if shape == 'peak':
+                spin = QSpinBox()
+                spin.setRange(100, 10000)
+                spin.setSingleStep(50)
+                spin.setValue(int(frequency))
+                spin.setSuffix(" Hz")
+                eq_controls.addWidget(spin)
+                self.eq_frequencies[band] = spin
+        eq_controls.addStretch()
+        layout.addWidget(self.eq_row)
+
+        # CD+G karaoke graphics, shown only for tracks with a .cdg file
+        self.graphics = CdgWidget()
+        layout.addWidget(self.graphics)
+
+        self.waveform = WaveformWidget()
+        layout.addWidget(self.waveform)
+
+        # Spectrogram and pitch contour, following the waveform's zoom
+        self.spectrogram = SpectrogramWidget()
+        self.waveform.view_changed.connect(self.spectrogram.set_view)
+        layout.addWidget(self.spectrogram)
+
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        progress_layout.addWidget(self.progress_bar)
+        self.time_label = QLabel("00:00 / 00:00")
+        progress_layout.addWidget(self.time_label)
+        layout.addLayout(progress_layout)
+
+        self.set_loaded(False)
+
+    def eq(self, band):
+        """(gain dB, frequency, Q) of one EQ band as set on the panel"""
+        _, frequency, q = EQ_BANDS[band]
+        spin = self.eq_frequencies.get(band)
+        return float(self.eq_sliders[band].value()), float(spin.value()) if spin else frequency, q
+
+    def set_loaded(self, loaded):
+        for button in (self.play_btn, self.pause_btn, self.stop_btn, self.eject_btn):
+            button.setEnabled(loaded)
+
+    def show_track(self, audio_data, sample_rate, file_path, peaks=None):
+        self.waveform.set_audio_data(audio_data, sample_rate, peaks)
+        self.spectrogram.set_audio_data(audio_data, sample_rate, file_path)
+        self.show_graphics(file_path)
+        self.progress_bar.setFormat("%p%")
+        self._progress = -1
+        self.show_position(0, len(audio_data) / sample_rate)
+        self.set_loaded(True)
+
+    def show_graphics(self, file_path):
+        """CD+G graphics from the .cdg file next to ``file_path``, if there is one"""
+        decoder = None
+        cdg_path = find_cdg(file_path)
+        if cdg_path is not None:
+            try:
+                decoder = CdgDecoder.open(cdg_path)
+            except (OSError, ValueError) as e:
+                print(f"Could not read CD+G graphics: {e}")
+        self.graphics.set_graphics(decoder)
+
+    def show_partial_peaks(self, peaks, filled, total_frames, sample_rate):
+        """Draw what has been decoded so far, scaled to the full length"""
+        if self.waveform.peaks is peaks:
+            self.waveform.extend_track(filled)
+        else:
+            self.waveform.begin_track(peaks, filled, total_frames, sample_rate)
+
+    def show_decode_progress(self, fraction):
+        """The progress bar doubles as the decode meter until the track is ready"""
+        self.progress_bar.setFormat("Loading %p%")
+        self._progress = -1
+        self.progress_bar.setValue(int(fraction * 100))
+
+    def show_position(self, current_time, duration):
+        """Move the playhead; labels and bars are only touched when they change"""
+        self.waveform.set_position(current_time)
+        self.spectrogram.set_position(current_time)
+        self.graphics.set_position(current_time)
+        progress = int((current_time / duration) * 100) if duration > 0 else 0
+        if progress != self._progress:
+            self._progress = progress
+            self.progress_bar.setValue(progress)
+        text = f"{format_time(current_time)} / {format_time(duration)}"
+        if text != self._time_text:
+            self._time_text = text
+            self.time_label.setText(text)
+
+    def reset(self):
+        """Release the deck's buffers from the views and disable its controls"""
+        self.progress_bar.setFormat("%p%")
+        self.waveform.release()
+        self.spectrogram.release()
+        self.graphics.release()
+        self.show_position(0, 0)
+        self.set_loaded(False)
+
+
+class MemoryMeter(QLabel):
+    """Usage of the memory budget; also enforces it periodically, for sizes
+    that grew through updates or worker-thread registrations"""
+
+    def __init__(self, budget=None, interval_ms=1000, parent=None):
+        super().__init__(parent)
+        self.budget = budget or shared_budget()
+        self._text = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(interval_ms)
+        self.refresh()
+
+    def refresh(self):
+        self.budget.enforce()
+        total = self.budget.total
+        text = f"Memory: {total / MB:.0f} / {self.budget.limit / MB:.0f} MB"
+        if text == self._text:
+            return
+        self._text = text
+        self.setText(text)
+        over = total > self.budget.limit
+        self.setStyleSheet("color: #ff6b6b;" if over else "")
+        usage = sorted(self.budget.usage().items(), key=lambda item: -item[1])
+        self.setToolTip("\n".join(f"{kind}: {nbytes / MB:.1f} MB" for kind, nbytes in usage))
+
+
+class DeckManager:
+    """Builds ``count`` deck panels and wires them to the player's handlers.
+
+    The player provides load_track, play_track, pause_track, stop_track,
+    eject_track and set_volume, each taking a deck index, seek_track(deck,
+    seconds), and a ``loader`` (LoaderPool) whose decode progress is shown
+    on the deck's progress bar. An optional release_audio(deck) drops any
+    copy the player made of a deck's samples when the deck is evicted, and
+    an optional set_eq(deck, band) shows the EQ controls and applies them.
+    """
+
+    def __init__(self, player, count):
+        if not 1 <= count <= MAX_DECKS:
+            raise ValueError(f"Deck count must be between 1 and {MAX_DECKS}")
+        self.states = [DeckState(i) for i in range(count)]
+        self.panels = [DeckPanel(i) for i in range(count)]
+        for panel in self.panels:
+            deck = panel.index
+            panel.load_btn.clicked.connect(lambda _, d=deck: player.load_track(d))
+            panel.play_btn.clicked.connect(lambda _, d=deck: player.play_track(d))
+            panel.pause_btn.clicked.connect(lambda _, d=deck: player.pause_track(d))
+            panel.stop_btn.clicked.connect(lambda _, d=deck: player.stop_track(d))
+            panel.eject_btn.clicked.connect(lambda _, d=deck: player.eject_track(d))
+            panel.volume_slider.valueChanged.connect(lambda _, d=deck: player.set_volume(d))
+            if hasattr(player, 'set_eq'):
+                for band, slider in enumerate(panel.eq_sliders):
+                    slider.valueChanged.connect(lambda _, d=deck, b=band: player.set_eq(d, b))
+                for band, spin in panel.eq_frequencies.items():
+                    spin.valueChanged.connect(lambda _, d=deck, b=band: player.set_eq(d, b))
+            else:
+                panel.eq_row.hide()
+            panel.waveform.seek_requested.connect(lambda t, d=deck: player.seek_track(d, t))
+        player.loader.progress.connect(self.on_decode_progress)
+        player.loader.partial_peaks.connect(self.on_partial_peaks)
+        self._beat_loaders = set()
+        self._player = player
+
+    def set_track(self, deck, audio_data, sample_rate, file_path, peaks=None):
+        """Show a decoded track on ``deck`` and account its samples against the memory budget"""
+        state = self.states[deck]
+        state.data = audio_data
+        state.sample_rate = sample_rate
+        panel = self.panels[deck]
+        panel.show_track(audio_data, sample_rate, file_path, peaks)
+        shared_budget().register(('deck', deck), audio_data.nbytes + panel.waveform.peaks.nbytes,
+                                 PRIORITY_DECK, lambda d=deck: self.evict(d), kind='decks')
+        self.analyse_beats(deck, file_path, audio_data, sample_rate)
+
+    def release(self, deck):
+        """Clear a deck's state and views and stop accounting for it"""
+        shared_budget().unregister(('deck', deck))
+        self.states[deck].clear()
+        self.panels[deck].reset()
+
+    def evict(self, deck):
+        """Swap an idle, off-screen deck's samples for a memory map on disk"""
+        state = self.states[deck]
+        panel = self.panels[deck]
+        if state.data is None or isinstance(state.data, np.memmap):
+            return
+        if state.stream is not None or state.playing or not panel.visibleRegion().isEmpty():
+            return
+        mapped = map_to_disk(state.path, state.data)
+        if mapped is None:
+            return
+        release_audio = getattr(self._player, 'release_audio', None)
+        if release_audio is not None:
+            release_audio(deck)
+        state.data = mapped
+        panel.waveform.audio_data = mapped
+        panel.spectrogram.audio_data = mapped
+        # Only the peak summary stays resident
+        shared_budget().update(('deck', deck), panel.waveform.peaks.nbytes)
+
+    def on_partial_peaks(self, deck, peaks, filled, total_frames, sample_rate):
+        if deck < len(self.panels):
+            self.panels[deck].show_partial_peaks(peaks, filled, total_frames, sample_rate)
+
+    def on_decode_progress(self, deck, fraction):
+        if deck < len(self.panels):
+            self.panels[deck].show_decode_progress(fraction)
+
+    def analyse_beats(self, deck, path, audio_data, sample_rate):
+        """Beat grid for a freshly loaded track, from the cache after the first time"""
+        self.states[deck].beats = None
+        loader = BeatLoader(path, audio_data, sample_rate)
+        loader.grid_ready.connect(lambda grid, p, d=deck: self.on_grid_ready(d, grid, p))
+        loader.finished.connect(lambda l=loader: self._beat_loaders.discard(l))
+        self._beat_loaders.add(loader)
+        loader.start()
+
+    def on_grid_ready(self, deck, grid, path):
+        state = self.states[deck]
+        if path != state.path or not state.loaded:
+            return  # the deck was ejected or cued with another file meanwhile
+        state.beats = grid
+        self.panels[deck].waveform.set_beats(grid.beats, grid.downbeats)
+
+    def snap(self, deck, seconds):
+        """``seconds`` moved to the nearest beat of the deck's grid, if it has one"""
+        grid = self.states[deck].beats
+        return grid.snap(seconds) if grid is not None else seconds
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, deck):
+        return self.states[deck]
+
+    def __iter__(self):
+        return iter(self.states)
+
+    def build(self):
+        """Splitter holding every panel; scrolls once the decks no longer fit"""
+        splitter = QSplitter(Qt.Vertical)
+        for panel in self.panels:
+            splitter.addWidget(panel)
+        splitter.setSizes([400] * len(self.panels))
+        if len(self.panels) <= 2:
+            return splitter
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        splitter.setObjectName("deckSplitter")
+        scroll.setStyleSheet("QScrollArea { border: none; } #deckSplitter { background-color: #3c3c3c; }")
+        splitter.setMinimumHeight(300 * len(self.panels))
+        scroll.setWidget(splitter)
+        return scroll
+
+    def volume(self, deck):
+        return self.panels[deck].volume_slider.value() / 100.0
+
+    def eq(self, deck, band):
+        return self.panels[deck].eq(band)
+
+    def loaded(self):
+        return [state for state in self.states if state.loaded]
+
+    def shutdown(self):
+        """Drop queued spectrogram tiles so no worker outlives the window"""
+        for loader in list(self._beat_loaders):
+            loader.wait()
+        shared_pool().clear()
+        shared_pool().waitForDone()
+
+    def update(self, positions):
+        """One pass over all decks; ``positions`` maps deck index to (time, duration)"""
+        for deck, (current_time, duration) in positions.items():
+            self.panels[deck].show_position(current_time, duration)
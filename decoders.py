@@ -0,0 +1,178 @@
+"""
+Format-dispatching audio loader.
+
+WAV, FLAC and OGG are read straight through soundfile into a preallocated
+array; librosa (and its audioread fallback chain) is only used for formats
+libsndfile cannot handle, such as MP3. Uncompressed mono WAV files can
+optionally be memory-mapped without copying.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+import startup
+
+NATIVE_FORMATS = ('.wav', '.flac', '.ogg')
+
+# Frames per read when mixing multichannel files down to mono
+_CHUNK_FRAMES = 65536
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class DecodeCancelled(Exception):
+    """Raised from a progress callback to abandon a decode"""
+
+
+def load_audio(path, dtype='float32', mmap=False, progress=None):
+    """Decode ``path`` to a mono array of ``dtype`` (float32 or int16).
+
+    Returns ``(data, sample_rate)``. With ``mmap=True`` an uncompressed mono
+    WAV whose sample format already matches ``dtype`` is returned as a
+    read-only ``np.memmap`` instead of being read into memory.
+
+    ``progress(decoded_frames, total_frames, data, sample_rate)`` is called
+    after every chunk, where the first ``decoded_frames`` samples of ``data``
+    are final; raising DecodeCancelled from it stops the decode.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype(np.float32), np.dtype(np.int16)):
+        raise ValueError(f"Unsupported sample dtype: {dtype}")
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in NATIVE_FORMATS:
+        if mmap and ext == '.wav':
+            mapped = map_wav(path, dtype)
+            if mapped is not None:
+                if progress is not None:
+                    progress(len(mapped[0]), len(mapped[0]), mapped[0], mapped[1])
+                return mapped
+        try:
+            return load_soundfile(path, dtype, progress)
+        except RuntimeError:
+            # libsndfile could not parse it (odd codec or header); let librosa try
+            pass
+    y, sr = load_librosa(path, dtype)
+    if progress is not None:
+        progress(len(y), len(y), y, sr)
+    return y, sr
+
+
+def load_soundfile(path, dtype, progress=None):
+    """Read a libsndfile-supported file into a preallocated mono array"""
+    import soundfile as sf
+
+    with sf.SoundFile(path) as f:
+        if dtype == np.int16 and f.subtype in ('FLOAT', 'DOUBLE'):
+            # libsndfile does not rescale float samples when reading integers
+            f.close()
+            data, sample_rate = load_soundfile(path, np.dtype(np.float32), progress)
+            return float_to_int16(data), sample_rate
+
+        frames = f.frames
+        channels = f.channels
+        out = np.empty(frames, dtype=dtype)
+        pos = 0
+
+        if channels == 1:
+            # Read in chunks only to report progress; samples land in place
+            while pos < frames:
+                n = min(_CHUNK_FRAMES, frames - pos)
+                read = f.read(n, dtype=dtype.name, out=out[pos:pos + n, np.newaxis])
+                if len(read) == 0:
+                    break
+                pos += len(read)
+                if progress is not None:
+                    progress(pos, frames, out, f.samplerate)
+            return out[:pos], f.samplerate
+
+        # Mix down chunk by chunk so the multichannel buffer stays small
+        chunk = np.empty((min(_CHUNK_FRAMES, max(frames, 1)), channels), dtype=dtype)
+        acc_dtype = np.float32 if dtype == np.float32 else np.int32
+        while pos < frames:
+            read = f.read(len(chunk), dtype=dtype.name, out=chunk)
+            n = len(read)
+            if n == 0:
+                break
+            mixed = read.sum(axis=1, dtype=acc_dtype)
+            if dtype == np.float32:
+                mixed *= 1.0 / channels
+            else:
+                mixed //= channels
+            out[pos:pos + n] = mixed
+            pos += n
+            if progress is not None:
+                progress(pos, frames, out, f.samplerate)
+        return out[:pos], f.samplerate
+
+
+def load_librosa(path, dtype):
+    """Fallback for formats libsndfile cannot decode"""
+    librosa = startup.load_librosa()
+    y, sr = librosa.load(path, sr=None)
+    if dtype == np.int16:
+        y = float_to_int16(y)
+    return y, sr
+
+
+def float_to_int16(data):
+    return (np.clip(data, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+
+def to_float32(block, out, gain=1.0):
+    """Write ``block`` (float32 or int16 samples) times ``gain`` into ``out``"""
+    if block.dtype == np.int16:
+        gain = gain / 32768.0
+    np.multiply(block, gain, out=out, casting='unsafe')
+    return out
+
+
+def map_wav(path, dtype):
+    """Memory-map the data chunk of a mono WAV file, or return None if it can't be"""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                body = f.read(chunk_size)
+                fmt_tag, channels, sample_rate = struct.unpack('<HHI', body[:8])
+                bits = struct.unpack('<H', body[14:16])[0]
+                if fmt_tag == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    fmt_tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (fmt_tag, channels, sample_rate, bits)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    return None
+                offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size, os.SEEK_CUR)
+            if chunk_size % 2:
+                f.seek(1, os.SEEK_CUR)
+
+    fmt_tag, channels, sample_rate, bits = fmt
+    if channels != 1:
+        return None
+    if dtype == np.int16 and (fmt_tag, bits) == (_WAVE_FORMAT_PCM, 16):
+        file_dtype = '<i2'
+    elif dtype == np.float32 and (fmt_tag, bits) == (_WAVE_FORMAT_IEEE_FLOAT, 32):
+        file_dtype = '<f4'
+    else:
+        return None
+
+    frames = min(chunk_size, os.path.getsize(path) - offset) // (bits // 8)
+    if frames == 0:
+        return None
+    data = np.memmap(path, dtype=file_dtype, mode='r', offset=offset, shape=(frames,))
+    return data, sample_rate
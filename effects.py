@@ -0,0 +1,264 @@
+"""
+Vectorized effects for the live microphone path and the per-deck EQ.
+
+Every effect processes a whole callback block with numpy and keeps its
+filter or delay-line state between blocks, so block boundaries are
+inaudible.
+
+scipy.signal is imported by the filters that need it, when they are set
+up rather than at import time, so neither player pays for it at startup
+and a flat EQ never loads it.
+"""
+
+import numpy as np
+
+# Bands of the per-deck EQ: (shape, centre or corner frequency in Hz, Q)
+EQ_BANDS = (('lowshelf', 100.0, 0.707), ('peak', 1000.0, 1.0), ('highshelf', 8000.0, 0.707))
+EQ_RANGE_DB = 12.0
+
+
+class Gain:
+    def __init__(self, gain_db=0.0):
+        self.enabled = True
+        self.set_gain_db(gain_db)
+
+    def set_gain_db(self, gain_db):
+        self.gain = 10.0 ** (gain_db / 20.0)
+
+    def process(self, block):
+        block *= self.gain
+        return block
+
+
+class HighPass:
+    """Second-order Butterworth high-pass (RBJ biquad) to remove handling rumble"""
+
+    def __init__(self, cutoff, sample_rate):
+        from scipy.signal import lfilter
+
+        self._lfilter = lfilter
+        self.enabled = True
+        self.sample_rate = sample_rate
+        self.set_cutoff(cutoff)
+
+    def set_cutoff(self, cutoff):
+        w0 = 2.0 * np.pi * cutoff / self.sample_rate
+        alpha = np.sin(w0) / np.sqrt(2.0)
+        cos_w0 = np.cos(w0)
+        a0 = 1.0 + alpha
+        self.b = np.array([(1.0 + cos_w0) / 2.0, -(1.0 + cos_w0), (1.0 + cos_w0) / 2.0]) / a0
+        self.a = np.array([1.0, -2.0 * cos_w0 / a0, (1.0 - alpha) / a0])
+        self.zi = np.zeros(2)
+
+    def process(self, block):
+        block[:], self.zi = self._lfilter(self.b, self.a, block, zi=self.zi)
+        return block
+
+
+def biquad_section(shape, frequency, gain_db, q, sample_rate):
+    """One RBJ cookbook peaking or shelving biquad as a normalised SOS row"""
+    A = 10.0 ** (gain_db / 40.0)
+    w0 = 2.0 * np.pi * min(frequency, 0.49 * sample_rate) / sample_rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2.0 * q)
+    if shape == 'peak':
+        b = [1.0 + alpha * A, -2.0 * cos_w0, 1.0 - alpha * A]
+        a = [1.0 + alpha / A, -2.0 * cos_w0, 1.0 - alpha / A]
+    else:
+        root = 2.0 * np.sqrt(A) * alpha
+        sign = 1.0 if shape == 'lowshelf' else -1.0
+        b = [A * ((A + 1) - sign * (A - 1) * cos_w0 + root),
+             sign * 2.0 * A * ((A - 1) - sign * (A + 1) * cos_w0),
+             A * ((A + 1) - sign * (A - 1) * cos_w0 - root)]
+        a = [(A + 1) + sign * (A - 1) * cos_w0 + root,
+             -sign * 2.0 * ((A - 1) + sign * (A + 1) * cos_w0),
+             (A + 1) + sign * (A - 1) * cos_w0 - root]
+    return np.array(b + a) / a[0]
+
+
+class ParametricEQ:
+    """Multi-band EQ run as one cascade of second-order sections per block.
+
+    set_band() designs the new cascade on the calling thread (the GUI, or the
+    engine's command loop) and publishes it with a single reference swap;
+    process() picks up whichever cascade is current when a block starts.
+    The filter state carries across blocks and coefficient changes, so the
+    EQ can be moved while a track plays. A flat EQ costs nothing.
+    """
+
+    def __init__(self, sample_rate, bands=EQ_BANDS):
+        self.enabled = True
+        self.sample_rate = sample_rate
+        # [shape, frequency, gain dB, Q] per band; only touched by set_band()
+        self.bands = [[shape, frequency, 0.0, q] for shape, frequency, q in bands]
+        self.sos = None  # None while every band is flat
+        self.zi = np.zeros((len(self.bands), 2))
+        self._flat = True
+        # Set by reset() on another thread, cleared only by process()
+        self._reset_pending = False
+        self._sosfilt = None
+
+    def set_band(self, band, gain_db, frequency=None, q=None):
+        shape, old_frequency, _, old_q = self.bands[band]
+        self.bands[band] = [shape, frequency or old_frequency, float(gain_db), q or old_q]
+        if all(gain == 0.0 for _, _, gain, _ in self.bands):
+            self.sos = None
+            return
+        if self._sosfilt is None:
+            # Loaded here, off the audio callback, the first time a band moves
+            from scipy.signal import sosfilt
+            self._sosfilt = sosfilt
+        # Flat bands stay in the cascade as unity sections, so the state keeps its shape
+        self.sos = np.array([biquad_section(shape, frequency, gain, q, self.sample_rate)
+                             for shape, frequency, gain, q in self.bands])
+
+    def reset(self):
+        """Forget the filter state, as for a new track. The next process() call
+        clears it, so this is safe while the callback is running"""
+        self._reset_pending = True
+
+    def process(self, block):
+        sos = self.sos
+        if sos is None or len(block) == 0:
+            self._flat = True
+            return block
+        if self._flat or self._reset_pending:
+            # The state left from before the EQ was flat or reset belongs to other audio
+            self._reset_pending = False
+            self.zi[:] = 0.0
+            self._flat = False
+        block[:], self.zi = self._sosfilt(sos, block, zi=self.zi)
+        return block
+
+
+class DelayLine:
+    """Circular buffer of exactly ``delay`` samples.
+
+    Reading ``n <= delay`` samples returns what was written ``delay`` samples
+    ago, which lets feedback loops run a whole chunk at a time.
+    """
+
+    def __init__(self, delay):
+        self.delay = max(1, int(delay))
+        self.buffer = np.zeros(self.delay, dtype=np.float32)
+        self.index = 0
+
+    def read(self, n):
+        start = self.index
+        end = start + n
+        if end <= self.delay:
+            return self.buffer[start:end].copy()
+        return np.concatenate((self.buffer[start:], self.buffer[:end - self.delay]))
+
+    def write(self, block):
+        n = len(block)
+        start = self.index
+        end = start + n
+        if end <= self.delay:
+            self.buffer[start:end] = block
+        else:
+            split = self.delay - start
+            self.buffer[start:] = block[:split]
+            self.buffer[:n - split] = block[split:]
+        self.index = end % self.delay
+
+    def chunks(self, length):
+        """Split ``length`` samples into runs no longer than the delay"""
+        pos = 0
+        while pos < length:
+            n = min(self.delay, length - pos)
+            yield pos, n
+            pos += n
+
+
+class Echo:
+    """Feedback delay: repeats every ``delay_ms`` and decays by ``feedback``"""
+
+    def __init__(self, delay_ms, feedback, mix, sample_rate):
+        self.enabled = True
+        self.feedback = feedback
+        self.mix = mix
+        self.line = DelayLine(delay_ms * sample_rate / 1000.0)
+
+    def process(self, block):
+        for pos, n in self.line.chunks(len(block)):
+            dry = block[pos:pos + n]
+            delayed = self.line.read(n)
+            self.line.write(dry + self.feedback * delayed)
+            dry += self.mix * delayed
+        return block
+
+
+class _Comb:
+    def __init__(self, delay, feedback):
+        self.feedback = feedback
+        self.line = DelayLine(delay)
+
+    def process(self, block, out):
+        for pos, n in self.line.chunks(len(block)):
+            delayed = self.line.read(n)
+            self.line.write(block[pos:pos + n] + self.feedback * delayed)
+            out[pos:pos + n] += delayed
+
+
+class _AllPass:
+    def __init__(self, delay, gain):
+        self.gain = gain
+        self.line = DelayLine(delay)
+
+    def process(self, block):
+        for pos, n in self.line.chunks(len(block)):
+            delayed = self.line.read(n)
+            v = block[pos:pos + n] + self.gain * delayed
+            self.line.write(v)
+            block[pos:pos + n] = delayed - self.gain * v
+
+
+class Reverb:
+    """Schroeder reverb: four parallel combs into two series all-passes"""
+
+    COMB_MS = (29.7, 37.1, 41.1, 43.7)
+    ALLPASS_MS = (5.0, 1.7)
+
+    def __init__(self, sample_rate, decay=0.8, mix=0.25):
+        self.enabled = True
+        self.mix = mix
+        ms = sample_rate / 1000.0
+        self.combs = [_Comb(d * ms, decay) for d in self.COMB_MS]
+        self.allpasses = [_AllPass(d * ms, 0.7) for d in self.ALLPASS_MS]
+        self._wet = np.zeros(0, dtype=np.float32)
+
+    def process(self, block):
+        if len(self._wet) < len(block):
+            self._wet = np.zeros(len(block), dtype=np.float32)
+        wet = self._wet[:len(block)]
+        wet.fill(0.0)
+        for comb in self.combs:
+            comb.process(block, wet)
+        wet *= 1.0 / len(self.combs)
+        for allpass in self.allpasses:
+            allpass.process(wet)
+        block += self.mix * wet
+        return block
+
+
+class EffectsChain:
+    """Runs the enabled effects in order over a float32 block, in place"""
+
+    def __init__(self, effects=None):
+        self.effects = list(effects or [])
+
+    def process(self, block):
+        for effect in self.effects:
+            if effect.enabled:
+                effect.process(block)
+        return block
+
+
+def default_mic_chain(sample_rate):
+    """Gain, 80 Hz high-pass, echo and reverb; echo and reverb start disabled"""
+    echo = Echo(300.0, 0.35, 0.5, sample_rate)
+    echo.enabled = False
+    reverb = Reverb(sample_rate)
+    reverb.enabled = False
+    return EffectsChain([Gain(0.0), HighPass(80.0, sample_rate), echo, reverb])
@@ -0,0 +1,215 @@
+"""
+Shared decode worker pool.
+
+All track loads go through one LoaderPool with a bounded number of worker
+threads. Jobs are prioritised (the deck being cued runs before background
+prefetch), a newer load for the same deck cancels the older job, and
+results of superseded jobs are dropped, so a slow decode can never
+overwrite the track that replaced it.
+"""
+
+import itertools
+import time
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from decoders import DecodeCancelled, load_audio
+from memory import PRIORITY_PREFETCH as MEMORY_PREFETCH, shared_budget
+from waveform import IncrementalPeaks, compute_peaks
+
+PRIORITY_CUE = 10
+PRIORITY_PREFETCH = 0
+
+# Decoded tracks kept from prefetch until a deck asks for them
+PREFETCH_SLOTS = 2
+
+# Minimum seconds between partial waveform updates from one job
+PARTIAL_INTERVAL = 0.1
+
+
+class LoadSignals(QObject):
+    progress = pyqtSignal(int, float)                       # job id, fraction
+    partial = pyqtSignal(int, object, int, int, int)        # job id, peaks, blocks, frames, sr
+    finished = pyqtSignal(int, object, object, str, object)  # job id, y, sr, path, peaks
+    failed = pyqtSignal(int, str, str)                       # job id, path, message
+
+
+class DecodeJob(QRunnable):
+    """Decodes one file; checks for cancellation between chunks and
+    summarises peaks as the chunks arrive"""
+
+    def __init__(self, job_id, path, dtype, signals):
+        super().__init__()
+        self.setAutoDelete(False)  # the pool keeps it to cancel or dequeue it
+        self.job_id = job_id
+        self.path = path
+        self.dtype = dtype
+        self.signals = signals
+        self.cancelled = False
+        self._last_percent = -1
+        self._peaks = None
+        self._last_partial = 0.0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _progress(self, decoded, total, data, sample_rate):
+        if self.cancelled:
+            raise DecodeCancelled()
+        percent = int(100 * decoded / total) if total else 100
+        if percent != self._last_percent:
+            self._last_percent = percent
+            self.signals.progress.emit(self.job_id, percent / 100.0)
+
+        if self._peaks is None:
+            self._peaks = IncrementalPeaks(total)
+        filled = self._peaks.update(data, decoded)
+        now = time.monotonic()
+        if decoded < total and now - self._last_partial >= PARTIAL_INTERVAL:
+            self._last_partial = now
+            self.signals.partial.emit(self.job_id, self._peaks.peaks, filled, total, sample_rate)
+
+    def run(self):
+        if self.cancelled:
+            return
+        try:
+            y, sr = load_audio(self.path, self.dtype, progress=self._progress)
+            if self.cancelled:
+                return
+            # Summarise here so the GUI never has to touch the full array
+            peaks = self._peaks.finish(y) if self._peaks is not None else compute_peaks(y)
+            if not self.cancelled:
+                self.signals.finished.emit(self.job_id, y, sr, self.path, peaks)
+        except DecodeCancelled:
+            pass
+        except Exception as e:
+            print(f"Error loading audio: {e}")
+            self.signals.failed.emit(self.job_id, self.path, str(e))
+
+
+class LoaderPool(QObject):
+    """Bounded, prioritised and cancellable decoding for all decks"""
+    track_ready = pyqtSignal(int, object, object, str, object)  # deck, y, sr, path, peaks
+    progress = pyqtSignal(int, float)                           # deck, fraction
+    partial_peaks = pyqtSignal(int, object, int, int, int)      # deck, peaks, blocks, frames, sr
+    failed = pyqtSignal(int, str, str)                          # deck, path, message
+
+    def __init__(self, max_workers=2, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self.signals = LoadSignals()
+        self.signals.progress.connect(self._on_progress)
+        self.signals.partial.connect(self._on_partial)
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self._ids = itertools.count(1)
+        # job id -> (deck, job); deck is None for prefetch
+        self._jobs = {}
+        self._deck_jobs = {}
+        self._prefetch_jobs = {}
+        self._prefetched = OrderedDict()
+
+    def load(self, deck, path, dtype='float32', priority=PRIORITY_CUE):
+        """Decode ``path`` for ``deck``, superseding any load still pending for it"""
+        self.cancel(deck)
+        key = (path, dtype)
+        ready = self._take_prefetched(key)
+        if ready is not None:
+            self.progress.emit(deck, 1.0)
+            self.track_ready.emit(deck, ready[0], ready[1], path, ready[2])
+            return None
+
+        job = self._start(deck, path, dtype, priority)
+        self._deck_jobs[deck] = job.job_id
+        # A running prefetch of the same file is dropped; cueing decodes it now
+        pending = self._prefetch_jobs.pop(key, None)
+        if pending is not None:
+            self._cancel_job(pending)
+        return job.job_id
+
+    def prefetch(self, path, dtype='float32'):
+        """Decode in the background at low priority for a later load()"""
+        key = (path, dtype)
+        if key in self._prefetched or key in self._prefetch_jobs:
+            return
+        job = self._start(None, path, dtype, PRIORITY_PREFETCH)
+        self._prefetch_jobs[key] = job.job_id
+
+    def cancel(self, deck):
+        """Abandon whatever is loading for ``deck``"""
+        job_id = self._deck_jobs.pop(deck, None)
+        if job_id is not None:
+            self._cancel_job(job_id)
+
+    def drop_prefetched(self):
+        """Forget decoded prefetch results (e.g. to free memory)"""
+        for key in list(self._prefetched):
+            self._take_prefetched(key)
+
+    def _take_prefetched(self, key):
+        ready = self._prefetched.pop(key, None)
+        if ready is not None:
+            shared_budget().unregister(('prefetch', key))
+        return ready
+
+    def shutdown(self):
+        for job_id in list(self._jobs):
+            self._cancel_job(job_id)
+        self.pool.waitForDone()
+
+    def _start(self, deck, path, dtype, priority):
+        job = DecodeJob(next(self._ids), path, dtype, self.signals)
+        self._jobs[job.job_id] = (deck, job)
+        self.pool.start(job, priority)
+        return job
+
+    def _cancel_job(self, job_id):
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return
+        job = entry[1]
+        job.cancel()
+        # Still queued: take it out so it never occupies a worker
+        self.pool.tryTake(job)
+
+    def _on_progress(self, job_id, fraction):
+        entry = self._jobs.get(job_id)
+        if entry is not None and entry[0] is not None:
+            self.progress.emit(entry[0], fraction)
+
+    def _on_partial(self, job_id, peaks, filled, total, sample_rate):
+        entry = self._jobs.get(job_id)
+        if entry is not None and entry[0] is not None:
+            self.partial_peaks.emit(entry[0], peaks, filled, total, sample_rate)
+
+    def _on_finished(self, job_id, y, sr, path, peaks):
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return  # cancelled or superseded after it finished decoding
+        deck, job = entry
+        if deck is None:
+            key = (path, job.dtype)
+            self._prefetch_jobs.pop(key, None)
+            self._take_prefetched(key)
+            self._prefetched[key] = (y, sr, peaks)
+            while len(self._prefetched) > PREFETCH_SLOTS:
+                self._take_prefetched(next(iter(self._prefetched)))
+            # Prefetched tracks are the first thing given up when memory is short
+            shared_budget().register(('prefetch', key), y.nbytes + peaks.nbytes, MEMORY_PREFETCH,
+                                     lambda k=key: self._take_prefetched(k), kind='prefetch')
+            return
+        self._deck_jobs.pop(deck, None)
+        self.track_ready.emit(deck, y, sr, path, peaks)
+
+    def _on_failed(self, job_id, path, message):
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return
+        deck, job = entry
+        if deck is None:
+            self._prefetch_jobs.pop((path, job.dtype), None)
+            return
+        self._deck_jobs.pop(deck, None)
+        self.failed.emit(deck, path, message)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Load test for the remote control server (remote.py).
+
+Opens many WebSocket listeners (phones watching the lyrics) and a number of
+HTTP clients searching, polling and requesting songs over keep-alive
+connections, all against localhost. With --serve a server is started in
+this process on its own thread, exactly as the player runs it, fed by a
+publisher that plays the GUI timer; the cost of publish() on that
+"GUI" thread is reported too.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from remote import RemoteServer, read_ws_frame
+
+WORDS = ['love', 'night', 'dance', 'heart', 'dream', 'fire', 'rain', 'home', 'baby', 'light']
+
+
+def make_library(directory, count):
+    """Empty stand-in files with searchable titles; the catalog only reads names"""
+    rng = random.Random(0)
+    for i in range(count):
+        title = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i:04d}"
+        open(os.path.join(directory, title + '.mp3'), 'wb').close()
+
+
+def publisher(server, stop, rate, costs):
+    """Stands in for the GUI update timer"""
+    position = 0.0
+    while not stop.is_set():
+        position += 1.0 / rate
+        snapshot = {
+            'decks': [{'deck': 0, 'title': 'Load Test', 'position': round(position, 1),
+                       'duration': 240.0, 'playing': True}],
+            'lyric': f"line {int(position)}",
+            'next_lyric': f"line {int(position) + 1}",
+            'queue': [],
+            'sent': time.time(),
+        }
+        start = time.perf_counter()
+        server.publish(snapshot)
+        costs.append(time.perf_counter() - start)
+        time.sleep(1.0 / rate)
+
+
+async def http_request(reader, writer, method, path, body=b''):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n"
+                 .encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def http_client(host, port, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random()
+    try:
+        while time.monotonic() < deadline:
+            roll = rng.random()
+            if roll < 0.6:
+                method, path, body = 'GET', f"/api/search?q={rng.choice(WORDS)}", b''
+            elif roll < 0.9:
+                method, path, body = 'GET', '/api/state', b''
+            else:
+                method, path = 'POST', '/api/queue'
+                body = json.dumps({'id': rng.randrange(100), 'singer': 'load'}).encode()
+            start = time.perf_counter()
+            status = await http_request(reader, writer, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            # 429 is the request cap working: every client here shares one address
+            if status >= 400 and status != 429:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def ws_client(host, port, deadline, counts, lags):
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write(f"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    if b'101' not in await reader.readline():
+        raise ConnectionError("WebSocket upgrade refused")
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    received = 0
+    try:
+        while time.monotonic() < deadline:
+            try:
+                opcode, payload = await asyncio.wait_for(read_ws_frame(reader), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if opcode != 0x1:
+                continue
+            received += 1
+            sent = json.loads(payload).get('sent')
+            if sent is not None:
+                lags.append(time.time() - sent)
+        # Masked close frame, as a browser would send
+        writer.write(struct.pack('!BB', 0x88, 0x80) + os.urandom(4))
+    finally:
+        counts.append(received)
+        writer.close()
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 99), ms.max()
+
+
+async def run(args, deadline):
+    latencies, errors, counts, lags = [], [], [], []
+    ws = [ws_client(args.host, args.port, deadline, counts, lags) for _ in range(args.listeners)]
+    http = [http_client(args.host, args.port, deadline, latencies, errors) for _ in range(args.http)]
+    results = await asyncio.gather(*ws, *http, return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    return latencies, errors, counts, lags, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--listeners', type=int, default=300, help="WebSocket clients")
+    parser.add_argument('--http', type=int, default=50, help="concurrent HTTP clients")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds")
+    parser.add_argument('--serve', action='store_true',
+                        help="start a server in this process instead of using a running player")
+    parser.add_argument('--songs', type=int, default=5000, help="catalog size with --serve")
+    args = parser.parse_args()
+
+    server = stop = feeder = library = None
+    costs = []
+    if args.serve:
+        library = tempfile.TemporaryDirectory()
+        make_library(library.name, args.songs)
+        server = RemoteServer('127.0.0.1', 0, [library.name])
+        if not server.start():
+            return 1
+        args.port = server.port
+        stop = threading.Event()
+        feeder = threading.Thread(target=publisher, args=(server, stop, 10.0, costs), daemon=True)
+        feeder.start()
+
+    start = time.monotonic()
+    try:
+        latencies, errors, counts, lags, failures = asyncio.run(run(args, start + args.duration))
+    finally:
+        if server is not None:
+            stop.set()
+            feeder.join()
+            server.stop()
+            library.cleanup()
+    elapsed = time.monotonic() - start
+
+    print(f"\n{args.listeners} WebSocket listeners, {args.http} HTTP clients, {elapsed:.1f} s\n")
+    if latencies:
+        p50, p99, worst = percentiles(latencies)
+        print(f"HTTP: {len(latencies)} requests ({len(latencies) / elapsed:.0f}/s), "
+              f"p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {worst:.2f} ms, {len(errors)} errors")
+    if counts:
+        print(f"Push feed: {sum(counts)} messages, {np.mean(counts) / elapsed:.1f}/s per listener, "
+              f"fewest {min(counts)}")
+    if lags:
+        p50, p99, worst = percentiles(lags)
+        print(f"Push lag: p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {worst:.2f} ms")
+    if costs:
+        p50, p99, worst = percentiles(costs)
+        print(f"publish() on the GUI thread: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {worst:.3f} ms")
+    if failures:
+        print(f"{len(failures)} client(s) failed, e.g. {failures[0]!r}")
+    return 1 if failures or errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
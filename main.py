@@ -1,121 +1,218 @@
+import startup  # first, so the startup clock covers the other imports
 import sys
-import os
+import time
+import argparse
 import numpy as np
 import pygame
-import librosa
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
-                             QWidget, QPushButton, QFileDialog, QSlider, QLabel, 
-                             QFrame, QSplitter, QProgressBar)
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
-from PyQt5.QtGui import QPainter, QPen, QColor, QPixmap
-import matplotlib.pyplot as plt
-import matplotlib.backends.backend_qt5agg as plt_backend
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+                             QWidget, QPushButton, QFileDialog)
+from PyQt5.QtCore import QTimer
 
-class AudioProcessor(QThread):
-    """Thread for processing audio files and generating waveforms"""
-    waveform_ready = pyqtSignal(object, object, str)  # y, sr, filename
-    
-    def __init__(self, file_path):
-        super().__init__()
-        self.file_path = file_path
-        
-    def run(self):
-        try:
-            # Load audio file
-            y, sr = librosa.load(self.file_path, sr=None)
-            self.waveform_ready.emit(y, sr, self.file_path)
-        except Exception as e:
-            print(f"Error loading audio: {e}")
+from audio_engine import EngineDeckStream, LocalEngine, block_size_for_latency
+from decks import MAX_DECKS, DeckManager, MemoryMeter
+from loader import LoaderPool
+from memory import DEFAULT_BUDGET_MB, shared_budget
+from mixer import MixerDeck
+from output import CLOCKS, OutputSettings
+from remote import RemoteControl
+import tracing
 
-class WaveformWidget(QWidget):
-    """Custom widget for displaying audio waveforms"""
-    
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.audio_data = None
-        self.sample_rate = None
-        self.current_position = 0
-        self.duration = 0
-        self.setMinimumHeight(150)
-        self.setStyleSheet("background-color: #2b2b2b; border: 1px solid #555;")
-        
-    def set_audio_data(self, audio_data, sample_rate):
+# Seconds of audio in each Sound queued on a deck's channel
+CHUNK_SECONDS = 2.0
+
+class SoundDeck:
+    """One deck played on its own pygame mixer channel as a chain of short Sounds.
+    
+    pygame cannot start a Sound part way through, so the deck's decoded
+    samples (the array the waveform draws) are converted into the mixer's
+    format CHUNK_SECONDS at a time: play and seek convert only the first
+    chunk, and feed(), called from the GUI timer, keeps the next one queued
+    on the channel. The file is never decoded again and no full-length copy
+    is made. The position is where playback started plus the time the
+    channel has been playing, on a clock that stops while it is paused.
+    """
+    
+    def __init__(self, deck, audio_data, sample_rate, volume=1.0):
+        self.deck = deck
+        self.channel = pygame.mixer.Channel(deck)
         self.audio_data = audio_data
         self.sample_rate = sample_rate
-        if audio_data is not None:
-            self.duration = len(audio_data) / sample_rate
-        self.update()
-        
-    def set_position(self, position):
-        self.current_position = position
-        self.update()
-        
-    def paintEvent(self, event):
-        if self.audio_data is None:
+        self.volume = volume
+        frequency, _, self.channels = pygame.mixer.get_init()
+        # Resamples to the mixer rate and converts int16 decks, see mixer.py
+        self.source = MixerDeck(audio_data, sample_rate, frequency)
+        self.chunk_frames = int(CHUNK_SECONDS * frequency)
+        self._block = np.zeros(self.chunk_frames, dtype=np.float32)
+        self.cued = False
+        self.start = 0.0
+        self.elapsed = 0.0
+        self.resumed = None
+        self.playing = False
+        self.paused = False
+    
+    def get_duration(self):
+        return len(self.audio_data) / self.sample_rate
+    
+    def get_position(self):
+        elapsed = self.elapsed
+        if self.resumed is not None:
+            elapsed += time.perf_counter() - self.resumed
+        return min(self.start + elapsed, self.get_duration())
+    
+    @property
+    def exhausted(self):
+        return self.source.position >= len(self.audio_data)
+    
+    @property
+    def finished(self):
+        return self.playing and not self.paused and self.exhausted and not self.channel.get_busy()
+    
+    def _next_sound(self):
+        """Sound of the next chunk, or None at the end of the track"""
+        source = self.source
+        frames = min(self.chunk_frames, int((len(self.audio_data) - source.position) / source.step))
+        if frames <= 0:
+            source.position = len(self.audio_data)
+            return None
+        block = self._block[:frames]
+        block[:] = 0.0
+        source.render(block, frames)
+        np.clip(block, -1.0, 1.0, out=block)
+        block *= 32767.0
+        sound = pygame.mixer.Sound(buffer=np.zeros(frames * self.channels, dtype=np.int16))
+        pcm = pygame.sndarray.samples(sound).reshape(frames, self.channels)
+        for channel in range(self.channels):
+            pcm[:, channel] = block
+        return sound
+    
+    def play(self, seconds=0.0):
+        self.channel.stop()
+        self.source.position = seconds * self.sample_rate
+        sound = self._next_sound()
+        self.channel.set_volume(self.volume)
+        if sound is not None:
+            self.channel.play(sound)
+        self.cued = True
+        self.start = seconds
+        self.elapsed = 0.0
+        self.resumed = time.perf_counter()
+        self.playing = True
+        self.paused = False
+        self.feed()
+    
+    def feed(self):
+        """Keep the next chunk queued behind the one playing; called from the GUI timer"""
+        if not self.playing or self.paused or self.exhausted:
             return
-            
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        
-        # Set up colors
-        background_color = QColor(43, 43, 43)  # Dark gray
-        waveform_color = QColor(0, 255, 127)   # Green
-        position_color = QColor(255, 255, 0)   # Yellow
-        
-        # Fill background
-        painter.fillRect(self.rect(), background_color)
-        
-        # Calculate dimensions
-        width = self.width()
-        height = self.height()
-        
-        # Downsample for display
-        downsample_factor = max(1, len(self.audio_data) // width)
-        display_data = self.audio_data[::downsample_factor]
-        
-        # Normalize data
-        if len(display_data) > 0:
-            max_val = np.max(np.abs(display_data))
-            if max_val > 0:
-                display_data = display_data / max_val
-        
-        # Draw waveform
-        painter.setPen(QPen(waveform_color, 1))
-        
-        for i in range(min(len(display_data), width)):
-            x = i
-            y_center = height // 2
-            amplitude = int(display_data[i] * (height // 2 - 10))
-            painter.drawLine(x, y_center - amplitude, x, y_center + amplitude)
-        
-        # Draw position indicator
-        if self.duration > 0:
-            position_x = int((self.current_position / self.duration) * width)
-            painter.setPen(QPen(position_color, 2))
-            painter.drawLine(position_x, 0, position_x, height)
+        if not self.channel.get_busy():
+            # The timer fell a whole chunk behind: carry on from where the
+            # sound stopped and restart the clock there
+            self.play(self.source.position / self.sample_rate)
+        elif self.channel.get_queue() is None:
+            sound = self._next_sound()
+            if sound is not None:
+                self.channel.queue(sound)
+    
+    def pause(self):
+        if self.playing and not self.paused:
+            self.channel.pause()
+            self.elapsed += time.perf_counter() - self.resumed
+            self.resumed = None
+            self.paused = True
+    
+    def resume(self):
+        if self.paused:
+            if not self.cued:
+                # Seeked while paused
+                self.play(self.start)
+                return
+            self.channel.unpause()
+            self.resumed = time.perf_counter()
+            self.paused = False
+            self.feed()
+    
+    def seek(self, seconds):
+        if self.paused:
+            self.channel.stop()
+            self.cued = False
+            self.start = seconds
+            self.elapsed = 0.0
+        else:
+            self.play(seconds)
+    
+    def set_volume(self, volume):
+        self.volume = volume
+        self.channel.set_volume(volume)
+    
+    def stop(self):
+        self.channel.stop()
+        self.cued = False
+        self.playing = False
+        self.paused = False
+        self.resumed = None
+
+class EngineDeck(EngineDeckStream):
+    """One deck mixed by a LocalEngine, for the outputs pygame does not
+    drive (see output.py); same interface as SoundDeck"""
+    
+    def __init__(self, engine, deck, audio_data, sample_rate, volume=1.0):
+        super().__init__(engine, deck, audio_data, sample_rate, volume)
+        self.started = False
+        self.paused = False
+    
+    @property
+    def finished(self):
+        return self.started and not self.paused and not self.playing
+    
+    def play(self, seconds=0.0):
+        self.start_playback()
+        if seconds:
+            self.seek(seconds)
+        self.started = True
+        self.paused = False
+    
+    def feed(self):
+        pass  # the engine's output pulls its own blocks
+    
+    def pause(self):
+        super().pause()
+        self.paused = True
+    
+    def resume(self):
+        super().resume()
+        self.paused = False
 
 class MP3Player(QMainWindow):
-    def __init__(self):
+    def __init__(self, compact=False, decks=2, latency_ms=None, output=None):
         super().__init__()
         self.setWindowTitle("Dual MP3 Player with Waveform")
         self.setGeometry(100, 100, 1200, 800)
         
-        # Initialize pygame mixer
-        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+        # Decks play on pygame mixer channels, or with an ``output`` (the
+        # null/file sink) through one mixer engine
+        self.engine = None
+        if output is not None:
+            self.engine = LocalEngine(max_decks=decks, latency_ms=latency_ms or 40.0, output=output)
+        else:
+            # Initialize pygame mixer, one reserved channel per deck
+            buffer = 512 if latency_ms is None else block_size_for_latency(44100, latency_ms)
+            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=buffer)
+            pygame.mixer.set_num_channels(max(decks, pygame.mixer.get_num_channels()))
+            pygame.mixer.set_reserved(decks)
+        
+        # Compact mode keeps decoded PCM as int16, half the memory of float32
+        self.sample_dtype = 'int16' if compact else 'float32'
+        
+        # Shared decode pool; a new load for a deck cancels the old one
+        self.loader = LoaderPool()
+        self.loader.track_ready.connect(self.on_track_loaded)
+        self.loader.failed.connect(self.on_track_failed)
         
-        # Audio data storage
-        self.track1_data = None
-        self.track1_sr = None
-        self.track1_path = None
-        self.track2_data = None
-        self.track2_sr = None
-        self.track2_path = None
+        # Per-deck state and widgets (see decks.py)
+        self.decks = DeckManager(self, decks)
         
-        # Audio processing threads
-        self.track1_processor = None
-        self.track2_processor = None
+        # Optional phone remote and song requests (see remote.py)
+        self.remote = None
         
         # Setup UI
         self.setup_ui()
@@ -125,12 +222,6 @@ class MP3Player(QMainWindow):
         self.timer.timeout.connect(self.update_position)
         self.timer.start(100)  # Update every 100ms
         
-        # Track states
-        self.track1_playing = False
-        self.track2_playing = False
-        self.track1_paused = False
-        self.track2_paused = False
-        
     def setup_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -138,120 +229,8 @@ class MP3Player(QMainWindow):
         # Main layout
         main_layout = QVBoxLayout(central_widget)
         
-        # Create splitter for top and bottom sections
-        splitter = QSplitter(Qt.Vertical)
-        main_layout.addWidget(splitter)
-        
-        # Top section - Track 1
-        top_widget = QWidget()
-        top_layout = QVBoxLayout(top_widget)
-        
-        # Track 1 controls
-        track1_controls = QHBoxLayout()
-        
-        self.track1_load_btn = QPushButton("Load Track 1")
-        self.track1_load_btn.clicked.connect(lambda: self.load_track(1))
-        track1_controls.addWidget(self.track1_load_btn)
-        
-        self.track1_play_btn = QPushButton("Play")
-        self.track1_play_btn.clicked.connect(lambda: self.play_track(1))
-        self.track1_play_btn.setEnabled(False)
-        track1_controls.addWidget(self.track1_play_btn)
-        
-        self.track1_pause_btn = QPushButton("Pause")
-        self.track1_pause_btn.clicked.connect(lambda: self.pause_track(1))
-        self.track1_pause_btn.setEnabled(False)
-        track1_controls.addWidget(self.track1_pause_btn)
-        
-        self.track1_stop_btn = QPushButton("Stop")
-        self.track1_stop_btn.clicked.connect(lambda: self.stop_track(1))
-        self.track1_stop_btn.setEnabled(False)
-        track1_controls.addWidget(self.track1_stop_btn)
-        
-        track1_controls.addStretch()
-        
-        # Track 1 volume control
-        track1_controls.addWidget(QLabel("Volume:"))
-        self.track1_volume_slider = QSlider(Qt.Horizontal)
-        self.track1_volume_slider.setRange(0, 100)
-        self.track1_volume_slider.setValue(70)
-        self.track1_volume_slider.valueChanged.connect(lambda: self.set_volume(1))
-        track1_controls.addWidget(self.track1_volume_slider)
-        
-        top_layout.addLayout(track1_controls)
-        
-        # Track 1 waveform
-        self.track1_waveform = WaveformWidget()
-        top_layout.addWidget(self.track1_waveform)
-        
-        # Track 1 progress
-        track1_progress_layout = QHBoxLayout()
-        self.track1_progress_bar = QProgressBar()
-        self.track1_progress_bar.setRange(0, 100)
-        track1_progress_layout.addWidget(self.track1_progress_bar)
-        
-        self.track1_time_label = QLabel("00:00 / 00:00")
-        track1_progress_layout.addWidget(self.track1_time_label)
-        
-        top_layout.addLayout(track1_progress_layout)
-        
-        # Bottom section - Track 2
-        bottom_widget = QWidget()
-        bottom_layout = QVBoxLayout(bottom_widget)
-        
-        # Track 2 controls
-        track2_controls = QHBoxLayout()
-        
-        self.track2_load_btn = QPushButton("Load Track 2")
-        self.track2_load_btn.clicked.connect(lambda: self.load_track(2))
-        track2_controls.addWidget(self.track2_load_btn)
-        
-        self.track2_play_btn = QPushButton("Play")
-        self.track2_play_btn.clicked.connect(lambda: self.play_track(2))
-        self.track2_play_btn.setEnabled(False)
-        track2_controls.addWidget(self.track2_play_btn)
-        
-        self.track2_pause_btn = QPushButton("Pause")
-        self.track2_pause_btn.clicked.connect(lambda: self.pause_track(2))
-        self.track2_pause_btn.setEnabled(False)
-        track2_controls.addWidget(self.track2_pause_btn)
-        
-        self.track2_stop_btn = QPushButton("Stop")
-        self.track2_stop_btn.clicked.connect(lambda: self.stop_track(2))
-        self.track2_stop_btn.setEnabled(False)
-        track2_controls.addWidget(self.track2_stop_btn)
-        
-        track2_controls.addStretch()
-        
-        # Track 2 volume control
-        track2_controls.addWidget(QLabel("Volume:"))
-        self.track2_volume_slider = QSlider(Qt.Horizontal)
-        self.track2_volume_slider.setRange(0, 100)
-        self.track2_volume_slider.setValue(70)
-        self.track2_volume_slider.valueChanged.connect(lambda: self.set_volume(2))
-        track2_controls.addWidget(self.track2_volume_slider)
-        
-        bottom_layout.addLayout(track2_controls)
-        
-        # Track 2 waveform
-        self.track2_waveform = WaveformWidget()
-        bottom_layout.addWidget(self.track2_waveform)
-        
-        # Track 2 progress
-        track2_progress_layout = QHBoxLayout()
-        self.track2_progress_bar = QProgressBar()
-        self.track2_progress_bar.setRange(0, 100)
-        track2_progress_layout.addWidget(self.track2_progress_bar)
-        
-        self.track2_time_label = QLabel("00:00 / 00:00")
-        track2_progress_layout.addWidget(self.track2_time_label)
-        
-        bottom_layout.addLayout(track2_progress_layout)
-        
-        # Add widgets to splitter
-        splitter.addWidget(top_widget)
-        splitter.addWidget(bottom_widget)
-        splitter.setSizes([400, 400])  # Equal split
+        # One panel per deck, stacked in a splitter
+        main_layout.addWidget(self.decks.build())
         
         # Global controls
         global_controls = QHBoxLayout()
@@ -266,6 +245,10 @@ class MP3Player(QMainWindow):
         
         global_controls.addStretch()
         
+        # Decoded tracks and caches against the --memory-budget
+        self.memory_meter = MemoryMeter()
+        global_controls.addWidget(self.memory_meter)
+        
         main_layout.addLayout(global_controls)
         
         # Set styles
@@ -320,124 +303,175 @@ class MP3Player(QMainWindow):
             }
         """)
         
-    def load_track(self, track_num):
+    def load_track(self, deck):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, f"Load Track {track_num}", "", "Audio Files (*.mp3 *.wav *.flac *.ogg)"
+            self, f"Load Track {deck + 1}", "", "Audio Files (*.mp3 *.wav *.flac *.ogg)"
         )
         
         if file_path:
-            if track_num == 1:
-                self.track1_path = file_path
-                self.track1_processor = AudioProcessor(file_path)
-                self.track1_processor.waveform_ready.connect(
-                    lambda y, sr, path: self.on_track_loaded(1, y, sr, path)
-                )
-                self.track1_processor.start()
-            else:
-                self.track2_path = file_path
-                self.track2_processor = AudioProcessor(file_path)
-                self.track2_processor.waveform_ready.connect(
-                    lambda y, sr, path: self.on_track_loaded(2, y, sr, path)
-                )
-                self.track2_processor.start()
-    
-    def on_track_loaded(self, track_num, audio_data, sample_rate, file_path):
-        if track_num == 1:
-            self.track1_data = audio_data
-            self.track1_sr = sample_rate
-            self.track1_waveform.set_audio_data(audio_data, sample_rate)
-            self.track1_play_btn.setEnabled(True)
-            self.track1_pause_btn.setEnabled(True)
-            self.track1_stop_btn.setEnabled(True)
-        else:
-            self.track2_data = audio_data
-            self.track2_sr = sample_rate
-            self.track2_waveform.set_audio_data(audio_data, sample_rate)
-            self.track2_play_btn.setEnabled(True)
-            self.track2_pause_btn.setEnabled(True)
-            self.track2_stop_btn.setEnabled(True)
-    
-    def play_track(self, track_num):
-        if track_num == 1 and self.track1_path:
-            if self.track1_paused:
-                pygame.mixer.music.unpause()
-                self.track1_paused = False
-            else:
-                pygame.mixer.music.load(self.track1_path)
-                pygame.mixer.music.play()
-            self.track1_playing = True
-        elif track_num == 2 and self.track2_path:
-            # For track 2, we'll use a different approach since pygame.mixer only supports one track
-            # We'll simulate it by creating a separate audio stream
-            self.track2_playing = True
-    
-    def pause_track(self, track_num):
-        if track_num == 1 and self.track1_playing:
-            pygame.mixer.music.pause()
-            self.track1_paused = True
-        elif track_num == 2 and self.track2_playing:
-            self.track2_playing = False
-    
-    def stop_track(self, track_num):
-        if track_num == 1:
-            pygame.mixer.music.stop()
-            self.track1_playing = False
-            self.track1_paused = False
-        elif track_num == 2:
-            self.track2_playing = False
+            self.decks[deck].path = file_path
+            self.loader.load(deck, file_path, self.sample_dtype)
+    
+    def on_track_loaded(self, deck, audio_data, sample_rate, file_path, peaks=None):
+        self.decks.set_track(deck, audio_data, sample_rate, file_path, peaks)
+    
+    def on_track_failed(self, deck, file_path, message):
+        self.decks.panels[deck].progress_bar.setFormat("%p%")
+        self.decks.panels[deck].progress_bar.setValue(0)
+    
+    def play_track(self, deck):
+        state = self.decks[deck]
+        if not state.loaded:
+            return
+        if state.stream is None:
+            state.stream = self.create_stream(deck, state.data, state.sample_rate, self.decks.volume(deck))
+        if state.paused:
+            state.stream.resume()
+        elif not state.playing:
+            state.stream.play()
+        state.playing = True
+        state.paused = False
+    
+    def create_stream(self, deck, audio_data, sample_rate, volume):
+        if self.engine is not None:
+            return EngineDeck(self.engine, deck, audio_data, sample_rate, volume)
+        return SoundDeck(deck, audio_data, sample_rate, volume)
+    
+    def pause_track(self, deck):
+        state = self.decks[deck]
+        if state.stream is not None and state.playing:
+            state.stream.pause()
+            state.paused = True
+    
+    def stop_track(self, deck):
+        state = self.decks[deck]
+        if state.stream is not None:
+            state.stream.stop()
+            state.stream = None
+        state.playing = False
+        state.paused = False
+    
+    def seek_track(self, deck, seconds):
+        """Jump to the beat nearest ``seconds``"""
+        state = self.decks[deck]
+        if not state.loaded:
+            return
+        seconds = self.decks.snap(deck, seconds)
+        if state.stream is not None:
+            state.stream.seek(seconds)
+        self.decks.panels[deck].show_position(seconds, state.duration)
+    
+    def eject_track(self, deck):
+        """Unload a deck and release its sample and waveform buffers"""
+        self.loader.cancel(deck)
+        self.stop_track(deck)
+        if self.engine is not None:
+            self.engine.unload(deck)
+        self.decks.release(deck)
+    
+    def release_audio(self, deck):
+        """Drop the engine's copy of an idle deck the memory budget evicted"""
+        if self.engine is not None:
+            self.engine.unload(deck)
     
     def play_all(self):
-        if self.track1_path:
-            self.play_track(1)
-        if self.track2_path:
-            self.play_track(2)
+        for state in self.decks.loaded():
+            self.play_track(state.index)
     
     def stop_all(self):
-        self.stop_track(1)
-        self.stop_track(2)
+        for state in self.decks:
+            self.stop_track(state.index)
     
-    def set_volume(self, track_num):
-        volume = getattr(self, f'track{track_num}_volume_slider').value() / 100.0
-        if track_num == 1:
-            pygame.mixer.music.set_volume(volume)
+    def set_volume(self, deck):
+        state = self.decks[deck]
+        if state.stream is not None:
+            state.stream.set_volume(self.decks.volume(deck))
     
     def update_position(self):
-        if self.track1_playing and not self.track1_paused:
-            try:
-                current_time = pygame.mixer.music.get_pos() / 1000.0
-                if self.track1_data is not None and self.track1_sr is not None:
-                    duration = len(self.track1_data) / self.track1_sr
-                    
-                    # Update waveform position
-                    self.track1_waveform.set_position(current_time)
-                    
-                    # Update progress bar
-                    progress = int((current_time / duration) * 100) if duration > 0 else 0
-                    self.track1_progress_bar.setValue(progress)
-                    
-                    # Update time label
-                    current_str = self.format_time(current_time)
-                    duration_str = self.format_time(duration)
-                    self.track1_time_label.setText(f"{current_str} / {duration_str}")
-            except:
-                pass
-        
-        # For track 2, we'll simulate progress
-        if self.track2_playing and self.track2_data is not None and self.track2_sr is not None:
-            # This is a simplified simulation - in a real implementation you'd track actual playback
-            pass
-    
-    def format_time(self, seconds):
-        minutes = int(seconds // 60)
-        seconds = int(seconds % 60)
-        return f"{minutes:02d}:{seconds:02d}"
+        positions = {}
+        for state in self.decks:
+            stream = state.stream
+            if stream is None:
+                continue
+            stream.feed()
+            if stream.finished:
+                self.stop_track(state.index)
+                positions[state.index] = (state.duration, state.duration)
+            elif not stream.paused:
+                positions[state.index] = (stream.get_position(), stream.get_duration())
+        self.decks.update(positions)
+        if self.remote is not None:
+            self.remote.publish(positions)
     
     def closeEvent(self, event):
-        pygame.mixer.quit()
+        self.timer.stop()
+        if self.remote is not None:
+            self.remote.shutdown()
+        self.loader.shutdown()
+        self.decks.shutdown()
+        for state in self.decks:
+            self.stop_track(state.index)
+        if self.engine is not None:
+            # Closes the output, finishing its file
+            self.engine.shutdown()
+        else:
+            pygame.mixer.quit()
         event.accept()
 
+def output_settings(args):
+    """None for pygame's own mixer, else the null/file sink of output.py"""
+    if args.output == 'pygame' and not args.output_file:
+        return None
+    return OutputSettings('null', args.output_clock, args.output_file)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Dual MP3 Player")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="print import and first-paint timings")
+    parser.add_argument('--compact', action='store_true',
+                        help="keep decoded tracks as int16 to halve memory use")
+    parser.add_argument('--decks', type=int, default=2, choices=range(1, MAX_DECKS + 1),
+                        metavar=f"1-{MAX_DECKS}", help="number of decks to show")
+    parser.add_argument('--output', choices=('pygame', 'null'), default='pygame',
+                        help="audio output: the sound card, or no sound card")
+    parser.add_argument('--output-clock', choices=CLOCKS, default='realtime',
+                        help="with --output null, pull blocks in real time or as fast as possible")
+    parser.add_argument('--output-file', metavar='PATH',
+                        help="write the output to a WAV/FLAC file instead of the sound card (implies --output null)")
+    parser.add_argument('--latency-ms', type=float,
+                        help="mixer buffer target (default 512 frames)")
+    parser.add_argument('--memory-budget', type=float, default=DEFAULT_BUDGET_MB, metavar='MB',
+                        help="memory for decoded tracks and caches before idle decks are evicted to disk")
+    parser.add_argument('--trace', nargs='?', const='trace.json', metavar='PATH',
+                        help="record a Chrome trace of paint, decode and audio work to PATH")
+    parser.add_argument('--remote', type=int, metavar='PORT',
+                        help="serve the phone remote and song requests on this port")
+    parser.add_argument('--library', action='append', default=[], metavar='DIR',
+                        help="music directory for remote song requests (repeatable)")
+    parser.add_argument('--remote-token', metavar='TOKEN',
+                        help="token for remote transport control (default: a random one, printed at startup)")
+    return parser.parse_known_args(argv)[0]
+
 if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    shared_budget().set_limit_mb(args.memory_budget)
+    if args.trace:
+        tracing.enable(args.trace)
+        tracing.instrument_hot_paths()
+        tracing.instrument(MP3Player, 'update_position', 'gui')
+    profiler = startup.StartupProfiler(args.startup_profile)
+    profiler.mark("imports done")
+    profiler.report_imports()
     app = QApplication(sys.argv)
-    player = MP3Player()
+    profiler.mark("QApplication created")
+    player = MP3Player(compact=args.compact, decks=args.decks, latency_ms=args.latency_ms,
+                       output=output_settings(args))
+    if args.remote:
+        player.remote = RemoteControl(player, args.remote, library=args.library, token=args.remote_token)
+    profiler.mark("window constructed")
+    profiler.watch_first_paint(player)
     player.show()
+    profiler.mark("window shown")
+    # Warm librosa once the first frame is on screen so the first decode is quick
+    QTimer.singleShot(250, lambda: startup.warm_imports(profiler))
     sys.exit(app.exec_())
@@ -0,0 +1,156 @@
+"""
+Memory budget shared by every large buffer.
+
+Decoded decks, prefetched tracks, engine copies and the in-memory tile
+caches register their size with one MemoryBudget. When the total goes over
+the limit (--memory-budget), evictable entries are asked to give memory
+back in priority order: prefetched tracks first, then the tile caches
+(which reload from disk), then decks that are neither playing nor on
+screen, which swap their samples for a memory-mapped copy on disk. Within
+a priority the least recently registered entry goes first.
+
+Evictions touch widgets, so they only ever run on the GUI thread, when a
+buffer is registered there or on the meter's periodic check; size updates
+and registrations from worker threads are just counted until then.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from cache import cache_dir, file_key
+from decoders import map_wav
+
+PRIORITY_PREFETCH = 0
+PRIORITY_CACHE = 1
+PRIORITY_DECK = 2
+
+DEFAULT_BUDGET_MB = 1024
+
+MB = 1 << 20
+
+
+class _Entry:
+    __slots__ = ('nbytes', 'priority', 'evict', 'kind')
+
+    def __init__(self, nbytes, priority, evict, kind):
+        self.nbytes = nbytes
+        self.priority = priority
+        self.evict = evict
+        self.kind = kind
+
+
+class MemoryBudget:
+    """Accounts registered buffers and evicts them when over ``limit`` bytes.
+
+    ``evict`` callbacks free what they can and update or unregister their
+    own entry. Entries without one are counted but never evicted.
+    """
+
+    def __init__(self, limit=DEFAULT_BUDGET_MB * MB):
+        self.limit = limit
+        self._entries = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._enforcing = False
+
+    def set_limit_mb(self, megabytes):
+        self.limit = int(megabytes * MB)
+        self.enforce()
+
+    @property
+    def total(self):
+        return self._total
+
+    def register(self, key, nbytes, priority=PRIORITY_DECK, evict=None, kind='other'):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total -= old.nbytes
+            self._entries[key] = _Entry(int(nbytes), priority, evict, kind)
+            self._total += int(nbytes)
+        self.enforce()
+
+    def update(self, key, nbytes):
+        """New size for a registered entry; ignored if it is not registered.
+        Cheap enough for paint and worker paths: it never evicts itself"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._total += int(nbytes) - entry.nbytes
+            entry.nbytes = int(nbytes)
+
+    def unregister(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total -= entry.nbytes
+
+    def usage(self):
+        """Registered bytes per kind"""
+        usage = {}
+        with self._lock:
+            for entry in self._entries.values():
+                usage[entry.kind] = usage.get(entry.kind, 0) + entry.nbytes
+        return usage
+
+    def enforce(self):
+        """Evict until under the limit; a no-op off the GUI thread"""
+        if self._total <= self.limit or self._enforcing:
+            return
+        if threading.current_thread() is not threading.main_thread():
+            return
+        self._enforcing = True
+        try:
+            with self._lock:
+                # Stable sort keeps registration order within a priority
+                candidates = sorted(((entry.priority, key, entry.evict)
+                                     for key, entry in self._entries.items()
+                                     if entry.evict is not None and entry.nbytes > 0),
+                                    key=lambda candidate: candidate[0])
+            for _, key, evict in candidates:
+                if self._total <= self.limit:
+                    break
+                if key in self._entries:
+                    try:
+                        evict()
+                    except Exception as e:
+                        print(f"Could not free memory: {e}")
+        finally:
+            self._enforcing = False
+
+
+_budget = None
+
+
+def shared_budget():
+    global _budget
+    if _budget is None:
+        _budget = MemoryBudget()
+    return _budget
+
+
+def map_to_disk(path, audio_data):
+    """Read-only memory map holding the same samples as ``audio_data``, or None.
+
+    WAV files whose sample format matches are mapped in place; anything else
+    is written once to the PCM cache and mapped from there.
+    """
+    try:
+        if path.lower().endswith('.wav'):
+            mapped = map_wav(path, audio_data.dtype)
+            if mapped is not None and len(mapped[0]) == len(audio_data):
+                return mapped[0]
+        cached = os.path.join(cache_dir('pcm'), file_key(path, 'pcm', audio_data.dtype.str) + '.npy')
+        if not os.path.exists(cached):
+            tmp = f"{cached}.{os.getpid()}.tmp.npy"
+            np.save(tmp, np.ascontiguousarray(audio_data))
+            os.replace(tmp, cached)
+        mapped = np.load(cached, mmap_mode='r')
+    except (OSError, ValueError) as e:
+        print(f"Could not map track to disk: {e}")
+        return None
+    return mapped if len(mapped) == len(audio_data) else None
+
@@ -0,0 +1,297 @@
+"""
+Block-based deck mixer shared by the audio engines
+"""
+
+import numpy as np
+
+from effects import ParametricEQ
+
+
+class MixerDeck:
+    """Playback state for a single deck inside the mixer"""
+
+    def __init__(self, audio_data, sample_rate, output_rate):
+        self.audio_data = audio_data
+        self.sample_rate = sample_rate
+        # Source samples advanced per output sample
+        self.step = sample_rate / float(output_rate)
+        # Compact decks keep int16 PCM and are converted one block at a time
+        self.scale = 1.0 / 32768.0 if audio_data.dtype == np.int16 else 1.0
+        self._scratch = np.zeros(0, dtype=np.float32)
+        self.position = 0.0
+        self.volume = 1.0
+        self.playing = False
+        self.paused = False
+        self.peak = 0.0
+        # Crossfade envelope: current gain and its change per output frame
+        self.fade_gain = 1.0
+        self.fade_delta = 0.0
+        self._ramp = np.zeros(0, dtype=np.float32)
+        # The deck slot's EQ, kept by the Mixer across loads
+        self.eq = None
+
+    def get_position(self):
+        return self.position / self.sample_rate
+
+    def get_duration(self):
+        return len(self.audio_data) / self.sample_rate
+
+    def release(self):
+        """Drop the sample buffer; the deck renders nothing afterwards"""
+        self.audio_data = np.zeros(0, dtype=self.audio_data.dtype)
+        self.playing = False
+
+    def render(self, out, frame_count):
+        """Add this deck's next block to ``out``; returns False once finished"""
+        # Local reference: release() may swap the buffer out from another thread
+        data = self.audio_data
+        total = len(data)
+        if self.position >= total:
+            self.playing = False
+            self.peak = 0.0
+            return False
+
+        if len(self._scratch) < frame_count:
+            self._scratch = np.zeros(frame_count, dtype=np.float32)
+        gain = self.volume * self.scale
+
+        if self.step == 1.0:
+            start = int(self.position)
+            end = min(start + frame_count, total)
+            n = end - start
+            block = self._scratch[:n]
+            np.multiply(data[start:end], gain, out=block, casting='unsafe')
+        else:
+            # Linear interpolation for decks whose rate differs from the output
+            idx = self.position + np.arange(frame_count) * self.step
+            idx = idx[idx < total - 1]
+            base = idx.astype(np.int64)
+            frac = (idx - base).astype(np.float32)
+            n = len(idx)
+            block = self._scratch[:n]
+            block[:] = data[base] * (1.0 - frac) + data[base + 1] * frac
+            block *= gain
+
+        if self.eq is not None:
+            self.eq.process(block)
+        if self.fade_delta:
+            self._apply_fade(block, frame_count)
+
+        out[:n] += block
+        # A deck faded out to silence stops here and is not rendered again,
+        # so its meter drops to zero instead of holding this block's level
+        self.peak = float(np.max(np.abs(block))) if n and self.playing else 0.0
+        self.position += frame_count * self.step
+        return True
+
+    def _apply_fade(self, block, frame_count):
+        """Ramp ``block`` along the crossfade envelope; a deck faded out stops"""
+        n = len(block)
+        if len(self._ramp) < frame_count:
+            self._ramp = np.zeros(frame_count, dtype=np.float32)
+        ramp = self._ramp[:n]
+        ramp[:] = np.arange(n, dtype=np.float32)
+        ramp *= self.fade_delta
+        ramp += self.fade_gain
+        np.clip(ramp, 0.0, 1.0, out=ramp)
+        block *= ramp
+        self.fade_gain = min(1.0, max(0.0, self.fade_gain + self.fade_delta * frame_count))
+        if self.fade_delta < 0 and self.fade_gain == 0.0:
+            self.playing = False
+            self.fade_gain = 1.0
+            self.fade_delta = 0.0
+        elif self.fade_delta > 0 and self.fade_gain == 1.0:
+            self.fade_delta = 0.0
+
+
+class Mixer:
+    """Sums any number of decks, plus an optional live microphone, into one mono float32 stream"""
+
+    def __init__(self, sample_rate=44100, max_decks=8):
+        self.sample_rate = sample_rate
+        self.decks = [None] * max_decks
+        self.eqs = [ParametricEQ(sample_rate) for _ in range(max_decks)]
+        self._buffer = np.zeros(0, dtype=np.float32)
+        # Live microphone path, see effects.py
+        self.mic_chain = None
+        self.mic_volume = 1.0
+        self.mic_peak = 0.0
+        self._mic = np.zeros(0, dtype=np.float32)
+        # Raw mic samples tagged with the scored deck's time, see scoring.py
+        self.mic_tap = None
+        self.score_deck = 0
+        self._tap = np.zeros((0, 2), dtype=np.float32)
+        self._offsets = np.zeros(0, dtype=np.float32)
+        # Pending crossfade: (from deck, to deck, start in from-deck seconds, seconds)
+        self._crossfade = None
+        # Performance recording, see recorder.py: every finished block goes into
+        # this ring; with ``record_stems`` decks it is the mix, one column per
+        # deck, then the mic
+        self.record_ring = None
+        self.record_stems = 0
+        self.record_overruns = 0
+        self._stems = np.zeros((0, 0), dtype=np.float32)
+
+    def load(self, deck, audio_data, sample_rate):
+        state = MixerDeck(audio_data, sample_rate, self.sample_rate)
+        # The EQ settings belong to the deck slot; its state to the old track
+        self.eqs[deck].reset()
+        state.eq = self.eqs[deck]
+        self.decks[deck] = state
+
+    def unload(self, deck):
+        state = self.decks[deck]
+        if state is not None:
+            state.release()
+        self.decks[deck] = None
+
+    def play(self, deck):
+        state = self.decks[deck]
+        if state is not None:
+            state.position = 0.0
+            state.paused = False
+            state.fade_gain = 1.0
+            state.fade_delta = 0.0
+            state.playing = True
+
+    def pause(self, deck):
+        state = self.decks[deck]
+        if state is not None:
+            state.paused = True
+
+    def resume(self, deck):
+        state = self.decks[deck]
+        if state is not None:
+            state.paused = False
+
+    def stop(self, deck):
+        state = self.decks[deck]
+        if state is not None:
+            state.playing = False
+            state.paused = False
+            state.position = 0.0
+            state.peak = 0.0
+            state.fade_gain = 1.0
+            state.fade_delta = 0.0
+
+    def seek(self, deck, seconds):
+        state = self.decks[deck]
+        if state is not None:
+            state.position = max(0.0, min(seconds * state.sample_rate, float(len(state.audio_data))))
+
+    def crossfade(self, from_deck, to_deck, seconds, start=None):
+        """Fade ``from_deck`` out and ``to_deck`` in over ``seconds``.
+
+        The fade begins on the first block that reaches ``start`` (seconds in
+        ``from_deck``, e.g. a downbeat), or right away when ``start`` is None.
+        ``to_deck`` plays from wherever it is cued.
+        """
+        self._crossfade = (from_deck, to_deck, start, seconds)
+
+    def _start_crossfade(self, frame_count):
+        from_deck, to_deck, start, seconds = self._crossfade
+        source, target = self.decks[from_deck], self.decks[to_deck]
+        # Frames into this block at which the fade starts, so it lands on the sample
+        lead = 0.0
+        if start is not None and source is not None and source.playing:
+            lead = (start * source.sample_rate - source.position) / source.step
+            if source.paused or lead >= frame_count:
+                return
+            lead = max(0.0, lead)
+        self._crossfade = None
+        delta = 1.0 / max(1.0, seconds * self.sample_rate)
+        if source is not None and source.playing:
+            source.fade_gain = 1.0 + delta * lead
+            source.fade_delta = -delta
+        if target is not None:
+            target.fade_gain = -delta * lead
+            target.fade_delta = delta
+            target.paused = False
+            target.playing = True
+
+    def set_volume(self, deck, volume):
+        state = self.decks[deck]
+        if state is not None:
+            state.volume = volume
+
+    def set_eq(self, deck, band, gain_db, frequency=None, q=None):
+        """Redesign one EQ band of ``deck``; runs on the caller's thread, never the callback's"""
+        self.eqs[deck].set_band(band, gain_db, frequency, q)
+
+    def set_mic_volume(self, volume):
+        self.mic_volume = volume
+
+    def _write_tap(self, voice, frame_count):
+        """Hand the dry mic block to the scoring worker; drops it if the ring is full"""
+        tap = self._tap[:frame_count]
+        tap[:, 0] = voice
+        state = self.decks[self.score_deck]
+        if state is not None and state.playing and not state.paused:
+            np.add(self._offsets[:frame_count], state.get_position(), out=tap[:, 1])
+        else:
+            tap[:, 1] = -1.0
+        self.mic_tap.write(tap)
+
+    def render(self, frame_count, mic=None):
+        """Mix the next ``frame_count`` frames of every playing deck and the mic block"""
+        if len(self._buffer) < frame_count:
+            self._buffer = np.zeros(frame_count, dtype=np.float32)
+            self._mic = np.zeros(frame_count, dtype=np.float32)
+            self._tap = np.zeros((frame_count, 2), dtype=np.float32)
+            self._offsets = (np.arange(frame_count) / self.sample_rate).astype(np.float32)
+        out = self._buffer[:frame_count]
+        out.fill(0.0)
+
+        if self._crossfade is not None:
+            self._start_crossfade(frame_count)
+
+        ring = self.record_ring
+        stems = None
+        if ring is not None and self.record_stems:
+            if self._stems.shape != (self.record_stems + 2, len(self._buffer)):
+                self._stems = np.zeros((self.record_stems + 2, len(self._buffer)), dtype=np.float32)
+            stems = self._stems[:, :frame_count]
+            stems.fill(0.0)
+
+        if mic is not None:
+            # Copy first: the input buffer is read-only and the chain works in place
+            voice = self._mic[:frame_count]
+            voice[:len(mic)] = mic[:frame_count]
+            voice[len(mic):] = 0.0
+            if self.mic_tap is not None:
+                self._write_tap(voice, frame_count)
+            if self.mic_chain is not None:
+                self.mic_chain.process(voice)
+            voice *= self.mic_volume
+            out += voice
+            self.mic_peak = float(np.max(np.abs(voice)))
+            if stems is not None:
+                stems[-1] = voice
+
+        for i, state in enumerate(self.decks):
+            if state is None or not state.playing:
+                continue
+            if state.paused:
+                state.peak = 0.0
+                continue
+            if stems is not None and i < self.record_stems:
+                # Rendered on its own first so the stem can be kept
+                state.render(stems[i + 1], frame_count)
+                out += stems[i + 1]
+            else:
+                state.render(out, frame_count)
+
+        if ring is not None:
+            self._record(ring, out, stems, frame_count)
+        return out
+
+    def _record(self, ring, out, stems, frame_count):
+        """Hand the finished block to the recorder; a block that does not fit is dropped whole"""
+        if ring.free() < frame_count:
+            self.record_overruns += 1
+            return
+        if stems is None:
+            ring.write(out)
+        else:
+            stems[0] = out
+            ring.write(stems.T)
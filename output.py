@@ -0,0 +1,300 @@
+"""
+Audio output backends.
+
+Every output pulls mono float32 blocks from a callback on its own clock, so
+the players' callback code does not care where the samples go:
+
+- ``pyaudio``: a PortAudio stream on the sound card, full duplex when the
+  live microphone is on,
+- ``pygame``: an SDL audio device opened through pygame,
+- ``null``: no sound card at all. A thread pulls blocks on a real-time
+  clock, or as fast as the callback renders them (``clock='fast'``), and
+  optionally writes them to a WAV or FLAC file. Benchmarks and soak tests
+  can also drive it block by block with pump().
+
+The callback is ``callback(in_block, frame_count, time_info, xrun)``:
+``in_block`` holds the captured input (or None), ``time_info`` has the
+PortAudio timestamp keys and ``xrun`` is true when the output fell behind.
+It returns ``frame_count`` float32 samples, or None once it has finished,
+after which it is not called again until the output is restarted.
+
+Outputs hold device resources (a PortAudio instance, an SDL device, a
+thread or a file) until close(); unclosed_outputs() counts the ones still
+open, which the soak test (soak_engine.py) watches for leaks. close() also
+drops the callback: it is usually a bound method of the output's owner,
+and the reference cycle would keep the owner's sample buffers alive until
+the cyclic garbage collector happened to run.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+BACKENDS = ('pyaudio', 'pygame', 'null')
+CLOCKS = ('realtime', 'fast')
+
+# Outputs opened and not closed yet; a count that keeps growing is a leak
+# (on PyAudio, a PortAudio instance that is never terminated)
+_unclosed = 0
+_count_lock = threading.Lock()
+
+
+def unclosed_outputs():
+    return _unclosed
+
+
+def _count(delta):
+    global _unclosed
+    with _count_lock:
+        _unclosed += delta
+
+
+class OutputSettings:
+    """Backend choice from the command line; plain values so it pickles into the engine process"""
+
+    def __init__(self, backend='pyaudio', clock='realtime', path=None):
+        self.backend = backend
+        self.clock = clock
+        self.path = path
+
+
+def open_output(settings, sample_rate, block_size, callback, input=False):
+    """Unstarted output for ``settings`` (None: the sound card through PyAudio)"""
+    settings = settings or OutputSettings()
+    if settings.backend == 'pyaudio':
+        return PyAudioOutput(sample_rate, block_size, callback, input)
+    if input:
+        raise ValueError(f"The {settings.backend} output has no microphone input; use --mic-wav")
+    if settings.backend == 'pygame':
+        return PygameOutput(sample_rate, block_size, callback)
+    if settings.backend == 'null':
+        return NullOutput(sample_rate, block_size, callback, settings.clock, settings.path)
+    raise ValueError(f"Unknown audio output: {settings.backend}")
+
+
+class PyAudioOutput:
+    """PortAudio stream, optionally full duplex"""
+
+    def __init__(self, sample_rate, block_size, callback, input=False):
+        import pyaudio
+
+        self._pyaudio = pyaudio
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.callback = callback
+        self.input = input
+        self.output_latency = 0.0
+        self.input_latency = 0.0
+        self.p = pyaudio.PyAudio()
+        self.stream = None
+        _count(1)
+
+    @property
+    def running(self):
+        return self.stream is not None and self.stream.is_active()
+
+    def start(self):
+        pyaudio = self._pyaudio
+        xrun_flags = pyaudio.paOutputUnderflow | pyaudio.paInputOverflow
+        callback = self.callback
+
+        def stream_callback(in_data, frame_count, time_info, status):
+            mic = np.frombuffer(in_data, dtype=np.float32) if in_data is not None else None
+            out = callback(mic, frame_count, time_info, bool(status & xrun_flags))
+            if out is None:
+                return (b'\x00' * frame_count * 4, pyaudio.paComplete)
+            return (out.tobytes(), pyaudio.paContinue)
+
+        self.stream = self.p.open(
+            format=pyaudio.paFloat32,
+            channels=1,
+            rate=self.sample_rate,
+            output=True,
+            input=self.input,
+            stream_callback=stream_callback,
+            frames_per_buffer=self.block_size
+        )
+        self.output_latency = self.stream.get_output_latency()
+        if self.input:
+            self.input_latency = self.stream.get_input_latency()
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        self.stop()
+        self.callback = None
+        if self.p is not None:
+            self.p.terminate()
+            self.p = None
+            _count(-1)
+
+
+class PygameOutput:
+    """SDL audio device through pygame's callback API"""
+
+    def __init__(self, sample_rate, block_size, callback):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.callback = callback
+        self.output_latency = block_size / sample_rate
+        self.input_latency = 0.0
+        self.device = None
+        self._finished = False
+        self._start = 0.0
+        self.closed = False
+        _count(1)
+
+    def start(self):
+        import pygame._sdl2.sdl2 as sdl2
+        from pygame._sdl2 import audio
+
+        sdl2.init_subsystem(sdl2.INIT_AUDIO)
+        names = audio.get_audio_device_names(False)
+        if not names:
+            raise RuntimeError("No SDL audio output device")
+        self._finished = False
+        self._start = time.perf_counter()
+        self.device = audio.AudioDevice(
+            devicename=names[0],
+            iscapture=False,
+            frequency=self.sample_rate,
+            audioformat=audio.AUDIO_F32,
+            numchannels=1,
+            chunksize=self.block_size,
+            allowed_changes=0,
+            callback=self._fill
+        )
+        self.device.pause(0)
+
+    @property
+    def running(self):
+        return self.device is not None and not self._finished
+
+    def _fill(self, device, memory):
+        frame_count = len(memory) // 4
+        out = None
+        if not self._finished:
+            now = time.perf_counter() - self._start
+            out = self.callback(None, frame_count, {'current_time': now,
+                                                    'output_buffer_dac_time': now + self.output_latency},
+                                False)
+        if out is None:
+            self._finished = True
+            memory[:] = bytes(len(memory))
+        else:
+            memory[:] = out.tobytes()
+
+    def stop(self):
+        if self.device is not None:
+            self.device.pause(1)
+            self.device.close()
+            self.device = None
+
+    def close(self):
+        self.stop()
+        self.callback = None
+        if not self.closed:
+            self.closed = True
+            _count(-1)
+
+
+class NullOutput:
+    """No sound card: blocks are pulled on a real-time or free-running clock and
+    optionally written to ``path``"""
+
+    def __init__(self, sample_rate, block_size, callback, clock='realtime', path=None):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.callback = callback
+        self.clock = clock
+        self.path = path
+        self.output_latency = block_size / sample_rate
+        self.input_latency = 0.0
+        # Frames pulled so far; the clock of a free-running output
+        self.frames = 0
+        self.finished = False
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.closed = False
+        _count(1)
+
+    def _open_file(self):
+        if self.path and self._file is None:
+            import soundfile as sf
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = sf.SoundFile(self.path, 'w', self.sample_rate, 1)
+
+    def pump(self, blocks=1, xrun=False):
+        """Pull ``blocks`` blocks on the caller's thread; False once the callback has finished"""
+        self._open_file()
+        period = self.block_size / self.sample_rate
+        for _ in range(blocks):
+            if self.finished:
+                return False
+            now = self.frames / self.sample_rate
+            out = self.callback(None, self.block_size, {'current_time': now,
+                                                        'output_buffer_dac_time': now + period},
+                                xrun)
+            if out is None:
+                self.finished = True
+                return False
+            if self._file is not None:
+                self._file.write(out)
+            self.frames += self.block_size
+        return True
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._open_file()
+        self._stop.clear()
+        self.finished = False
+        self._thread = threading.Thread(target=self._run, name="null output", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        period = self.block_size / self.sample_rate
+        due = time.perf_counter()
+        while not self._stop.is_set():
+            xrun = False
+            if self.clock == 'realtime':
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    if self._stop.wait(wait):
+                        break
+                elif wait < -period:
+                    # Fell a whole block behind, as a sound card would underrun
+                    xrun = True
+                    due = time.perf_counter()
+                due += period
+            if not self.pump(1, xrun):
+                break
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.callback = None
+        if not self.closed:
+            self.closed = True
+            _count(-1)
@@ -0,0 +1,119 @@
+"""
+Performance recording.
+
+The audio callback never touches the disk: the mixer copies each finished
+block (the mix, plus one stem per deck and the mic when stems are on) into
+a lock-free ring, and a Recorder thread drains the ring in batches of
+BATCH_SECONDS into WAV or FLAC files. A block that finds the ring full is
+dropped whole and counted as a recorder overrun, so a slow disk costs
+audio in the recording, never in the speakers.
+"""
+
+import os
+import threading
+import time
+
+# Frames gathered before each write
+BATCH_SECONDS = 0.5
+
+# Longest wait for the engine to let go of the ring after stop; only reached
+# when its output is no longer running callbacks
+STOP_TIMEOUT = 2.0
+
+FORMATS = ('wav', 'flac')
+
+
+def stem_paths(path, stems):
+    """Files for the mix, then each deck stem and the mic"""
+    if not stems:
+        return [path]
+    base, extension = os.path.splitext(path)
+    return ([path] + [f"{base}-deck{deck + 1}{extension}" for deck in range(stems)]
+            + [f"{base}-mic{extension}"])
+
+
+def default_path(directory, file_format='wav'):
+    return os.path.join(directory, time.strftime("performance-%Y%m%d-%H%M%S") + '.' + file_format)
+
+
+class Recorder:
+    """Records an engine's output (LocalEngine or EngineClient) on a writer thread"""
+
+    def __init__(self, engine, path, stems=0):
+        self.engine = engine
+        self.path = path
+        self.stems = stems
+        self.paths = stem_paths(path, stems)
+        self.frames = 0
+        self.error = None
+        self.ring = None
+        self._files = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def seconds(self):
+        return self.frames / self.engine.sample_rate
+
+    @property
+    def overruns(self):
+        return self.engine.record_overruns()
+
+    @property
+    def recording(self):
+        return self._thread is not None
+
+    def start(self):
+        import soundfile as sf
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._files = [sf.SoundFile(path, 'w', self.engine.sample_rate, 1) for path in self.paths]
+        self.ring = self.engine.start_recording(self.stems)
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        batch = int(BATCH_SECONDS * self.engine.sample_rate)
+        while not self._stop.is_set():
+            if self.ring.available() < batch:
+                self._stop.wait(BATCH_SECONDS / 4)
+                continue
+            self._write(self.ring.read(batch))
+
+    def _write(self, records):
+        if self.error is not None or len(records) == 0:
+            return
+        try:
+            for channel, f in enumerate(self._files):
+                f.write(records[:, channel])
+        except Exception as e:
+            self.error = str(e)
+            print(f"Recording failed: {e}")
+            return
+        self.frames += len(records)
+
+    def stop(self):
+        """Stop the engine writing, flush what is left and close the files"""
+        if self._thread is None:
+            return
+        self.engine.stop_recording()
+        # The last block may still be on its way into the ring until the
+        # engine confirms its callback has detached from it
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while not self.engine.recording_detached():
+            if time.monotonic() > deadline:
+                print("Recording stopped without the engine confirming; the end may be cut")
+                break
+            time.sleep(0.005)
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._write(self.ring.read())
+        for f in self._files:
+            f.close()
+        self._files = []
+        self.ring.close()
+        self.ring.unlink()
+        self.ring = None
@@ -0,0 +1,599 @@
+"""
+Remote control and song-request server.
+
+An optional HTTP + WebSocket server, built on asyncio from the standard
+library, that runs on its own thread inside the player process. Guests
+search the catalog and request songs from their phones; the host, holding
+the token, also gets transport control. Without --remote-token a random
+token is generated and printed at startup, so transport control is never
+open to everyone on the network. Each guest (by IP address) may have
+MAX_REQUESTS_PER_CLIENT songs waiting and the queue holds at most
+MAX_QUEUE; requests beyond that get 429 Too Many Requests.
+
+The server never touches the player or the audio engine directly:
+
+- commands are handed to the GUI thread through a queued Qt signal
+  (RemoteControl.command), so they run exactly like button clicks,
+- the GUI timer publishes a snapshot of positions, lyrics and the queue
+  with ``loop.call_soon_threadsafe``, which costs the GUI next to nothing,
+- each WebSocket client only ever holds the newest snapshot, so a slow
+  phone drops updates instead of piling them up.
+
+HTTP API (JSON bodies and responses):
+
+    GET  /                     request page for phones
+    GET  /api/search?q=...     catalog search
+    GET  /api/state            latest snapshot
+    GET  /api/queue            request queue
+    POST /api/queue            {"id": n, "singer": "..."}
+    POST /api/transport        {"action": "play", "deck": 0, "value": 0.0}  (host)
+    GET  /ws                   push feed; accepts the same messages as above
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import secrets
+import struct
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from beats import library_files
+
+MAX_LINE = 16 * 1024
+MAX_HEADERS = 100
+MAX_BODY = 64 * 1024
+SEARCH_LIMIT = 50
+MAX_QUEUE = 200
+MAX_REQUESTS_PER_CLIENT = 3
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Actions that need the host token
+TRANSPORT_ACTIONS = ('play', 'pause', 'stop', 'seek', 'volume', 'next')
+
+_LRC_TAG = re.compile(r'\[(\d+):(\d+(?:\.\d+)?)\]')
+
+INDEX_HTML = b"""<!doctype html>
+<html><head><meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Karaoke Requests</title>
+<style>
+body { background: #2b2b2b; color: white; font-family: sans-serif; margin: 1em; }
+input, button { font-size: 1em; padding: 0.4em; }
+li { margin: 0.3em 0; }
+#lyric { font-size: 1.4em; color: #ffd54f; min-height: 1.5em; }
+</style></head><body>
+<div id="now"></div><div id="lyric"></div><div id="next"></div>
+<h3>Request a song</h3>
+<input id="q" placeholder="Search"> <input id="singer" placeholder="Your name">
+<ul id="results"></ul>
+<h3>Queue</h3><ol id="queue"></ol>
+<script>
+const $ = id => document.getElementById(id);
+$('q').oninput = async () => {
+  const r = await fetch('/api/search?q=' + encodeURIComponent($('q').value));
+  const items = (await r.json()).results;
+  $('results').innerHTML = '';
+  for (const item of items) {
+    const li = document.createElement('li');
+    const b = document.createElement('button');
+    b.textContent = item.title;
+    b.onclick = () => fetch('/api/queue', {method: 'POST',
+      body: JSON.stringify({id: item.id, singer: $('singer').value})});
+    li.appendChild(b); $('results').appendChild(li);
+  }
+};
+function connect() {
+  const ws = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws');
+  ws.onmessage = e => {
+    const s = JSON.parse(e.data);
+    if (!s.decks) return;
+    const d = s.decks[0] || {};
+    $('now').textContent = d.title ? d.title + ' ' + Math.floor(d.position) + 's' : '';
+    $('lyric').textContent = s.lyric || '';
+    $('next').textContent = s.next_lyric || '';
+    $('queue').innerHTML = s.queue.map(q => '<li>' + q.title.replace(/</g, '&lt;') +
+      (q.singer ? ' (' + q.singer.replace(/</g, '&lt;') + ')' : '') + '</li>').join('');
+  };
+  ws.onclose = () => setTimeout(connect, 2000);
+}
+connect();
+</script></body></html>
+"""
+
+
+class Lyrics:
+    """Timed lyric lines from an LRC file"""
+
+    def __init__(self, times, lines):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.lines = list(lines)
+
+    def line_at(self, seconds):
+        """(current line, next line) at ``seconds``; empty strings where there is none"""
+        i = int(np.searchsorted(self.times, seconds, side='right')) - 1
+        current = self.lines[i] if i >= 0 else ''
+        upcoming = self.lines[i + 1] if i + 1 < len(self.lines) else ''
+        return current, upcoming
+
+    @classmethod
+    def read(cls, path):
+        entries = []
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                tags = _LRC_TAG.findall(line)
+                if not tags:
+                    continue  # metadata such as [ar:...] or plain text
+                text = _LRC_TAG.sub('', line).strip()
+                entries.extend((int(m) * 60 + float(s), text) for m, s in tags)
+        entries.sort(key=lambda e: e[0])
+        return cls([e[0] for e in entries], [e[1] for e in entries])
+
+    @classmethod
+    def for_track(cls, audio_path):
+        """Lyrics from the .lrc file next to ``audio_path``, or None"""
+        path = os.path.splitext(audio_path)[0] + '.lrc'
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls.read(path)
+        except OSError as e:
+            print(f"Could not read lyrics: {e}")
+            return None
+
+
+class Catalog:
+    """Searchable list of the audio files in the library directories"""
+
+    def __init__(self, paths):
+        self.entries = []
+        self._keys = []
+        for path in library_files(paths):
+            title = os.path.splitext(os.path.basename(path))[0]
+            self.entries.append({'id': len(self.entries), 'title': title, 'path': path})
+            self._keys.append(title.lower())
+
+    def get(self, entry_id):
+        try:
+            entry_id = int(entry_id)
+        except (TypeError, ValueError):
+            return None
+        return self.entries[entry_id] if 0 <= entry_id < len(self.entries) else None
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Entries whose title contains every word of ``query``"""
+        words = query.lower().split()
+        results = []
+        for entry, key in zip(self.entries, self._keys):
+            if all(word in key for word in words):
+                results.append({'id': entry['id'], 'title': entry['title']})
+                if len(results) >= limit:
+                    break
+        return results
+
+
+def ws_frame(payload, opcode=1):
+    """Unmasked server-to-client WebSocket frame"""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
+
+
+async def read_ws_frame(reader):
+    """(opcode, payload) of the next frame, unmasked"""
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_BODY:
+        raise ValueError("WebSocket frame too large")
+    mask = await reader.readexactly(4) if head[1] & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask and length:
+        key = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+    return opcode, payload
+
+
+class _Subscriber:
+    """One WebSocket client; only the newest pushed frame is kept"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = None
+        self.closed = False
+        self.wake = asyncio.Event()
+        # One writer at a time, so replies and pushes both wait for the socket
+        self.lock = asyncio.Lock()
+
+    def push(self, frame):
+        self.pending = frame
+        self.wake.set()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+
+    async def pump(self):
+        try:
+            while True:
+                await self.wake.wait()
+                self.wake.clear()
+                if self.closed:
+                    return
+                frame, self.pending = self.pending, None
+                if frame is not None:
+                    await self.send(frame)
+        except ConnectionError:
+            pass
+
+    async def send(self, frame):
+        """Write ``frame`` and wait until the socket has taken it"""
+        async with self.lock:
+            self.writer.write(frame)
+            await self.writer.drain()
+
+
+class RemoteServer:
+    """asyncio HTTP/WebSocket server on a background thread.
+
+    ``on_command(action, args)`` is called on the server thread for every
+    accepted command and must not block; RemoteControl turns it into a
+    queued Qt signal. Enqueued songs carry the requesting ``client``, which
+    is handed back to dequeued() once the song leaves the queue.
+    """
+
+    def __init__(self, host='0.0.0.0', port=8765, library=(), on_command=None, token=None):
+        self.host = host
+        self.port = port
+        self.library = list(library)
+        self.on_command = on_command or (lambda action, args: None)
+        self.token = token or secrets.token_urlsafe(8)
+        # Songs waiting per client and in total; only touched on the loop thread
+        self._requests = {}
+        self._queued = 0
+        self.catalog = None
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._server = None
+        self._subscribers = set()
+        self._state = b'{}'
+
+    def start(self):
+        """Start serving; returns once the port is bound (or binding failed)"""
+        self._thread = threading.Thread(target=self._run, name='remote-server', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self._server is not None
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(2.0)
+
+    def dequeued(self, client):
+        """A song requested by ``client`` left the queue; safe from any thread"""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._release, client)
+
+    def _release(self, client):
+        count = self._requests.get(client, 0)
+        if count <= 1:
+            self._requests.pop(client, None)
+        else:
+            self._requests[client] = count - 1
+        if count:
+            self._queued -= 1
+
+    def publish(self, snapshot):
+        """Hand a state snapshot to the clients; safe and cheap from any thread"""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._broadcast, snapshot)
+
+    @property
+    def clients(self):
+        return len(self._subscribers)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.catalog = Catalog(self.library)
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=MAX_LINE, backlog=1024))
+        except OSError as e:
+            print(f"Remote control server could not start: {e}")
+            self._ready.set()
+            self.loop.close()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Remote control on http://{self.host}:{self.port}/ ({len(self.catalog.entries)} songs)")
+        print(f"Remote host token: {self.token}")
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            for subscriber in list(self._subscribers):
+                subscriber.close()
+                subscriber.writer.close()
+            self.loop.run_until_complete(self._server.wait_closed())
+            self.loop.close()
+
+    def _broadcast(self, snapshot):
+        state = json.dumps(snapshot).encode('utf-8')
+        if state == self._state:
+            return
+        self._state = state
+        frame = ws_frame(state)
+        for subscriber in self._subscribers:
+            subscriber.push(frame)
+
+    # Requests
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise ValueError("Bad request line")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise ValueError("Too many headers")
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY:
+            raise ValueError("Body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method, target, headers, body
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else None
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                url = urlsplit(target)
+                query = parse_qs(url.query)
+                if url.path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self._websocket(reader, writer, headers, query, client)
+                    return
+                status, content_type, payload = self._route(method, url.path, query, headers, body,
+                                                            client)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\nCache-Control: no-store\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                    + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _route(self, method, path, query, headers, body, client=None):
+        if method == 'GET' and path == '/':
+            return '200 OK', 'text/html; charset=utf-8', INDEX_HTML
+        if method == 'GET' and path == '/api/search':
+            text = query.get('q', [''])[0]
+            try:
+                limit = min(SEARCH_LIMIT, max(1, int(query.get('limit', [20])[0])))
+            except ValueError:
+                limit = 20
+            return self._json('200 OK', {'results': self.catalog.search(text, limit)})
+        if method == 'GET' and path == '/api/state':
+            return '200 OK', 'application/json', self._state
+        if method == 'GET' and path == '/api/queue':
+            return self._json('200 OK', {'queue': json.loads(self._state).get('queue', [])})
+        if method == 'POST' and path in ('/api/queue', '/api/transport'):
+            try:
+                message = json.loads(body or b'{}')
+            except ValueError:
+                return self._json('400 Bad Request', {'error': "invalid JSON"})
+            if not isinstance(message, dict):
+                return self._json('400 Bad Request', {'error': "expected an object"})
+            if path == '/api/queue':
+                message['action'] = 'enqueue'
+            status, reply = self._command(message, self._is_host(query, headers), client)
+            return self._json(status, reply)
+        return self._json('404 Not Found', {'error': "not found"})
+
+    @staticmethod
+    def _json(status, value):
+        return status, 'application/json', json.dumps(value).encode('utf-8')
+
+    def _is_host(self, query, headers):
+        token = self.token.encode('utf-8')
+        # Constant-time, so the token cannot be guessed a character at a time
+        return any(secrets.compare_digest(token, candidate.encode('utf-8'))
+                   for candidate in (query.get('token', [None])[0], headers.get('x-token'))
+                   if candidate is not None)
+
+    @staticmethod
+    def _same_origin(headers):
+        """False for a browser page from another site; clients without an Origin pass"""
+        origin = headers.get('origin')
+        if origin is None:
+            return True
+        return urlsplit(origin).netloc.lower() == headers.get('host', '').lower()
+
+    def _command(self, message, host, client=None):
+        """Validate a command and pass it on; returns (status, reply)"""
+        action = message.get('action')
+        if action == 'enqueue':
+            entry = self.catalog.get(message.get('id'))
+            if entry is None:
+                return '404 Not Found', {'error': "unknown song"}
+            if self._queued >= MAX_QUEUE:
+                return '429 Too Many Requests', {'error': "the queue is full"}
+            if self._requests.get(client, 0) >= MAX_REQUESTS_PER_CLIENT:
+                return '429 Too Many Requests', {
+                    'error': f"at most {MAX_REQUESTS_PER_CLIENT} songs per guest can wait"}
+            self._requests[client] = self._requests.get(client, 0) + 1
+            self._queued += 1
+            singer = str(message.get('singer', ''))[:40]
+            self.on_command('enqueue', {'id': entry['id'], 'title': entry['title'],
+                                        'path': entry['path'], 'singer': singer, 'client': client})
+            return '202 Accepted', {'ok': True}
+        if action in TRANSPORT_ACTIONS:
+            if not host:
+                return '403 Forbidden', {'error': "host token required"}
+            try:
+                args = {'deck': int(message.get('deck', 0)), 'value': float(message.get('value', 0.0))}
+            except (TypeError, ValueError):
+                return '400 Bad Request', {'error': "bad deck or value"}
+            self.on_command(action, args)
+            return '202 Accepted', {'ok': True}
+        return '400 Bad Request', {'error': "unknown action"}
+
+    async def _websocket(self, reader, writer, headers, query, client=None):
+        key = headers.get('sec-websocket-key')
+        if not key:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+        if not self._same_origin(headers):
+            # Another site's page in a guest's or the host's browser
+            writer.write(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('latin-1')).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        host = self._is_host(query, headers)
+        subscriber = _Subscriber(writer)
+        self._subscribers.add(subscriber)
+        subscriber.push(ws_frame(self._state))
+        pump = asyncio.ensure_future(subscriber.pump())
+        try:
+            while not pump.done():
+                opcode, payload = await read_ws_frame(reader)
+                if opcode == 0x8:
+                    await subscriber.send(ws_frame(b'', 0x8))
+                    break
+                if opcode == 0x9:
+                    await subscriber.send(ws_frame(payload, 0xA))
+                elif opcode == 0x1:
+                    try:
+                        message = json.loads(payload)
+                    except ValueError:
+                        continue
+                    if isinstance(message, dict):
+                        status, reply = self._command(message, host, client)
+                        reply['status'] = int(status.split()[0])
+                        await subscriber.send(ws_frame(json.dumps(reply).encode('utf-8')))
+        finally:
+            self._subscribers.discard(subscriber)
+            subscriber.close()
+            pump.cancel()
+
+
+class RemoteControl(QObject):
+    """Connects a RemoteServer to a player: runs remote commands on the GUI
+    thread, keeps the song request queue and publishes the playback state.
+
+    The player provides the deck handlers used by DeckManager, ``decks``,
+    ``loader`` and ``sample_dtype``, and calls publish() from its update timer.
+    """
+    command = pyqtSignal(str, object)  # emitted on the server thread, handled on the GUI thread
+
+    def __init__(self, player, port, host='0.0.0.0', library=(), token=None):
+        super().__init__()
+        self.player = player
+        self.queue = []
+        self.lyrics = {}
+        self._positions = {}
+        self.command.connect(self.on_command)
+        player.loader.track_ready.connect(self.on_track_ready)
+        self.server = RemoteServer(host, port, library, self.command.emit, token)
+        self.server.start()
+
+    def on_track_ready(self, deck, audio_data, sample_rate, file_path, peaks):
+        self.lyrics[deck] = Lyrics.for_track(file_path)
+        self._positions.pop(deck, None)
+
+    def on_command(self, action, args):
+        decks = self.player.decks
+        if action == 'enqueue':
+            self.queue.append(args)
+            self.prefetch()
+            return
+        deck = args['deck']
+        if not 0 <= deck < len(decks):
+            return
+        if action == 'next':
+            if self.queue:
+                entry = self.queue.pop(0)
+                self.server.dequeued(entry['client'])
+                decks[deck].path = entry['path']
+                self.player.loader.load(deck, entry['path'], self.player.sample_dtype)
+                self.prefetch()
+        elif action == 'play':
+            self.player.play_track(deck)
+        elif action == 'pause':
+            self.player.pause_track(deck)
+        elif action == 'stop':
+            self.player.stop_track(deck)
+        elif action == 'seek':
+            self.player.seek_track(deck, args['value'])
+        elif action == 'volume':
+            decks.panels[deck].volume_slider.setValue(int(min(max(args['value'], 0.0), 1.0) * 100))
+
+    def prefetch(self):
+        """Decode the songs at the head of the queue ahead of time"""
+        for entry in self.queue[:2]:
+            self.player.loader.prefetch(entry['path'], self.player.sample_dtype)
+
+    def publish(self, positions):
+        """Send the state to the server; ``positions`` maps playing decks to (time, duration)"""
+        self._positions.update(positions)
+        decks = []
+        for state in self.player.decks:
+            if not state.loaded:
+                self._positions.pop(state.index, None)
+            position, duration = self._positions.get(state.index, (0.0, state.duration))
+            decks.append({
+                'deck': state.index,
+                'title': os.path.splitext(os.path.basename(state.path))[0] if state.path else '',
+                'position': round(position, 1),
+                'duration': round(duration, 1),
+                'playing': state.index in positions,
+            })
+        lyrics = self.lyrics.get(0)
+        lyric, next_lyric = lyrics.line_at(decks[0]['position']) if lyrics else ('', '')
+        self.server.publish({
+            'decks': decks,
+            'lyric': lyric,
+            'next_lyric': next_lyric,
+            'queue': [{'title': e['title'], 'singer': e['singer']} for e in self.queue],
+        })
+
+    def shutdown(self):
+        self.server.stop()
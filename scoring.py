@@ -0,0 +1,399 @@
+"""
+Live singing score.
+
+The mixer copies raw microphone blocks, tagged with the scored deck's
+playback time, into a lock-free ring (Mixer.mic_tap). A ScoreWorker drains
+the ring off the audio thread, tracks pitch with a vectorized YIN detector
+and compares it against a reference melody that is computed once per track
+(from a guide vocal/backing track or a MIDI file) and cached on disk.
+"""
+
+import os
+import struct
+import time
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from cache import cache_dir, file_key
+from decoders import load_audio
+
+# Seconds of silence in the reference that separate two phrases
+PHRASE_GAP = 0.3
+
+
+class YinDetector:
+    """YIN fundamental-frequency estimator working on batches of frames"""
+
+    def __init__(self, sample_rate, window=2048, fmin=80.0, fmax=1000.0, threshold=0.15):
+        self.sample_rate = sample_rate
+        self.window = window
+        self.threshold = threshold
+        self.tau_min = max(2, int(sample_rate / fmax))
+        self.tau_max = min(int(sample_rate / fmin), window // 2)
+        # Integration window; the frame must cover it shifted by tau_max
+        self.span = window - self.tau_max - 1
+        self.fft_size = 1 << int(np.ceil(np.log2(window + self.span)))
+
+    def detect_frames(self, frames):
+        """f0 in Hz (NaN when unvoiced) and confidence for each row of ``frames``"""
+        frames = np.asarray(frames, dtype=np.float64)
+        n = len(frames)
+        W, T = self.span, self.tau_max
+        if n == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+        # r(tau) = sum_{j<W} x_j x_{j+tau}, for all tau at once through the FFT
+        spectrum = np.fft.rfft(frames, n=self.fft_size, axis=1)
+        head = np.fft.rfft(frames[:, :W], n=self.fft_size, axis=1)
+        r = np.fft.irfft(np.conj(head) * spectrum, n=self.fft_size, axis=1)[:, :T + 2]
+
+        squares = np.concatenate((np.zeros((n, 1)), np.cumsum(frames ** 2, axis=1)), axis=1)
+        taus = np.arange(T + 2)
+        energy = squares[:, taus + W] - squares[:, taus]
+        diff = energy[:, :1] + energy - 2.0 * r
+        diff[:, 0] = 0.0
+
+        # Cumulative mean normalised difference
+        cmnd = np.ones_like(diff)
+        running = np.cumsum(diff[:, 1:], axis=1)
+        cmnd[:, 1:] = diff[:, 1:] * taus[1:] / np.maximum(running, 1e-12)
+
+        search = cmnd[:, self.tau_min:T + 1]
+        below = search < self.threshold
+        # First dip below the threshold, then walk down to its local minimum
+        local_min = np.zeros_like(below)
+        local_min[:, :-1] = search[:, :-1] <= search[:, 1:]
+        first = np.where(below.any(axis=1), np.argmax(below, axis=1), search.shape[1])
+        idx = np.arange(search.shape[1])
+        candidates = below & local_min & (idx >= first[:, None])
+        has_dip = candidates.any(axis=1)
+        best = np.where(has_dip, np.argmax(candidates, axis=1), np.argmin(search, axis=1))
+        tau = best + self.tau_min
+
+        # Parabolic interpolation on the normalised difference
+        rows = np.arange(n)
+        left = cmnd[rows, np.maximum(tau - 1, 1)]
+        mid = cmnd[rows, tau]
+        right = cmnd[rows, tau + 1]
+        denom = left - 2 * mid + right
+        shift = np.where(np.abs(denom) > 1e-12, 0.5 * (left - right) / np.where(denom == 0, 1, denom), 0.0)
+        refined = tau + np.clip(shift, -1.0, 1.0)
+
+        f0 = (self.sample_rate / refined).astype(np.float32)
+        confidence = np.clip(1.0 - mid, 0.0, 1.0).astype(np.float32)
+        silent = energy[:, 0] < 1e-6 * W
+        f0[~has_dip | silent] = np.nan
+        confidence[silent] = 0.0
+        return f0, confidence
+
+    def detect_signal(self, audio, hop=512, batch=256):
+        """Frame times (s) and f0 over a whole signal, processed in batches"""
+        audio = np.asarray(audio)
+        if audio.dtype == np.int16:
+            audio = audio.astype(np.float32) / 32768.0
+        padded = np.concatenate((audio, np.zeros(self.window, dtype=audio.dtype)))
+        frames = np.lib.stride_tricks.sliding_window_view(padded, self.window)[::hop]
+        count = max(0, (len(audio) - 1) // hop + 1)
+        f0 = np.empty(count, dtype=np.float32)
+        for start in range(0, count, batch):
+            f0[start:start + batch] = self.detect_frames(frames[start:min(start + batch, count)])[0]
+        times = (np.arange(count) * hop + self.window / 2) / self.sample_rate
+        return times, f0
+
+
+class StreamingPitchTracker:
+    """Feeds consecutive blocks to a YinDetector with a fixed hop"""
+
+    def __init__(self, detector, hop=512):
+        self.detector = detector
+        self.hop = hop
+        self._buffer = np.zeros(detector.window, dtype=np.float32)
+        self._times = np.full(detector.window, -1.0, dtype=np.float32)
+        self._filled = 0
+        self._pending = 0
+
+    def process(self, samples, times):
+        """Returns (reference times, f0) for every hop completed by this block"""
+        out_times, out_f0 = [], []
+        pos = 0
+        while pos < len(samples):
+            n = min(self.hop - self._pending, len(samples) - pos)
+            self._buffer = np.roll(self._buffer, -n)
+            self._buffer[-n:] = samples[pos:pos + n]
+            self._times = np.roll(self._times, -n)
+            self._times[-n:] = times[pos:pos + n]
+            self._filled = min(self._filled + n, len(self._buffer))
+            self._pending += n
+            pos += n
+            if self._pending == self.hop:
+                self._pending = 0
+                if self._filled == len(self._buffer):
+                    out_times.append(self._times[len(self._times) // 2])
+                    out_f0.append(self._buffer.copy())
+        if not out_f0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        f0, _ = self.detector.detect_frames(np.stack(out_f0))
+        return np.array(out_times, dtype=np.float32), f0
+
+
+def midi_to_hz(note):
+    return 440.0 * 2.0 ** ((np.asarray(note, dtype=np.float64) - 69) / 12.0)
+
+
+def read_midi_notes(path):
+    """(start s, end s, note) for every note in a standard MIDI file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b'MThd':
+        raise ValueError(f"Not a MIDI file: {path}")
+    header_len = struct.unpack('>I', data[4:8])[0]
+    _, track_count, division = struct.unpack('>HHH', data[8:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+
+    tempos = [(0, 500000)]
+    raw_notes = []
+    pos = 8 + header_len
+    for _ in range(track_count):
+        if data[pos:pos + 4] != b'MTrk':
+            break
+        length = struct.unpack('>I', data[pos + 4:pos + 8])[0]
+        track = data[pos + 8:pos + 8 + length]
+        pos += 8 + length
+
+        tick = 0
+        i = 0
+        status = 0
+        sounding = {}
+        while i < len(track):
+            delta = 0
+            while True:
+                byte = track[i]
+                i += 1
+                delta = (delta << 7) | (byte & 0x7F)
+                if not byte & 0x80:
+                    break
+            tick += delta
+
+            if track[i] & 0x80:
+                status = track[i]
+                i += 1
+            if status == 0xFF:
+                meta = track[i]
+                i += 1
+                size = 0
+                while True:
+                    byte = track[i]
+                    i += 1
+                    size = (size << 7) | (byte & 0x7F)
+                    if not byte & 0x80:
+                        break
+                if meta == 0x51:
+                    tempos.append((tick, int.from_bytes(track[i:i + 3], 'big')))
+                i += size
+            elif status in (0xF0, 0xF7):
+                size = 0
+                while True:
+                    byte = track[i]
+                    i += 1
+                    size = (size << 7) | (byte & 0x7F)
+                    if not byte & 0x80:
+                        break
+                i += size
+            else:
+                kind = status & 0xF0
+                if kind in (0xC0, 0xD0):
+                    i += 1
+                    continue
+                note, velocity = track[i], track[i + 1]
+                i += 2
+                if kind == 0x90 and velocity > 0:
+                    sounding[note] = tick
+                elif kind in (0x80, 0x90) and note in sounding:
+                    raw_notes.append((sounding.pop(note), tick, note))
+
+    # Convert ticks to seconds through the tempo map
+    tempos.sort()
+    marks = [(0, 0.0, tempos[0][1])]
+    for tick, tempo in tempos[1:]:
+        last_tick, last_sec, last_tempo = marks[-1]
+        marks.append((tick, last_sec + (tick - last_tick) * last_tempo / 1e6 / division, tempo))
+    mark_ticks = [m[0] for m in marks]
+
+    def seconds(tick):
+        j = np.searchsorted(mark_ticks, tick, side='right') - 1
+        base_tick, base_sec, tempo = marks[j]
+        return base_sec + (tick - base_tick) * tempo / 1e6 / division
+
+    return sorted((seconds(a), seconds(b), n) for a, b, n in raw_notes)
+
+
+class ReferenceMelody:
+    """Expected pitch over time: frame times (s) and f0 (Hz, NaN where silent)"""
+
+    def __init__(self, times, freqs):
+        self.times = np.asarray(times, dtype=np.float32)
+        self.freqs = np.asarray(freqs, dtype=np.float32)
+        self.step = float(np.median(np.diff(self.times))) if len(self.times) > 1 else 0.01
+
+    def at(self, times):
+        """Reference pitch at each of ``times`` (NaN outside the melody)"""
+        times = np.asarray(times, dtype=np.float32)
+        if len(self.times) == 0:
+            return np.full(len(times), np.nan, dtype=np.float32)
+        idx = np.clip(np.searchsorted(self.times, times), 0, len(self.times) - 1)
+        out = self.freqs[idx].copy()
+        out[np.abs(self.times[idx] - times) > self.step] = np.nan
+        return out
+
+    def phrases(self, gap=PHRASE_GAP):
+        """(start, end) of voiced runs, merging runs separated by less than ``gap``"""
+        voiced = self.times[~np.isnan(self.freqs)]
+        if len(voiced) == 0:
+            return []
+        breaks = np.nonzero(np.diff(voiced) > gap)[0]
+        starts = np.concatenate(([voiced[0]], voiced[breaks + 1]))
+        ends = np.concatenate((voiced[breaks], [voiced[-1]]))
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    @classmethod
+    def from_audio(cls, audio_data, sample_rate, hop=512):
+        detector = YinDetector(sample_rate)
+        times, f0 = detector.detect_signal(audio_data, hop)
+        return cls(times, f0)
+
+    @classmethod
+    def from_midi(cls, path, resolution=0.01):
+        notes = read_midi_notes(path)
+        end = max((n[1] for n in notes), default=0.0)
+        times = np.arange(0.0, end + resolution, resolution)
+        freqs = np.full(len(times), np.nan, dtype=np.float32)
+        # Later notes win where they overlap, which keeps the line monophonic
+        for start, stop, note in notes:
+            freqs[int(start / resolution):int(stop / resolution)] = midi_to_hz(note)
+        return cls(times, freqs)
+
+    @classmethod
+    def load(cls, path, audio_data=None, sample_rate=None):
+        """Reference for ``path``, computed once and then read from the melody cache"""
+        key = file_key(path, 'melody', 'yin', 2048, 512)
+        cached = os.path.join(cache_dir('melody'), key + '.npz')
+        try:
+            with np.load(cached) as data:
+                return cls(data['times'], data['freqs'])
+        except (OSError, KeyError, ValueError):
+            pass
+
+        if os.path.splitext(path)[1].lower() in ('.mid', '.midi'):
+            melody = cls.from_midi(path)
+        else:
+            if audio_data is None:
+                audio_data, sample_rate = load_audio(path)
+            melody = cls.from_audio(audio_data, sample_rate)
+        try:
+            tmp = cached + '.tmp.npz'
+            np.savez(tmp, times=melody.times, freqs=melody.freqs)
+            os.replace(tmp, cached)
+        except OSError as e:
+            print(f"Could not cache melody: {e}")
+        return melody
+
+
+class SingingScorer:
+    """Accumulates per-phrase pitch accuracy against a reference melody"""
+
+    def __init__(self, melody, tolerance_cents=100.0):
+        self.melody = melody
+        self.tolerance = tolerance_cents
+        self.phrases = melody.phrases()
+        self._starts = np.array([p[0] for p in self.phrases], dtype=np.float64)
+        self._ends = np.array([p[1] for p in self.phrases], dtype=np.float64)
+        self.credit = np.zeros(len(self.phrases))
+        self.frames = np.zeros(len(self.phrases))
+
+    def update(self, times, f0):
+        """Score detections ``f0`` made at deck times ``times``"""
+        if len(self.phrases) == 0 or len(times) == 0:
+            return
+        times = np.asarray(times, dtype=np.float64)
+        reference = self.melody.at(times)
+        phrase = np.searchsorted(self._starts, times, side='right') - 1
+        valid = (times >= 0) & ~np.isnan(reference) & (phrase >= 0)
+        valid &= times <= self._ends[np.maximum(phrase, 0)] + self.melody.step
+        if not valid.any():
+            return
+
+        sung = np.asarray(f0, dtype=np.float64)[valid]
+        reference = reference[valid].astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cents = 1200.0 * np.log2(sung / reference)
+        # Singing an octave away still counts as on pitch
+        cents = np.mod(cents + 600.0, 1200.0) - 600.0
+        credit = np.where(np.isnan(cents), 0.0, np.clip(1.0 - np.abs(cents) / self.tolerance, 0.0, 1.0))
+
+        np.add.at(self.credit, phrase[valid], credit)
+        np.add.at(self.frames, phrase[valid], 1)
+
+    def phrase_scores(self):
+        """0-100 per phrase, NaN for phrases not reached yet"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.frames > 0, 100.0 * self.credit / self.frames, np.nan)
+
+    def total(self):
+        frames = self.frames.sum()
+        return 100.0 * self.credit.sum() / frames if frames else 0.0
+
+    def current_phrase(self, position):
+        idx = int(np.searchsorted(self._starts, position, side='right')) - 1
+        return idx if idx >= 0 else None
+
+
+class ScoreWorker(QThread):
+    """Drains the mixer's mic tap ring, tracks pitch and updates the score"""
+    score_updated = pyqtSignal(object, float)  # phrase scores, total
+
+    def __init__(self, tap, sample_rate, melody, interval=0.2):
+        super().__init__()
+        self.tap = tap
+        self.sample_rate = sample_rate
+        self.scorer = SingingScorer(melody)
+        self.tracker = StreamingPitchTracker(YinDetector(sample_rate))
+        self.interval = interval
+        self._running = True
+
+    def stop(self):
+        self._running = False
+        self.wait()
+
+    def run(self):
+        last_emit = 0.0
+        while self._running:
+            records = self.tap.read(8192)
+            if len(records) == 0:
+                time.sleep(0.01)
+                continue
+            times, f0 = self.tracker.process(records[:, 0], records[:, 1])
+            self.scorer.update(times, f0)
+            now = time.monotonic()
+            if now - last_emit >= self.interval:
+                last_emit = now
+                self.score_updated.emit(self.scorer.phrase_scores(), self.scorer.total())
+
+
+class MelodyLoader(QThread):
+    """Computes (or reads from the cache) the reference melody off the GUI thread"""
+    melody_ready = pyqtSignal(object, str)  # ReferenceMelody, source path
+
+    def __init__(self, path, audio_data=None, sample_rate=None):
+        super().__init__()
+        self.path = path
+        self.audio_data = audio_data
+        self.sample_rate = sample_rate
+
+    def run(self):
+        try:
+            melody = ReferenceMelody.load(self.path, self.audio_data, self.sample_rate)
+            self.melody_ready.emit(melody, self.path)
+        except Exception as e:
+            print(f"Error analysing melody: {e}")
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Soak test for the playback engine.
+
+Runs the mixer engine (LocalEngine) or per-deck AudioStreams on the null
+output for hours of simulated time, cycling load, play, pause, seek, EQ,
+crossfade, stop and eject across the decks from this thread while the
+output thread renders, as the GUI and audio threads would. With the
+default free-running clock, hours of playback run in a few minutes.
+
+RSS, OS thread count, outputs left unclosed and callback time percentiles
+are sampled at intervals of simulated time. The run fails when RSS or
+threads grow past the thresholds between samples taken after the warm-up,
+when any interval's p99 callback time goes over its threshold, when
+callbacks repeatedly take longer than a whole block within one interval
+(an audible underrun on a sound card; a single one is scheduler or page
+fault noise on a shared machine) or when outputs are left open.
+"""
+
+import argparse
+import functools
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from advanced_player import AudioStream
+from audio_engine import LocalEngine, MixerStream, block_size_for_latency
+from decoders import float_to_int16, load_audio
+from effects import EQ_BANDS, EQ_RANGE_DB
+from output import CLOCKS, OutputSettings, unclosed_outputs
+
+MB = 1 << 20
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except OSError:
+        # Peak rather than current outside Linux; still catches growth
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def os_threads():
+    """Native threads too (PortAudio, SDL), not just Python's"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return threading.active_count()
+
+
+def wait_for_frames(marks, clock):
+    """Wait until each output has pulled up to its mark, or stopped pulling"""
+    idle = 0.01 if clock == 'realtime' else 0.0005
+    while any(output.running and output.frames < mark for output, mark in marks):
+        time.sleep(idle)
+
+
+def time_callbacks(owner, samples, clock):
+    """Record the duration of every ``owner._callback`` call into ``samples``.
+
+    Free-running outputs never sleep, so each one always wants the GIL and
+    wall time would mostly measure waiting for the others; there the
+    callback's own CPU time is recorded instead.
+    """
+    func = owner._callback
+    timer = time.thread_time if clock == 'fast' else time.perf_counter
+
+    @functools.wraps(func)
+    def timed(*args):
+        start = timer()
+        try:
+            return func(*args)
+        finally:
+            samples.append(timer() - start)
+    owner._callback = timed
+
+
+def synthetic_tracks(rng):
+    """Tones and noise at the rates and sample formats decoding produces"""
+    tracks = []
+    for seconds, rate, compact in ((30, 44100, False), (75, 48000, False), (45, 22050, True),
+                                   (120, 44100, True), (20, 44100, False)):
+        t = np.arange(int(seconds * rate)) / rate
+        audio = (0.3 * np.sin(2 * np.pi * rng.uniform(110, 880) * t)
+                 + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+        tracks.append((float_to_int16(audio) if compact else audio, rate))
+    return tracks
+
+
+class EngineTarget:
+    """The mixer engine, on one null output"""
+
+    def __init__(self, decks, settings, latency_ms, samples):
+        time_callbacks(MixerStream, samples, settings.clock)
+        self.engine = LocalEngine(decks, 44100, latency_ms, output=settings)
+        self.clock = settings.clock
+        self.block_size = self.engine.stream.block_size
+        self.sample_rate = 44100
+        self.decks = [None] * decks
+
+    def advance(self, seconds):
+        output = self.engine.stream.output
+        wait_for_frames([(output, output.frames + seconds * output.sample_rate)], self.clock)
+
+    def load(self, deck, audio_data, sample_rate):
+        self.engine.load(deck, audio_data, sample_rate)
+        self.decks[deck] = len(audio_data) / sample_rate
+
+    def act(self, rng, deck, action):
+        engine = self.engine
+        duration = self.decks[deck]
+        if action == 'play':
+            engine.play(deck)
+        elif action == 'pause':
+            engine.pause(deck)
+        elif action == 'resume':
+            engine.resume(deck)
+        elif action == 'seek':
+            engine.seek(deck, rng.uniform(0, duration))
+        elif action == 'eq':
+            engine.set_eq(deck, rng.randrange(len(EQ_BANDS)), rng.uniform(-EQ_RANGE_DB, EQ_RANGE_DB))
+        elif action == 'volume':
+            engine.set_volume(deck, rng.random())
+        elif action == 'crossfade':
+            other = rng.choice([d for d in range(len(self.decks)) if d != deck and self.decks[d]] or [deck])
+            engine.crossfade(deck, other, rng.uniform(0.5, 8.0))
+        elif action == 'stop':
+            engine.stop(deck)
+        elif action == 'eject':
+            engine.unload(deck)
+            self.decks[deck] = None
+
+    def shutdown(self):
+        self.engine.shutdown()
+
+
+class StreamTarget:
+    """One AudioStream per deck, each on its own null output, as the player
+    runs without an engine"""
+
+    def __init__(self, decks, settings, latency_ms, samples):
+        time_callbacks(AudioStream, samples, settings.clock)
+        self.settings = settings
+        self.clock = settings.clock
+        self.latency_ms = latency_ms
+        self.block_size = block_size_for_latency(44100, latency_ms)
+        self.sample_rate = 44100
+        self.decks = [None] * decks
+
+    def advance(self, seconds):
+        marks = [(stream.output, stream.output.frames + seconds * stream.output.sample_rate)
+                 for stream in self.decks if stream is not None]
+        wait_for_frames(marks, self.clock)
+
+    def _drop(self, deck, release=False):
+        stream = self.decks[deck]
+        if stream is not None:
+            if release:
+                stream.release()
+            else:
+                stream.stop()
+            self.decks[deck] = None
+
+    def load(self, deck, audio_data, sample_rate):
+        self._drop(deck, release=True)
+        self.decks[deck] = AudioStream(audio_data, sample_rate, 1.0, self.settings,
+                                       block_size_for_latency(sample_rate, self.latency_ms))
+
+    def act(self, rng, deck, action):
+        stream = self.decks[deck]
+        if action == 'play':
+            stream.start_playback()
+        elif action == 'pause':
+            stream.pause()
+        elif action == 'resume':
+            stream.resume()
+        elif action == 'seek':
+            stream.seek(rng.uniform(0, stream.get_duration()))
+        elif action == 'eq':
+            stream.set_eq(rng.randrange(len(EQ_BANDS)), rng.uniform(-EQ_RANGE_DB, EQ_RANGE_DB))
+        elif action == 'volume':
+            stream.set_volume(rng.random())
+        elif action == 'stop':
+            self._drop(deck)
+        elif action == 'eject':
+            self._drop(deck, release=True)
+
+    def shutdown(self):
+        for deck in range(len(self.decks)):
+            self._drop(deck, release=True)
+
+
+ACTIONS = {
+    'engine': ('play', 'play', 'pause', 'resume', 'seek', 'seek', 'eq', 'volume', 'crossfade', 'stop', 'eject'),
+    'streams': ('play', 'play', 'pause', 'resume', 'seek', 'seek', 'eq', 'volume', 'stop', 'eject'),
+}
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 99), ms.max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--target', choices=('engine', 'streams'), default='engine',
+                        help="the mixer engine, or one AudioStream per deck")
+    parser.add_argument('--hours', type=float, default=4.0, help="simulated hours of playback")
+    parser.add_argument('--decks', type=int, default=4)
+    parser.add_argument('--tracks', nargs='*', default=[], help="audio files to load (default: synthetic)")
+    parser.add_argument('--clock', choices=CLOCKS, default='fast',
+                        help="render as fast as possible, or in real time")
+    parser.add_argument('--latency-ms', type=float, default=40.0, help="sets the block size")
+    parser.add_argument('--action-seconds', type=float, default=2.0,
+                        help="simulated seconds between actions")
+    parser.add_argument('--sample-minutes', type=float, default=10.0,
+                        help="simulated minutes between samples")
+    parser.add_argument('--warmup-minutes', type=float, default=20.0,
+                        help="simulated minutes before growth is measured")
+    parser.add_argument('--max-rss-growth', type=float, default=64.0, metavar='MB')
+    parser.add_argument('--max-thread-growth', type=int, default=2)
+    parser.add_argument('--max-p99', type=float, metavar='MS',
+                        help="p99 callback time per interval (default: a quarter of a block)")
+    parser.add_argument('--max-stalls', type=int, default=1,
+                        help="callbacks per interval allowed to take longer than a whole block")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.tracks:
+        tracks = [load_audio(path) for path in args.tracks]
+    else:
+        tracks = synthetic_tracks(np.random.default_rng(args.seed))
+    samples = deque()
+    settings = OutputSettings('null', args.clock)
+    base_threads = os_threads()
+    target_cls = EngineTarget if args.target == 'engine' else StreamTarget
+    target = target_cls(args.decks, settings, args.latency_ms, samples)
+    block_ms = 1000.0 * target.block_size / target.sample_rate
+    max_p99 = args.max_p99 if args.max_p99 is not None else block_ms / 4
+    actions = ACTIONS[args.target]
+
+    total = args.hours * 3600
+    print(f"\nSoak: {args.target}, {args.decks} decks, {args.hours:g} simulated hours, {args.clock} clock, "
+          f"block {target.block_size} frames = {block_ms:.2f} ms\n")
+    print(f"{'sim time':>9}{'wall':>8}{'RSS MB':>9}{'threads':>9}{'outputs':>9}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'stalls':>8}")
+
+    rows = []
+    stalls = 0
+    failures = []
+    start = time.monotonic()
+    simulated = 0.0
+    next_sample = args.sample_minutes * 60
+    try:
+        while simulated < total:
+            deck = rng.randrange(args.decks)
+            if target.decks[deck] is None or rng.random() < 0.05:
+                audio_data, sample_rate = rng.choice(tracks)
+                # A fresh buffer per load, as a decode would produce
+                target.load(deck, audio_data.copy(), sample_rate)
+            else:
+                target.act(rng, deck, rng.choice(actions))
+            target.advance(args.action_seconds)
+            simulated += args.action_seconds
+            if simulated >= next_sample or simulated >= total:
+                timings = [samples.popleft() for _ in range(len(samples))]
+                p50, p99, worst = percentiles(timings) if timings else (0.0, 0.0, 0.0)
+                slow = sum(1 for t in timings if t * 1000 > block_ms)
+                stalls += slow
+                if slow > args.max_stalls:
+                    failures.append(f"{slow} callbacks took longer than a {block_ms:.2f} ms block "
+                                    f"at {simulated / 3600:.2f}h (limit {args.max_stalls} per interval)")
+                row = (simulated, rss_mb(), os_threads(), unclosed_outputs(), p99)
+                rows.append(row)
+                print(f"{simulated / 3600:8.2f}h{time.monotonic() - start:7.0f}s{row[1]:9.1f}{row[2]:9d}{row[3]:9d}"
+                      f"{p50:9.3f}{p99:9.3f}{worst:9.3f}{slow:8d}")
+                if p99 > max_p99:
+                    failures.append(f"p99 callback {p99:.3f} ms at {simulated / 3600:.2f}h (limit {max_p99:.3f} ms)")
+                next_sample += args.sample_minutes * 60
+    except KeyboardInterrupt:
+        print("Interrupted")
+    finally:
+        target.shutdown()
+
+    # The baseline is taken after the warm-up, once allocator pools and
+    # caches have filled; startup growth is not a leak
+    warm = [row for row in rows if row[0] >= args.warmup_minutes * 60]
+    if len(warm) < 2:
+        print(f"\nToo short to measure growth after a {args.warmup_minutes:g} minute warm-up")
+    else:
+        # Medians of the first and last thirds: RSS and threads swing with
+        # what happens to be loaded, a leak keeps climbing
+        third = max(1, len(warm) // 3)
+        rss_growth = (np.median([row[1] for row in warm[-third:]])
+                      - np.median([row[1] for row in warm[:third]]))
+        thread_growth = int(np.median([row[2] for row in warm[-third:]])
+                            - np.median([row[2] for row in warm[:third]]))
+        print(f"\nAfter warm-up: RSS {rss_growth:+.1f} MB, threads {thread_growth:+d}")
+        if rss_growth > args.max_rss_growth:
+            failures.append(f"RSS grew {rss_growth:.1f} MB (limit {args.max_rss_growth:g} MB)")
+        if thread_growth > args.max_thread_growth:
+            failures.append(f"threads grew by {thread_growth} (limit {args.max_thread_growth})")
+    if stalls:
+        print(f"{stalls} callbacks took longer than a block in total")
+    leaked = unclosed_outputs()
+    if leaked:
+        failures.append(f"{leaked} outputs never closed (started at {base_threads} threads, "
+                        f"ended at {os_threads()})")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("PASS")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,443 @@
+"""
+Tiled spectrogram and pitch-contour view.
+
+A track is split into tiles of TILE_FRAMES STFT frames. Tiles are computed
+on a background thread pool only when they become visible, kept in a small
+in-memory LRU and written to an on-disk cache, so a long track fills in
+progressively and scrolling never triggers an STFT of the whole file.
+
+Zoomed out, tiles come from a coarser level of detail: level ``n`` takes one
+frame every ``HOP << n`` samples, and the view picks the level whose frames
+are about one pixel wide. The full-track view therefore costs about one FFT
+per pixel column, and full-resolution tiles are only computed once the view
+is zoomed in far enough to show them.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QRectF, pyqtSignal
+from PyQt5.QtGui import QPainter, QPen, QColor, QImage, QPolygonF, qRgb
+
+from cache import cache_dir, file_key
+from decoders import to_float32
+from memory import PRIORITY_CACHE, shared_budget
+
+N_FFT = 2048
+HOP = 512
+TILE_FRAMES = 256
+N_ROWS = 128
+F_MIN = 60.0
+F_MAX = 5000.0
+DB_RANGE = 80.0
+
+# Colour images a widget keeps beyond the ones on screen
+MAX_IMAGES = 32
+
+# Pitch search range and the level below which a frame counts as unvoiced
+PITCH_MIN = 80.0
+PITCH_MAX = 1000.0
+VOICED_DB = -45.0
+
+_WINDOW = np.hanning(N_FFT).astype(np.float32)
+# Magnitude of a full-scale sine, so every tile uses the same dB reference
+_REFERENCE = float(_WINDOW.sum()) / 2.0
+
+
+def frame_count(n_samples, level=0):
+    return n_samples // (HOP << level) + 1
+
+
+def tile_count(n_samples, level=0):
+    return (frame_count(n_samples, level) + TILE_FRAMES - 1) // TILE_FRAMES
+
+
+def view_level(seconds, sample_rate, width):
+    """Coarsest level whose frames are still at most one pixel wide"""
+    frames_per_pixel = seconds * sample_rate / HOP / max(width, 1)
+    if frames_per_pixel <= 1:
+        return 0
+    return int(np.ceil(np.log2(frames_per_pixel)))
+
+
+@lru_cache(maxsize=8)
+def _row_bins(sample_rate):
+    """FFT bin shown on each (log-spaced) display row, lowest frequency first"""
+    freqs = np.geomspace(F_MIN, min(F_MAX, sample_rate / 2), N_ROWS)
+    return np.clip(np.round(freqs * N_FFT / sample_rate).astype(np.int64), 0, N_FFT // 2)
+
+
+def compute_tile(audio_data, sample_rate, index, level=0):
+    """STFT image (N_ROWS x frames, uint8, high frequencies first) and pitch for one tile"""
+    hop = HOP << level
+    total_frames = frame_count(len(audio_data), level)
+    first = index * TILE_FRAMES
+    n_frames = max(0, min(TILE_FRAMES, total_frames - first))
+
+    # Only the samples under this tile's frames are read, centred like librosa;
+    # at coarse levels that is a small fraction of the tile's time span
+    frames = np.zeros((n_frames, N_FFT), dtype=np.float32)
+    starts = (first + np.arange(n_frames)) * hop - N_FFT // 2
+    for row, start in enumerate(starts.tolist()):
+        lo = max(start, 0)
+        hi = min(start + N_FFT, len(audio_data))
+        if hi > lo:
+            to_float32(audio_data[lo:hi], frames[row, lo - start:hi - start])
+
+    frames *= _WINDOW
+    spectrum = np.abs(np.fft.rfft(frames, axis=1)).astype(np.float32)
+    spectrum /= _REFERENCE
+
+    db = 20.0 * np.log10(np.maximum(spectrum[:, _row_bins(sample_rate)], 1e-10))
+    scaled = np.clip((db + DB_RANGE) * (255.0 / DB_RANGE), 0, 255).astype(np.uint8)
+    image = np.ascontiguousarray(scaled.T[::-1])
+    return image, pitch_contour(spectrum, sample_rate)
+
+
+def pitch_contour(spectrum, sample_rate, min_clarity=0.3):
+    """Autocorrelation pitch per frame in Hz, NaN where unvoiced.
+
+    The autocorrelation comes from the magnitude spectrum already computed
+    for the image, so the contour costs one extra inverse FFT per tile.
+    """
+    n = len(spectrum)
+    freqs = np.full(n, np.nan, dtype=np.float32)
+    lag_lo = max(1, int(sample_rate / PITCH_MAX))
+    lag_hi = min(int(sample_rate / PITCH_MIN), N_FFT // 2 - 1)
+    if n == 0 or lag_hi <= lag_lo:
+        return freqs
+
+    ac = np.fft.irfft(spectrum.astype(np.float64) ** 2, n=N_FFT, axis=1)
+    rows = np.arange(n)
+    best = lag_lo + np.argmax(ac[:, lag_lo:lag_hi], axis=1)
+    energy = np.maximum(ac[:, 0], 1e-20)
+    clarity = ac[rows, best] / energy
+
+    # Parabolic interpolation around the peak for sub-sample lag resolution
+    left, mid, right = ac[rows, best - 1], ac[rows, best], ac[rows, best + 1]
+    denom = left - 2 * mid + right
+    offset = np.where(denom != 0, 0.5 * (left - right) / np.where(denom != 0, denom, 1), 0.0)
+    lags = best + offset
+
+    level = 20.0 * np.log10(np.maximum(spectrum.max(axis=1), 1e-10))
+    voiced = (clarity >= min_clarity) & (level >= VOICED_DB)
+    freqs[voiced] = sample_rate / lags[voiced]
+    return freqs
+
+
+def _tile_bytes(tile):
+    return tile[0].nbytes + tile[1].nbytes
+
+
+class SpectrogramTileCache:
+    """In-memory LRU of tiles backed by .npz files on disk"""
+
+    def __init__(self, max_tiles=512, directory=None):
+        self.max_tiles = max_tiles
+        self.directory = directory
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        shared_budget().register(('spectrogram', id(self)), 0, PRIORITY_CACHE, self.clear,
+                                 kind='tile caches')
+
+    def _path(self, key, level, index):
+        if self.directory is None:
+            self.directory = cache_dir('spectrogram')
+        return os.path.join(self.directory, key, f"{level}-{index}.npz")
+
+    def get(self, key, level, index):
+        """Memory lookup only; safe to call from the GUI thread"""
+        with self._lock:
+            tile = self._tiles.get((key, level, index))
+            if tile is not None:
+                self._tiles.move_to_end((key, level, index))
+            return tile
+
+    def put(self, key, level, index, tile):
+        with self._lock:
+            old = self._tiles.pop((key, level, index), None)
+            if old is not None:
+                self._bytes -= _tile_bytes(old)
+            self._tiles[(key, level, index)] = tile
+            self._bytes += _tile_bytes(tile)
+            while len(self._tiles) > self.max_tiles:
+                self._bytes -= _tile_bytes(self._tiles.popitem(last=False)[1])
+            nbytes = self._bytes
+        shared_budget().update(('spectrogram', id(self)), nbytes)
+
+    def load(self, key, level, index):
+        """Memory, then disk; call from a worker thread"""
+        tile = self.get(key, level, index)
+        if tile is not None:
+            return tile
+        try:
+            with np.load(self._path(key, level, index)) as data:
+                tile = (data['image'], data['pitch'])
+        except (OSError, KeyError, ValueError):
+            return None
+        self.put(key, level, index, tile)
+        return tile
+
+    def store(self, key, level, index, tile):
+        self.put(key, level, index, tile)
+        path = self._path(key, level, index)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.tmp.npz'
+            np.savez(tmp, image=tile[0], pitch=tile[1])
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not cache spectrogram tile: {e}")
+
+    def discard(self, key):
+        """Forget the in-memory tiles of one track"""
+        with self._lock:
+            for cached in [k for k in self._tiles if k[0] == key]:
+                self._bytes -= _tile_bytes(self._tiles.pop(cached))
+            nbytes = self._bytes
+        shared_budget().update(('spectrogram', id(self)), nbytes)
+
+    def clear(self):
+        """Forget every in-memory tile; they reload from disk when shown again"""
+        with self._lock:
+            self._tiles.clear()
+            self._bytes = 0
+        shared_budget().update(('spectrogram', id(self)), 0)
+
+
+class TileSignals(QObject):
+    tile_ready = pyqtSignal(str, int, int)  # key, level, tile index
+
+
+class TileWorker(QRunnable):
+    """Loads one tile from the cache or computes it"""
+
+    def __init__(self, cache, key, level, index, audio_data, sample_rate, signals):
+        super().__init__()
+        self.cache = cache
+        self.key = key
+        self.level = level
+        self.index = index
+        self.audio_data = audio_data
+        self.sample_rate = sample_rate
+        self.signals = signals
+
+    def run(self):
+        try:
+            if self.cache.load(self.key, self.level, self.index) is None:
+                tile = compute_tile(self.audio_data, self.sample_rate, self.index, self.level)
+                self.cache.store(self.key, self.level, self.index, tile)
+            self.signals.tile_ready.emit(self.key, self.level, self.index)
+        except Exception as e:
+            print(f"Error computing spectrogram tile: {e}")
+
+
+_shared_cache = None
+_shared_pool = None
+
+
+def shared_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SpectrogramTileCache()
+    return _shared_cache
+
+
+def shared_pool():
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = QThreadPool()
+        _shared_pool.setMaxThreadCount(2)
+    return _shared_pool
+
+
+def _polyline(xs, ys):
+    """QPolygonF filled straight from numpy instead of one QPointF per point"""
+    polygon = QPolygonF(len(xs))
+    buffer = polygon.data()
+    buffer.setsize(len(xs) * 2 * 8)
+    points = np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)
+    points[:, 0] = xs
+    points[:, 1] = ys
+    return polygon
+
+
+@lru_cache(maxsize=1)
+def _color_table():
+    """Dark blue through magenta to yellow"""
+    table = []
+    for i in range(256):
+        t = i / 255.0
+        r = int(255 * min(1.0, 2.0 * t))
+        g = int(255 * max(0.0, 2.0 * t - 1.0))
+        b = int(255 * (0.35 + 0.65 * np.sin(np.pi * t)) * (1.0 - t * 0.7))
+        table.append(qRgb(r, g, b))
+    return table
+
+
+class SpectrogramWidget(QWidget):
+    """Spectrogram with pitch contour, drawn tile by tile for the visible range"""
+
+    def __init__(self, parent=None, cache=None, pool=None):
+        super().__init__(parent)
+        self.cache = cache or shared_cache()
+        self.pool = pool or shared_pool()
+        self.signals = TileSignals()
+        self.signals.tile_ready.connect(self.on_tile_ready)
+        self.audio_data = None
+        self.sample_rate = None
+        self.key = None
+        self.duration = 0
+        self.view_start = 0.0
+        self.view_end = 0.0
+        self.current_position = 0
+        # Colour images by (level, index), least recently painted first. The
+        # visible ones are always kept, so a view wider than the tile cache
+        # does not evict and recompute its own tiles on every paint
+        self._images = OrderedDict()
+        self._image_bytes = 0
+        self._pending = set()
+        self._budget_key = ('spectrogram images', id(self))
+        shared_budget().register(self._budget_key, 0, PRIORITY_CACHE, self.drop_images,
+                                 kind='tile caches')
+        self.setMinimumHeight(100)
+        self.setStyleSheet("background-color: #1e1e1e; border: 1px solid #555;")
+
+    def set_audio_data(self, audio_data, sample_rate, file_path):
+        self.release()
+        self.audio_data = audio_data
+        self.sample_rate = sample_rate
+        self.key = file_key(file_path, 'spectrogram', N_FFT, HOP, TILE_FRAMES, N_ROWS, sample_rate)
+        self.duration = len(audio_data) / sample_rate
+        self.set_view(0.0, self.duration)
+
+    def release(self):
+        if self.key is not None:
+            self.cache.discard(self.key)
+        self.audio_data = None
+        self.key = None
+        self.duration = 0
+        self.current_position = 0
+        self._pending = set()
+        self.drop_images()
+
+    def drop_images(self):
+        """Forget the colour images; they are rebuilt from cached tiles when shown again"""
+        self._images.clear()
+        self._image_bytes = 0
+        shared_budget().update(self._budget_key, 0)
+        self.update()
+
+    def set_view(self, start, end):
+        """Seconds range shown across the widget width"""
+        self.view_start = start
+        self.view_end = end
+        self.update()
+
+    def set_position(self, position):
+        self.current_position = position
+        self.update()
+
+    def level(self):
+        return view_level(self.view_end - self.view_start, self.sample_rate, self.width())
+
+    def visible_tiles(self, level):
+        if self.audio_data is None or self.view_end <= self.view_start:
+            return range(0)
+        frames_per_second = self.sample_rate / (HOP << level)
+        first = int(self.view_start * frames_per_second) // TILE_FRAMES
+        last = int(self.view_end * frames_per_second) // TILE_FRAMES
+        return range(max(first, 0), min(last + 1, tile_count(len(self.audio_data), level)))
+
+    def request_tile(self, level, index):
+        if (level, index) in self._pending:
+            return
+        self._pending.add((level, index))
+        self.pool.start(TileWorker(self.cache, self.key, level, index, self.audio_data,
+                                   self.sample_rate, self.signals))
+
+    def on_tile_ready(self, key, level, index):
+        if key != self.key:
+            return  # finished after the track was changed
+        self._pending.discard((level, index))
+        if level == self.level() and index in self.visible_tiles(level):
+            self.update()
+
+    def tile_image(self, level, index):
+        entry = self._images.get((level, index))
+        if entry is not None:
+            self._images.move_to_end((level, index))
+            return entry
+        tile = self.cache.get(self.key, level, index)
+        if tile is None:
+            return None
+        pixels = tile[0]
+        image = QImage(pixels.data, pixels.shape[1], pixels.shape[0], pixels.strides[0],
+                       QImage.Format_Indexed8)
+        image.setColorTable(_color_table())
+        image = image.copy()  # detach from the numpy buffer
+        entry = self._images[(level, index)] = (image, tile[1])
+        self._image_bytes += image.sizeInBytes() + tile[1].nbytes
+        return entry
+
+    def trim_images(self, keep):
+        """Drop the least recently painted images beyond ``keep`` plus MAX_IMAGES"""
+        while len(self._images) > keep + MAX_IMAGES:
+            image, pitch = self._images.popitem(last=False)[1]
+            self._image_bytes -= image.sizeInBytes() + pitch.nbytes
+        shared_budget().update(self._budget_key, self._image_bytes)
+
+    def time_to_x(self, seconds):
+        return (seconds - self.view_start) / (self.view_end - self.view_start) * self.width()
+
+    def frequency_to_y(self, freqs):
+        top = np.log(min(F_MAX, self.sample_rate / 2) / F_MIN)
+        return self.height() * (1.0 - np.log(freqs / F_MIN) / top)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+        if self.audio_data is None or self.view_end <= self.view_start:
+            return
+
+        height = self.height()
+        level = self.level()
+        frame_seconds = (HOP << level) / self.sample_rate
+        contour_pen = QPen(QColor(255, 255, 255), 2)
+
+        tiles = self.visible_tiles(level)
+        for index in tiles:
+            entry = self.tile_image(level, index)
+            if entry is None:
+                self.request_tile(level, index)
+                continue
+            image, pitch = entry
+            first = index * TILE_FRAMES
+            x0 = self.time_to_x(first * frame_seconds)
+            x1 = self.time_to_x((first + image.width()) * frame_seconds)
+            painter.drawImage(QRectF(x0, 0, x1 - x0, height), image,
+                              QRectF(0, 0, image.width(), image.height()))
+
+            # Pitch contour, one polyline per voiced run; the level keeps it
+            # to about one point per pixel
+            voiced = ~np.isnan(pitch)
+            if not voiced.any():
+                continue
+            xs = self.time_to_x((first + np.arange(len(pitch))) * frame_seconds)
+            ys = self.frequency_to_y(np.where(voiced, pitch, F_MIN))
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.view(np.int8), [0]))))
+            painter.setPen(contour_pen)
+            for start, end in zip(edges[::2], edges[1::2]):
+                painter.drawPolyline(_polyline(xs[start:end], ys[start:end]))
+        self.trim_images(len(tiles))
+
+        # Draw position indicator
+        if self.duration > 0:
+            position_x = int(self.time_to_x(self.current_position))
+            painter.setPen(QPen(QColor(255, 255, 0), 2))
+            painter.drawLine(position_x, 0, position_x, height)
@@ -0,0 +1,89 @@
+"""
+Startup helpers: deferred loading of the heavy analysis stack and an
+optional report of import and first-paint timings (--startup-profile).
+
+Import this module before anything else so its clock starts as early as
+possible.
+"""
+
+import sys
+import threading
+import time
+
+_START = time.perf_counter()
+
+_librosa = None
+_librosa_lock = threading.Lock()
+
+
+def load_librosa():
+    """Import librosa on first use; it pulls in numba and scipy, which take seconds"""
+    global _librosa
+    if _librosa is None:
+        with _librosa_lock:
+            if _librosa is None:
+                import librosa
+                _librosa = librosa
+    return _librosa
+
+
+def warm_imports(profiler=None):
+    """Load the analysis stack in a background thread once the window is up"""
+    def run():
+        try:
+            load_librosa()
+        except ImportError as e:
+            # The first decode will report it; nothing to warm
+            print(f"Could not preload librosa: {e}")
+            return
+        if profiler is not None:
+            profiler.mark("librosa warmed (background)")
+
+    thread = threading.Thread(target=run, name="import-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+class StartupProfiler:
+    """Collects named timestamps relative to process start and prints them"""
+
+    def __init__(self, enabled=False, stream=None):
+        self.enabled = enabled
+        self.stream = stream or sys.stderr
+        self.marks = []
+        self._lock = threading.Lock()
+        self._painted = False
+
+    def mark(self, label):
+        if not self.enabled:
+            return
+        elapsed = (time.perf_counter() - _START) * 1000.0
+        with self._lock:
+            self.marks.append((label, elapsed))
+        print(f"[startup] {elapsed:8.1f} ms  {label}", file=self.stream)
+
+    def watch_first_paint(self, widget):
+        """Mark the first Paint event delivered to ``widget``"""
+        if not self.enabled:
+            return
+        from PyQt5.QtCore import QObject, QEvent
+
+        profiler = self
+
+        class _PaintFilter(QObject):
+            def eventFilter(self, obj, event):
+                if event.type() == QEvent.Paint and not profiler._painted:
+                    profiler._painted = True
+                    profiler.mark("first paint")
+                    obj.removeEventFilter(self)
+                return False
+
+        self._filter = _PaintFilter(widget)
+        widget.installEventFilter(self._filter)
+
+    def report_imports(self, prefixes=("librosa", "numba", "scipy", "matplotlib", "pygame", "PyQt5")):
+        """List which heavy packages are already in sys.modules"""
+        if not self.enabled:
+            return
+        loaded = sorted(p for p in prefixes if p in sys.modules)
+        self.mark(f"heavy modules loaded: {', '.join(loaded) or 'none'}")
@@ -42,13 +42,6 @@ def test_imports():
         print(f"✗ PyQt5: {e}")
         return False
     
-    try:
-        import matplotlib
-        print("✓ matplotlib")
-    except ImportError as e:
-        print(f"✗ matplotlib: {e}")
-        return False
-    
     try:
         import soundfile
         print("✓ soundfile")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for the basic player's engine-backed outputs (--output null / --output-file)
+"""
+
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import soundfile as sf
+from PyQt5.QtWidgets import QApplication
+
+import main
+from output import OutputSettings
+
+
+def test_evicted_deck_leaves_the_engine(tmp_path):
+    """Evicting an idle deck also drops the mixer engine's copy of its samples"""
+    app = QApplication.instance() or QApplication([])
+    path = str(tmp_path / 'tone.wav')
+    tone = (0.3 * np.sin(2 * np.pi * 440 * np.arange(44100) / 44100)).astype(np.float32)
+    sf.write(path, tone, 44100, subtype='FLOAT')
+
+    player = main.MP3Player(decks=1, output=OutputSettings('null', 'fast'))
+    try:
+        player.decks[0].path = path
+        player.on_track_loaded(0, tone, 44100, path, None)
+        player.play_track(0)
+        assert player.engine.mixer.decks[0].audio_data is tone
+        player.stop_track(0)
+
+        player.decks.evict(0)
+        assert isinstance(player.decks[0].data, np.memmap)
+        assert player.engine.mixer.decks[0] is None
+    finally:
+        player.close()
+        app.processEvents()
@@ -0,0 +1,144 @@
+"""
+Timeline tracing (--trace).
+
+Hot paths across the GUI, decode, analysis and audio threads are wrapped
+so every call records a (start, duration) span into a bounded per-thread
+buffer, and the spans are written out as Chrome trace-event JSON on exit.
+Open the file in chrome://tracing or https://ui.perfetto.dev to see every
+thread on one timeline.
+
+Nothing is wrapped unless tracing is enabled, so with tracing off the hot
+paths run exactly the code they always did. The engine child process
+(--engine-process) traces into a part file that is merged into the main
+trace when it is saved.
+"""
+
+import atexit
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Spans kept per thread; older ones are dropped first
+MAX_EVENTS = 1 << 20
+
+_path = None
+_process = 'player'
+_lock = threading.Lock()
+# thread id -> (thread name, deque of (name, category, start ns, duration ns))
+_buffers = {}
+
+
+def enabled():
+    return _path is not None
+
+
+def enable(path, save_at_exit=True, process='player'):
+    """Start recording; the trace is written to ``path`` by save()"""
+    global _path, _process
+    _path = path
+    _process = process
+    if save_at_exit:
+        atexit.register(save)
+
+
+def _events(category):
+    entry = _buffers.get(threading.get_ident())
+    if entry is None:
+        # Keyed by thread id: Qt pool threads are not Python threads, so
+        # thread-local storage does not survive between their runs
+        name = threading.current_thread().name
+        if name.startswith('Dummy'):
+            name = f"{category} worker"
+        entry = (name, deque(maxlen=MAX_EVENTS))
+        with _lock:
+            _buffers[threading.get_ident()] = entry
+    return entry[1]
+
+
+def traced(func, name=None, category='app'):
+    """``func`` recording a span per call, or ``func`` itself while tracing is off"""
+    if _path is None:
+        return func
+    name = name or func.__qualname__
+    clock = time.perf_counter_ns
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _events(category).append((name, category, start, clock() - start))
+    return wrapper
+
+
+def instrument(owner, attribute, category='app', name=None):
+    """Trace calls to ``owner.attribute`` (a class or module function)"""
+    if _path is None:
+        return
+    func = getattr(owner, attribute)
+    setattr(owner, attribute, traced(func, name or f"{owner.__name__}.{attribute}", category))
+
+
+def instrument_hot_paths():
+    """Wrap the paint, decode, analysis, audio and recording paths shared by both players"""
+    if _path is None:
+        return
+    import audio_engine
+    import beats
+    import loader
+    import mixer
+    import recorder
+    import scoring
+    import spectrogram
+    import waveform
+
+    instrument(waveform.WaveformWidget, 'paintEvent', 'paint')
+    instrument(spectrogram.SpectrogramWidget, 'paintEvent', 'paint')
+    instrument(loader.DecodeJob, 'run', 'decode')
+    instrument(spectrogram.TileWorker, 'run', 'analysis')
+    instrument(beats.BeatLoader, 'run', 'analysis')
+    instrument(scoring.StreamingPitchTracker, 'process', 'analysis')
+    instrument(audio_engine.MixerStream, '_callback', 'audio')
+    instrument(mixer.Mixer, 'render', 'audio')
+    instrument(recorder.Recorder, '_write', 'disk')
+
+
+def _chrome_events(pid):
+    with _lock:
+        buffers = list(_buffers.items())
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': _process}}]
+    for tid, (thread_name, spans) in buffers:
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                       'args': {'name': thread_name}})
+        for name, category, start, duration in list(spans):
+            events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': start / 1000.0, 'dur': duration / 1000.0})
+    return events
+
+
+def save(path=None):
+    """Write the recorded spans, plus any part files from child processes"""
+    path = path or _path
+    if path is None:
+        return
+    events = _chrome_events(os.getpid())
+    if path == _path:
+        for part in glob.glob(glob.escape(path) + '.*.part'):
+            try:
+                with open(part) as f:
+                    events.extend(json.load(f)['traceEvents'])
+                os.remove(part)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not merge trace part {part}: {e}")
+    try:
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        if not path.endswith('.part'):
+            print(f"Trace with {len(events)} events written to {path}")
+    except OSError as e:
+        print(f"Could not write trace: {e}")
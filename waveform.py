@@ -0,0 +1,440 @@
+"""
+Waveform peak summaries and display shared by both players
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt, QLineF, QRectF, pyqtSignal
+from PyQt5.QtGui import QPainter, QPen, QColor, QImage
+
+from memory import PRIORITY_CACHE, shared_budget
+
+# Samples summarised by one min/max pair
+PEAK_BLOCK = 256
+
+# Pixel columns per cached waveform tile
+TILE_WIDTH = 256
+
+# Zoom applied per mouse wheel notch
+ZOOM_STEP = 1.25
+
+
+class IncrementalPeaks:
+    """Peak summary filled in block by block while a track is still decoding.
+
+    The array is allocated for the expected length up front, so a widget can
+    display it while the decoder thread keeps appending to it.
+    """
+
+    def __init__(self, total_samples, block=PEAK_BLOCK):
+        self.block = block
+        self.peaks = np.zeros(((total_samples + block - 1) // block, 2), dtype=np.float32)
+        self.filled = 0  # complete blocks summarised so far
+
+    def update(self, audio_data, decoded):
+        """Summarise the whole blocks among the first ``decoded`` samples"""
+        blocks = min(decoded // self.block, len(self.peaks))
+        if blocks > self.filled:
+            scale = 1.0 / 32768.0 if audio_data.dtype == np.int16 else 1.0
+            chunk = np.asarray(audio_data[self.filled * self.block:blocks * self.block])
+            chunk = chunk.reshape(-1, self.block)
+            self.peaks[self.filled:blocks, 0] = chunk.min(axis=1) * scale
+            self.peaks[self.filled:blocks, 1] = chunk.max(axis=1) * scale
+            self.filled = blocks
+        return self.filled
+
+    def finish(self, audio_data):
+        """Summary of the complete track, trimmed if it came out shorter than expected"""
+        n = len(audio_data)
+        count = (n + self.block - 1) // self.block
+        if count > len(self.peaks):
+            grown = np.zeros((count, 2), dtype=np.float32)
+            grown[:self.filled] = self.peaks[:self.filled]
+            self.peaks = grown
+        self.update(audio_data, n)
+        if count > self.filled:
+            scale = 1.0 / 32768.0 if audio_data.dtype == np.int16 else 1.0
+            tail = np.asarray(audio_data[self.filled * self.block:])
+            self.peaks[self.filled] = (tail.min() * scale, tail.max() * scale)
+            self.filled = count
+        return self.peaks[:count]
+
+
+def compute_peaks(audio_data, block=PEAK_BLOCK):
+    """Per-block (min, max) of ``audio_data`` as float32 in the -1..1 range"""
+    return IncrementalPeaks(len(audio_data), block).finish(audio_data)
+
+
+def reduce_peaks(peaks, factor):
+    """Merge every ``factor`` consecutive (min, max) pairs into one"""
+    full = len(peaks) // factor * factor
+    out = np.empty(((len(peaks) + factor - 1) // factor, 2), dtype=np.float32)
+    blocks = peaks[:full].reshape(-1, factor, 2)
+    out[:len(blocks), 0] = blocks[:, :, 0].min(axis=1)
+    out[:len(blocks), 1] = blocks[:, :, 1].max(axis=1)
+    if full < len(peaks):
+        out[-1] = (peaks[full:, 0].min(), peaks[full:, 1].max())
+    return out
+
+
+class WaveformWidget(QWidget):
+    """Zoomable waveform drawn from cached per-zoom-level image tiles.
+
+    The mouse wheel zooms around the cursor from the whole track down to one
+    sample per pixel; shift+wheel, a horizontal wheel or dragging scrolls.
+    Zoom levels are powers of two samples per pixel; tiles of TILE_WIDTH
+    columns are rendered once per level and scaled for the zoom in between,
+    and only tiles inside the viewport are drawn.
+
+    While a track is still decoding (begin_track/extend_track) the waveform
+    fills in from left to right; tiles are only cached once complete, and a
+    louder block arriving rescales the cached tiles at draw time instead of
+    re-rendering them.
+
+    A beat grid (set_beats) is drawn as markers, brighter on downbeats; a
+    click without dragging asks for a seek to that time.
+    """
+    view_changed = pyqtSignal(float, float)  # start, end in seconds
+    seek_requested = pyqtSignal(float)       # seconds
+
+    def __init__(self, parent=None, max_tiles=256):
+        super().__init__(parent)
+        self.peaks = None
+        self.audio_data = None
+        self.sample_rate = None
+        self.current_position = 0
+        self.duration = 0
+        self.total_samples = 0
+        # Viewport: first visible sample and samples per pixel
+        self.view_start = 0.0
+        self.samples_per_pixel = 1.0
+        self.max_tiles = max_tiles
+        self._levels = {}
+        self._tiles = OrderedDict()
+        self._tile_height = 0
+        self._scale = 1.0
+        self._max = 0.0
+        # Peak blocks summarised so far; all of them once the track is decoded
+        self._filled = 0
+        self._drag_x = None
+        self._press_x = None
+        # Beat and downbeat times in seconds, see beats.py
+        self.beats = None
+        self.downbeats = None
+        self._budget_key = ('waveform', id(self))
+        shared_budget().register(self._budget_key, 0, PRIORITY_CACHE, self.drop_tiles,
+                                 kind='tile caches')
+        self.setMinimumHeight(150)
+        self.setStyleSheet("background-color: #2b2b2b; border: 1px solid #555;")
+
+    def set_audio_data(self, audio_data, sample_rate, peaks=None):
+        """Show a decoded track; the samples are only referenced for sample-level zoom"""
+        if peaks is None and audio_data is not None:
+            peaks = compute_peaks(audio_data)
+        if self.peaks is not None and peaks is not None and len(peaks) <= len(self.peaks) \
+                and np.shares_memory(peaks, self.peaks):
+            # Same summary that was shown while decoding: keep view and tiles
+            self.audio_data = audio_data
+            self.total_samples = len(audio_data)
+            self.duration = len(audio_data) / sample_rate
+            self.extend_track(len(peaks))
+            self.peaks = peaks
+            self.set_view(self.view_start, self.samples_per_pixel)
+            return
+        self.begin_track(peaks, len(peaks), len(audio_data), sample_rate)
+        self.audio_data = audio_data
+
+    def begin_track(self, peaks, filled, total_samples, sample_rate):
+        """Show a track that is still decoding: ``peaks`` is sized for the
+        expected length and its first ``filled`` blocks are valid"""
+        self.peaks = peaks
+        self.audio_data = None
+        self.sample_rate = sample_rate
+        self.total_samples = total_samples
+        self.duration = total_samples / sample_rate
+        self._levels = {}
+        self.drop_tiles()
+        self._filled = 0
+        self._max = 0.0
+        self._scale = 1.0
+        self.beats = None
+        self.downbeats = None
+        self.extend_track(filled)
+        self.zoom_to_fit()
+
+    def extend_track(self, filled):
+        """More blocks of the summary are valid; only the new range is processed"""
+        old = self._filled
+        filled = min(filled, len(self.peaks))
+        if filled <= old:
+            return
+        new_max = float(np.max(np.abs(self.peaks[old:filled])))
+        if new_max > self._max:
+            self._max = new_max
+            self._scale = 1.0 / new_max
+        for level, peaks in self._levels.items():
+            if level == PEAK_BLOCK:
+                continue
+            ratio = level // PEAK_BLOCK
+            lo = old // ratio
+            hi = min(-(-filled // ratio), len(peaks))
+            peaks[lo:hi] = reduce_peaks(self.peaks[lo * ratio:hi * ratio], ratio)
+        self._filled = filled
+        self.update()
+
+    def release(self):
+        """Drop the summary and sample reference of a track that is no longer shown"""
+        self.peaks = None
+        self.audio_data = None
+        self.beats = None
+        self.downbeats = None
+        self._levels = {}
+        self.drop_tiles()
+        self._filled = 0
+        self.duration = 0
+        self.total_samples = 0
+        self.current_position = 0
+        self.view_start = 0.0
+        self.update()
+
+    def drop_tiles(self):
+        """Forget the rendered tiles; they are rendered again when next painted"""
+        self._tiles.clear()
+        shared_budget().update(self._budget_key, 0)
+
+    def set_beats(self, beats, downbeats):
+        """Beat and downbeat times (seconds, ascending) to mark on the waveform"""
+        self.beats = beats
+        self.downbeats = downbeats
+        self.update()
+
+    def set_position(self, position):
+        self.current_position = position
+        self.update()
+
+    # Viewport
+
+    def fit_samples_per_pixel(self):
+        return max(1.0, self.total_samples / max(1, self.width()))
+
+    def set_view(self, start_sample, samples_per_pixel):
+        """Clamp and apply a viewport, then tell listeners (e.g. the spectrogram)"""
+        spp = min(max(samples_per_pixel, 1.0), self.fit_samples_per_pixel())
+        span = spp * self.width()
+        start = min(max(start_sample, 0.0), max(0.0, self.total_samples - span))
+        self.samples_per_pixel = spp
+        self.view_start = start
+        if self.sample_rate:
+            self.view_changed.emit(start / self.sample_rate, (start + span) / self.sample_rate)
+        self.update()
+
+    def zoom_to_fit(self):
+        self.set_view(0.0, self.fit_samples_per_pixel())
+
+    def zoom(self, factor, anchor_x):
+        """Zoom by ``factor`` keeping the sample under ``anchor_x`` in place"""
+        anchor = self.view_start + anchor_x * self.samples_per_pixel
+        spp = self.samples_per_pixel / factor
+        spp = min(max(spp, 1.0), self.fit_samples_per_pixel())
+        self.set_view(anchor - anchor_x * spp, spp)
+
+    def scroll(self, pixels):
+        self.set_view(self.view_start + pixels * self.samples_per_pixel, self.samples_per_pixel)
+
+    def wheelEvent(self, event):
+        if self.peaks is None:
+            return
+        delta = event.angleDelta()
+        if delta.x() or event.modifiers() & Qt.ShiftModifier:
+            steps = (delta.x() or delta.y()) / 120.0
+            self.scroll(-steps * self.width() / 8)
+        else:
+            self.zoom(ZOOM_STEP ** (delta.y() / 120.0), event.pos().x())
+        event.accept()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_x = event.pos().x()
+            self._press_x = event.pos().x()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_x is not None:
+            self.scroll(self._drag_x - event.pos().x())
+            self._drag_x = event.pos().x()
+
+    def mouseReleaseEvent(self, event):
+        x = event.pos().x()
+        if self._press_x is not None and abs(x - self._press_x) < 3 and self.duration > 0:
+            seconds = (self.view_start + x * self.samples_per_pixel) / self.sample_rate
+            self.seek_requested.emit(min(max(seconds, 0.0), self.duration))
+        self._drag_x = None
+        self._press_x = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.zoom_to_fit()
+
+    def resizeEvent(self, event):
+        fitted = self.samples_per_pixel >= self.total_samples / max(1, event.oldSize().width())
+        if fitted:
+            self.zoom_to_fit()
+        else:
+            self.set_view(self.view_start, self.samples_per_pixel)
+        super().resizeEvent(event)
+
+    # Tiles
+
+    def level_for(self, samples_per_pixel):
+        """Power-of-two samples per pixel at or below the current zoom"""
+        level = 1 << int(np.floor(np.log2(max(samples_per_pixel, 1.0))))
+        if self.audio_data is None:
+            # No samples yet while decoding; stretch the finest peak level
+            level = max(level, PEAK_BLOCK)
+        return level
+
+    def level_peaks(self, level):
+        """(min, max) per column at ``level`` samples per pixel, for levels >= PEAK_BLOCK"""
+        peaks = self._levels.get(level)
+        if peaks is None:
+            if level == PEAK_BLOCK:
+                peaks = self.peaks
+            else:
+                peaks = reduce_peaks(self.level_peaks(level // 2), 2)
+            self._levels[level] = peaks
+        return peaks
+
+    def tile_columns(self, level, index):
+        """Column min/max for one tile, with the previous column prepended"""
+        first = index * TILE_WIDTH - 1
+        if level >= PEAK_BLOCK:
+            peaks = self.level_peaks(level)
+            ratio = level // PEAK_BLOCK
+            valid = -(-self._filled // ratio)
+            columns = peaks[max(first, 0):min(first + TILE_WIDTH + 1, valid)]
+            if first < 0:
+                columns = np.concatenate((columns[:1], columns))
+            return columns
+
+        # Below the peak block size the columns come straight from the samples
+        start = max(first, 0) * level
+        end = min((first + TILE_WIDTH + 1) * level, self.total_samples)
+        samples = np.asarray(self.audio_data[start:end], dtype=np.float32)
+        if self.audio_data.dtype == np.int16:
+            samples *= 1.0 / 32768.0
+        count = (len(samples) + level - 1) // level
+        padded = np.full(count * level, np.nan, dtype=np.float32)
+        padded[:len(samples)] = samples
+        blocks = padded.reshape(count, level)
+        columns = np.stack((np.nanmin(blocks, axis=1), np.nanmax(blocks, axis=1)), axis=1)
+        if first < 0:
+            columns = np.concatenate((columns[:1], columns))
+        return columns
+
+    def render_tile(self, level, index, height):
+        """Indexed image of one tile; each column also spans to its neighbour so
+        sparse zoom levels still draw a continuous line"""
+        columns = self.tile_columns(level, index) * self._scale
+        if len(columns) < 2:
+            return None
+        low = np.minimum(columns[1:, 0], columns[:-1, 1])
+        high = np.maximum(columns[1:, 1], columns[:-1, 0])
+
+        y_center = height // 2
+        half = height // 2 - 10
+        tops = (y_center - high * half).astype(np.int32)
+        bottoms = (y_center - low * half).astype(np.int32)
+        rows = np.arange(height, dtype=np.int32)[:, None]
+        pixels = ((rows >= tops) & (rows <= bottoms)).astype(np.uint8)
+
+        image = QImage(pixels.data, pixels.shape[1], height, pixels.strides[0], QImage.Format_Indexed8)
+        image.setColorTable([QColor(43, 43, 43).rgb(), QColor(0, 255, 127).rgb()])
+        return image.copy()  # detach from the numpy buffer
+
+    def tile_complete(self, level, index):
+        end_block = -(-(index + 1) * TILE_WIDTH * level // PEAK_BLOCK)
+        return self._filled >= min(end_block, len(self.peaks))
+
+    def tile_image(self, level, index):
+        """(image, scale it was rendered at) for one tile"""
+        height = self.height()
+        if height != self._tile_height:
+            self.drop_tiles()
+            self._tile_height = height
+        key = (level, index)
+        entry = self._tiles.get(key)
+        if entry is None:
+            entry = (self.render_tile(level, index, height), self._scale)
+            # The decoding frontier is re-rendered until its tile is complete
+            if self.tile_complete(level, index):
+                self._tiles[key] = entry
+                if len(self._tiles) > self.max_tiles:
+                    self._tiles.popitem(last=False)
+                shared_budget().update(self._budget_key, len(self._tiles) * TILE_WIDTH * height)
+        else:
+            self._tiles.move_to_end(key)
+        return entry
+
+    def visible_tiles(self, level):
+        tile_samples = TILE_WIDTH * level
+        last_sample = min(self.view_start + self.width() * self.samples_per_pixel, self.total_samples)
+        first = int(self.view_start // tile_samples)
+        last = int(max(last_sample - 1, 0) // tile_samples)
+        return range(first, last + 1)
+
+    def paintEvent(self, event):
+        if self.peaks is None or len(self.peaks) == 0:
+            return
+
+        painter = QPainter(self)
+
+        # Set up colors
+        background_color = QColor(43, 43, 43)  # Dark gray
+        position_color = QColor(255, 255, 0)   # Yellow
+
+        # Fill background
+        painter.fillRect(self.rect(), background_color)
+
+        # Calculate dimensions
+        height = self.height()
+        spp = self.samples_per_pixel
+
+        # Draw the visible tiles of the nearest finer level, scaled to the zoom
+        level = self.level_for(spp)
+        tile_width = TILE_WIDTH * level / spp
+        for index in self.visible_tiles(level):
+            image, scale = self.tile_image(level, index)
+            if image is None:
+                continue
+            x0 = (index * TILE_WIDTH * level - self.view_start) / spp
+            # Tiles rendered before a louder block arrived are shrunk to match
+            tile_height = height * self._scale / scale
+            painter.drawImage(QRectF(x0, (height - tile_height) / 2, image.width() * tile_width / TILE_WIDTH,
+                                     tile_height), image, QRectF(0, 0, image.width(), image.height()))
+
+        self.draw_beats(painter, height)
+
+        # Draw position indicator
+        if self.duration > 0:
+            position_x = int((self.current_position * self.sample_rate - self.view_start) / spp)
+            painter.setPen(QPen(position_color, 2))
+            painter.drawLine(position_x, 0, position_x, height)
+
+    def draw_beats(self, painter, height, min_spacing=6):
+        """Beat markers inside the viewport, left out where they would crowd together"""
+        if self.beats is None or len(self.beats) < 2 or not self.sample_rate:
+            return
+        spp = self.samples_per_pixel
+        start = self.view_start / self.sample_rate
+        end = (self.view_start + self.width() * spp) / self.sample_rate
+        for times, color in ((self.beats, QColor(255, 255, 255, 50)),
+                             (self.downbeats, QColor(255, 140, 0, 170))):
+            if times is None or len(times) < 2:
+                continue
+            spacing = (times[-1] - times[0]) / (len(times) - 1) * self.sample_rate / spp
+            if spacing < min_spacing:
+                continue
+            lo, hi = np.searchsorted(times, (start, end))
+            xs = (times[lo:hi] * self.sample_rate - self.view_start) / spp
+            painter.setPen(QPen(color, 1))
+            painter.drawLines([QLineF(x, 0, x, height) for x in xs.tolist()])